@@ -0,0 +1,233 @@
+import hashlib
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalise_question(question):
+    """Lowercase, drop punctuation and collapse whitespace so trivial rewordings share a key"""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+class _CacheEntry:
+    __slots__ = ('key', 'context_key', 'vector', 'answer', 'created', 'size')
+
+    def __init__(self, key, context_key, vector, answer, created):
+        self.key = key                  # (index version, digest)
+        self.context_key = context_key  # (index version, context document ids)
+        self.vector = vector
+        self.answer = answer
+        self.created = created
+        # Rough footprint: strings plus the sparse vector's data/indices arrays
+        nnz = vector.nnz if vector is not None else 0
+        self.size = len(key[1]) + len(context_key[1]) + len(answer.encode('utf-8')) + nnz * 12 + 200
+
+
+class AnswerCache:
+    """LRU/TTL cache of generated answers with near-duplicate matching.
+
+    Entries are keyed on the normalised question plus the ids of the retrieved
+    context documents. A question that misses the exact key can still hit an
+    entry retrieved with the same context if the cosine similarity of their
+    (L2-normalised) TF-IDF query vectors reaches ``similarity_threshold``.
+
+    Entries are also keyed on the search index version the answer was
+    generated from, passed by the caller with each lookup, so requests still
+    running on an old index snapshot during a reload neither see nor clobber
+    the new version's answers. ``set_index_version`` is called when a new
+    index is installed; it only moves forward, and entries of versions older
+    than the previous one are pruned then.
+
+    With ``db_path`` set, exact-key entries are also written to SQLite so they
+    survive restarts and are shared between worker processes; near-duplicate
+    matching is in-memory only. Writes and pruning go through a background
+    writer thread, so ``put`` and ``set_index_version`` never wait on disk.
+    ``get`` reads SQLite after a memory miss, so callers on an event loop
+    should run it in an executor when ``persistent`` is true.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl=24 * 3600,
+                 similarity_threshold=0.9, db_path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.index_version = None
+        self.previous_version = None
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._by_context = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._writes = None
+        self._writer = None
+        if db_path:
+            self._connect()
+
+    @property
+    def persistent(self):
+        return self._db is not None
+
+    def _open(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")  # readers in other workers do not wait for the writer
+        return db
+
+    def _connect(self):
+        self._db = self._open()
+        self._db.execute("DROP TABLE IF EXISTS answers")  # keyed on the question alone, before versioned keys
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cached_answers ("
+            "key TEXT, index_version TEXT, answer TEXT, created REAL, PRIMARY KEY (key, index_version))"
+        )
+        self._db.commit()
+        self._writes = queue.Queue()
+        self._writer = None  # started on the first write
+
+    def after_fork(self):
+        """Give a forked worker its own SQLite connection and writer thread (neither survives fork)"""
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        if self.db_path:
+            self._connect()
+
+    def _write(self, sql, params):
+        """Run a statement on the writer thread"""
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, args=(self._writes,),
+                                            name='answer-cache-writer', daemon=True)
+            self._writer.start()
+        self._writes.put((sql, params))
+
+    def _write_loop(self, writes):
+        db = self._open()
+        while True:
+            sql, params = writes.get()
+            try:
+                db.execute(sql, params)
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Answer cache write failed: {e}")
+            finally:
+                writes.task_done()
+
+    def flush(self):
+        """Wait until queued SQLite writes are done"""
+        if self._writer is not None:
+            self._writes.join()
+
+    @staticmethod
+    def make_key(question, context_ids):
+        context_key = ",".join(str(i) for i in context_ids)
+        digest = hashlib.sha1(f"{normalise_question(question)}\0{context_key}".encode('utf-8')).hexdigest()
+        return digest, context_key
+
+    def set_index_version(self, index_version):
+        """Record a newly installed index version and prune entries of versions before the previous one"""
+        with self._lock:
+            if index_version == self.index_version:
+                return
+            self.previous_version, self.index_version = self.index_version, index_version
+            keep = {self.index_version, self.previous_version}
+            for key in [key for key in self._entries if key[0] not in keep]:
+                self._remove(key)
+        if self._db is not None:
+            self._write("DELETE FROM cached_answers WHERE index_version NOT IN (?, ?)",
+                        (str(index_version), str(self.previous_version)))
+
+    def get(self, question, context_ids, query_vector=None, index_version=None):
+        """Return an answer cached for this index version (default: the current one) or None"""
+        if index_version is None:
+            index_version = self.index_version
+        digest, context_ids_key = self.make_key(question, context_ids)
+        key, context_key = (index_version, digest), (index_version, context_ids_key)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.answer
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT answer, created FROM cached_answers WHERE key = ? AND index_version = ?",
+                    (digest, str(index_version))
+                ).fetchone()
+            if row is not None and now - row[1] <= self.ttl:
+                with self._lock:
+                    self._insert(_CacheEntry(key, context_key, query_vector, row[0], row[1]))
+                    self.hits += 1
+                return row[0]
+
+        with self._lock:
+            if query_vector is not None:
+                for candidate_key in self._by_context.get(context_key, ()):
+                    candidate = self._entries[candidate_key]
+                    if candidate.vector is None or now - candidate.created > self.ttl:
+                        continue
+                    similarity = candidate.vector.multiply(query_vector).sum()
+                    if similarity >= self.similarity_threshold:
+                        self._entries.move_to_end(candidate_key)
+                        self.near_hits += 1
+                        return candidate.answer
+
+            self.misses += 1
+            return None
+
+    def put(self, question, context_ids, answer, query_vector=None, index_version=None):
+        """Store an answer for a question, its retrieved context and the index version it came from"""
+        if index_version is None:
+            index_version = self.index_version
+        digest, context_ids_key = self.make_key(question, context_ids)
+        now = time.time()
+        with self._lock:
+            self._insert(_CacheEntry((index_version, digest), (index_version, context_ids_key), query_vector, answer, now))
+        if self._db is not None:
+            self._write(
+                "INSERT OR REPLACE INTO cached_answers (key, index_version, answer, created) VALUES (?, ?, ?, ?)",
+                (digest, str(index_version), answer, now)
+            )
+
+    def _insert(self, entry):
+        if entry.key in self._entries:
+            self._remove(entry.key)
+        self._entries[entry.key] = entry
+        self._by_context.setdefault(entry.context_key, set()).add(entry.key)
+        self._bytes += entry.size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        keys = self._by_context.get(entry.context_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_context[entry.context_key]
+
+    def stats(self):
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'index_version': self.index_version,
+            'persistent': self._db is not None,
+        }
@@ -1,18 +1,111 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-import base64
+from typing import Callable, List, Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import asyncio
+import contextvars
 import json
 import os
+import re
+import time
 from data_processor import TDSDataProcessor
+import index_store
+from answer_cache import AnswerCache
+from context_builder import format_context, format_documents
+import image_pipeline
+from image_pipeline import ImageDescriptionCache, ImageTooLarge, PreparedImage
+import metrics
+from metrics import stage
+import upstream
+from upstream import CircuitOpen, Upstream
+from faq import FAQEntry, FAQStore
 import uvicorn
-from PIL import Image
-import io
 import google.generativeai as genai
-from openai import OpenAI
+from openai import AsyncOpenAI
 from fastapi.middleware.cors import CORSMiddleware
 
 
+# Upstream (OpenAI / Gemini) call limits, tunable via environment (see upstream.py)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "20"))  # per attempt; also the HTTP read timeout
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))
+VISION_TIMEOUT = float(os.getenv("VISION_TIMEOUT", "15"))
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "8"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))  # for timeouts, connection errors, 429 and 5xx
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "30"))  # seconds after which no retry starts
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))  # consecutive failures that open a provider's circuit
+CIRCUIT_RESET = float(os.getenv("CIRCUIT_RESET", "30"))  # seconds before a trial call is let through
+# Gemini as a second LLM: LLM_FAILOVER=1 answers with it when OpenAI fails, LLM_HEDGE=1 also
+# when OpenAI has not answered within its recent HEDGE_QUANTILE latency (HEDGE_DELAY until known)
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_FAILOVER = LLM_HEDGE or os.getenv("LLM_FAILOVER", "0") == "1"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "2"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
+
+# Search index location and hot-reload settings
+DATA_FILE = os.getenv("DATA_FILE", "data/processed_data.json")
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "30"))  # seconds, 0 disables the watcher
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # required for /admin/* endpoints
+
+# Retrieval backend used when a request does not pick one: tfidf, bm25, dense or hybrid
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "tfidf")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")  # sentence-transformers model; LSA over TF-IDF if unset
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "150"))  # retrieved-passage tokens per prompt
+
+# Curated answers to frequent questions, served before retrieval (see faq.py); reloaded with the index
+FAQ_FILE = os.getenv("FAQ_FILE", "data/faq.json")
+FAQ_SIMILARITY = float(os.getenv("FAQ_SIMILARITY", "0.75"))  # TF-IDF cosine to an FAQ question for a match
+FAQ_PATTERN_SIMILARITY = float(os.getenv("FAQ_PATTERN_SIMILARITY", "0.3"))  # enough when an entry's pattern matches
+
+# Answer cache in front of the LLM; set ANSWER_CACHE_DB to persist hits across restarts
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600))),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.9")),
+    db_path=os.getenv("ANSWER_CACHE_DB"),
+)
+
+# Uploaded images: payload limit, downscaling before upload, and a description
+# cache keyed on a perceptual hash so repeated screenshots skip the vision call
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))  # decoded size; larger uploads get 413
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1568"))  # pixels on the long side
+image_cache = ImageDescriptionCache(
+    max_entries=int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "256")),
+    max_distance=int(os.getenv("IMAGE_HASH_DISTANCE", "8")),  # dHash bits (of 256) for a candidate match
+    max_pixel_delta=int(os.getenv("IMAGE_PIXEL_DELTA", "12")),  # grey levels per 64x64 thumbnail pixel
+)
+
+# Metrics for GET /metrics (see metrics.py for request and stage timings)
+PROFILE_REQUESTS = int(os.getenv("PROFILE_REQUESTS", "0"))  # sample stacks for the first N requests after startup
+answers_total = metrics.Counter('tds_answers_total', "Answers by source: faq, llm, cache or fallback", ['source'])
+faq_lookups = metrics.Counter('tds_faq_lookups_total', "FAQ fast-path lookups by result: hit or miss", ['result'])
+fallback_answers = metrics.Counter('tds_fallback_answers_total', "Rule-based fallback answers by cause", ['reason'])
+
+# OpenAI answers use the async client; the Gemini SDK and OCR calls are
+# blocking, so they run on a bounded thread pool instead of the event loop.
+# The semaphore caps how many upstream calls are in flight so a slow
+# upstream cannot pile up unbounded work.
+upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_CONCURRENCY, thread_name_prefix="upstream")
+upstream_semaphore = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+
+def make_upstream(name: str, timeout: float, breaker: upstream.CircuitBreaker, retries: Optional[int] = None) -> Upstream:
+    return Upstream(name, upstream_executor, upstream_semaphore, timeout,
+                    retries=UPSTREAM_RETRIES if retries is None else retries,
+                    deadline=UPSTREAM_DEADLINE, breaker=breaker)
+
+def in_executor(func, *args):
+    """Run blocking work on the default executor, carrying the request context (its metrics trace)"""
+    return asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, func, *args)
+
+async def cached_answer(question: str, context_ids: List, query_vector, index_version: Optional[str]) -> Optional[str]:
+    """Answer cache lookup; run in the executor when a memory miss may read SQLite"""
+    if answer_cache.persistent:
+        return await in_executor(answer_cache.get, question, context_ids, query_vector, index_version)
+    return answer_cache.get(question, context_ids, query_vector, index_version)
+
 
 app = FastAPI(title="TDS Virtual TA", version="1.0.0")
 app.add_middleware(
@@ -22,21 +115,173 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-# Initialize data processor
-processor = TDSDataProcessor()
+app.add_middleware(metrics.MetricsMiddleware)
+# Initialize data processor. Request handlers read this global once and keep
+# using that snapshot, so a reload only has to rebind the name.
+processor = TDSDataProcessor(RETRIEVAL_BACKEND, EMBEDDING_MODEL)
+index_state = {
+    'loaded_at': None,
+    'reload_seconds': None,
+    'reloads': 0,
+    'last_error': None,
+    'signature': None,
+}
+reload_lock = asyncio.Lock()
+# Set by serve.py in prefork workers: reloads are then done by the master,
+# which swaps in a new generation of workers sharing the new index
+reload_hook: Optional[Callable[[], None]] = None
+# Set by serve.py in prefork workers: asks the master to have every worker reload its FAQ store
+faq_reload_hook: Optional[Callable[[], None]] = None
+faq_store = FAQStore([], path=FAQ_FILE)
+faq_signature = None  # modification time of FAQ_FILE when faq_store was loaded from it
+
+metrics.Gauge('tds_faq_entries', "Entries in the FAQ store").set_function(lambda: len(faq_store))
+metrics.Gauge('tds_index_documents', "Live documents in the search index").set_function(
+    lambda: processor.engine.live_count if processor.engine is not None else 0
+)
+metrics.Gauge('tds_index_load_seconds', "Duration of the last index load").set_function(
+    lambda: index_state['reload_seconds']
+)
+metrics.Gauge('tds_index_loaded_timestamp_seconds', "Unix time of the last index load").set_function(
+    lambda: index_state['loaded_at']
+)
+# Workers forked by serve.py inherit the master's count, so it is not summed across them
+metrics.Counter('tds_index_reloads_total', "Index loads, including the first", aggregate='max').set_function(
+    lambda: index_state['reloads']
+)
+cache_lookups = metrics.Counter('tds_answer_cache_lookups_total', "Answer cache lookups by result", ['result'])
+for result in ('hits', 'near_hits', 'misses'):
+    cache_lookups.labels(result).set_function(lambda result=result: answer_cache.stats()[result])
+metrics.Gauge('tds_answer_cache_entries', "Answers in the cache").set_function(lambda: answer_cache.stats()['entries'])
+image_cache_lookups = metrics.Counter('tds_image_cache_lookups_total', "Image description cache lookups by result", ['result'])
+image_cache_lookups.labels('hits').set_function(lambda: image_cache.hits)
+image_cache_lookups.labels('misses').set_function(lambda: image_cache.misses)
+
+def file_signature(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def index_signature():
+    """Modification times of the data file and its index manifest; a change means a reload is due"""
+    return (file_signature(DATA_FILE), file_signature(os.path.join(index_store.index_dir_for(DATA_FILE), index_store.MANIFEST)))
+
+def load_processor() -> TDSDataProcessor:
+    """Build a fresh processor from DATA_FILE (memory-mapped index, rebuilt if stale)"""
+    new_processor = TDSDataProcessor(RETRIEVAL_BACKEND, EMBEDDING_MODEL)
+    new_processor.load_processed_data(DATA_FILE)
+    return new_processor
+
+def load_faq() -> FAQStore:
+    """Replace the FAQ store with FAQ_FILE; raises (keeping the current store) if the file is invalid"""
+    global faq_store, faq_signature
+    signature = file_signature(FAQ_FILE)
+    faq_store = FAQStore.load(FAQ_FILE, similarity=FAQ_SIMILARITY, pattern_similarity=FAQ_PATTERN_SIMILARITY)
+    faq_signature = signature
+    return faq_store
+
+def try_load_faq():
+    try:
+        load_faq()
+    except Exception as e:
+        print(f"⚠️ Error loading FAQ entries from {FAQ_FILE}: {e}")
+
+def install_processor(new_processor: TDSDataProcessor, signature, seconds: float) -> TDSDataProcessor:
+    global processor
+    processor = new_processor  # in-flight requests keep their old snapshot
+    answer_cache.set_index_version(new_processor.index_version)
+    index_state.update(
+        loaded_at=time.time(),
+        reload_seconds=round(seconds, 4),
+        reloads=index_state['reloads'] + 1,
+        last_error=None,
+        signature=signature,
+    )
+    return processor
+
+def preload_index() -> TDSDataProcessor:
+    """Load the index before the server starts; startup then skips its own load.
+
+    serve.py calls this once in the master process so forked workers share
+    the loaded index instead of each loading a copy.
+    """
+    start = time.perf_counter()
+    signature = index_signature()
+    try_load_faq()
+    try:
+        new_processor = load_processor()
+    except Exception as e:
+        index_state['last_error'] = str(e)
+        raise
+    return install_processor(new_processor, signature, time.perf_counter() - start)
+
+async def reload_index():
+    """Load a new index in the background and swap it in with a single assignment"""
+    async with reload_lock:
+        start = time.perf_counter()
+        signature = index_signature()
+        try_load_faq()
+        try:
+            new_processor = await asyncio.get_running_loop().run_in_executor(None, load_processor)
+        except Exception as e:
+            index_state['last_error'] = str(e)
+            raise
+        return install_processor(new_processor, signature, time.perf_counter() - start)
+
+async def watch_index():
+    """Poll the data file and index manifest, reloading the index when either changes"""
+    while True:
+        await asyncio.sleep(INDEX_WATCH_INTERVAL)
+        if index_signature() != index_state['signature']:
+            try:
+                await reload_index()
+                print(f"✅ Reloaded search index (version {processor.index_version})")
+            except Exception as e:
+                print(f"⚠️ Error reloading index: {e}")
+
+async def watch_faq():
+    """Poll FAQ_FILE, reloading only the FAQ store when it changes; an invalid file keeps the current entries"""
+    global faq_signature
+    while True:
+        await asyncio.sleep(INDEX_WATCH_INTERVAL)
+        signature = file_signature(FAQ_FILE)
+        if signature != faq_signature:
+            try:
+                load_faq()
+                print(f"✅ Reloaded {len(faq_store)} FAQ entries")
+            except Exception as e:
+                print(f"⚠️ Error reloading FAQ entries from {FAQ_FILE}: {e}")
+                faq_signature = signature  # not retried until the file changes again
 
 # Load processed data on startup
 @app.on_event("startup")
 async def startup_event():
-    try:
-        processor.load_processed_data('data/processed_data.json')
-        print("✅ Loaded processed data and search index")
-    except Exception as e:
-        print(f"⚠️ Error loading data: {e}")
+    if index_state['loaded_at'] is None:  # not preloaded
+        try:
+            await reload_index()
+            print("✅ Loaded processed data and search index")
+        except Exception as e:
+            print(f"⚠️ Error loading data: {e}")
+    if INDEX_WATCH_INTERVAL > 0:
+        # Under serve.py the master watches the index, while every worker reloads its own FAQ store
+        if reload_hook is None:
+            asyncio.get_running_loop().create_task(watch_index())
+        asyncio.get_running_loop().create_task(watch_faq())
+    if PROFILE_REQUESTS > 0:
+        metrics.profiler.start(PROFILE_REQUESTS)
+
+class SearchFilters(BaseModel):
+    types: Optional[List[Literal['course', 'discourse']]] = None
+    sections: Optional[List[str]] = None  # course sections
+    date_from: Optional[date] = None  # inclusive; documents without a date are excluded
+    date_to: Optional[date] = None  # inclusive
 
 class QuestionRequest(BaseModel):
     question: str
     image: Optional[str] = None  # base64 encoded image
+    retrieval: Optional[Literal['tfidf', 'bm25', 'dense', 'hybrid']] = None  # default: RETRIEVAL_BACKEND
+    filters: Optional[SearchFilters] = None  # only search documents matching all of these
 
 class LinkResponse(BaseModel):
     url: str
@@ -46,80 +291,264 @@ class AnswerResponse(BaseModel):
     answer: str
     links: List[LinkResponse]
 
+class BatchAnswerResponse(AnswerResponse):
+    error: Optional[str] = None  # set when this item failed; the rest of the batch is unaffected
+
+def answer_events(answer: str, **extra):
+    """A ready answer as stream events: word-sized "token" events, then "done" carrying ``extra``"""
+    for piece in re.findall(r"\S+\s*", answer):
+        yield "token", {"text": piece}
+    yield "done", dict(answer=answer, **extra)
+
 class TDSVirtualTA:
+    CHAT_PARAMS = {"model": "gpt-3.5-turbo", "max_tokens": 300, "temperature": 0.7}
+    
+    GEMINI_TEXT_MODEL = "gemini-pro"
+    
     def __init__(self):
         # Initialize AI models (use environment variables for API keys)
-        self.openai_client = None
+        self.async_openai_client = None
         self.gemini_model = None
+        self.gemini_text_model = None  # second LLM for failover and hedging
         
         if os.getenv("OPENAI_API_KEY"):
-            self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            # One connection pool per process; the SDK's own retries are off, Upstream.call retries
+            timeout = upstream.timeouts(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_TIMEOUT)
+            self.async_openai_client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"), timeout=timeout, max_retries=0,
+                http_client=upstream.async_http_client(timeout, UPSTREAM_CONCURRENCY),
+            )
         
         if os.getenv("GEMINI_API_KEY"):
-            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            if os.getenv("GEMINI_BASE_URL"):  # e.g. a local fake server (benchmarks/fake_upstreams.py)
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport="rest",
+                                client_options={"api_endpoint": os.getenv("GEMINI_BASE_URL")})
+            else:
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
             self.gemini_model = genai.GenerativeModel('gemini-pro-vision')
+            if LLM_FAILOVER:
+                self.gemini_text_model = genai.GenerativeModel(self.GEMINI_TEXT_MODEL)
+        
+        # Gemini text and vision share a circuit breaker: both fail when the provider does
+        openai_breaker = upstream.CircuitBreaker("openai", CIRCUIT_FAILURES, CIRCUIT_RESET)
+        gemini_breaker = upstream.CircuitBreaker("gemini", CIRCUIT_FAILURES, CIRCUIT_RESET)
+        self.openai = make_upstream("openai", UPSTREAM_TIMEOUT, openai_breaker)
+        self.openai_stream = make_upstream("openai_stream", UPSTREAM_TIMEOUT, openai_breaker)
+        self.gemini_text = make_upstream("gemini_text", UPSTREAM_TIMEOUT, gemini_breaker)
+        self.vision = make_upstream("gemini", VISION_TIMEOUT, gemini_breaker)
+        self.ocr = make_upstream("ocr", VISION_TIMEOUT, upstream.CircuitBreaker("ocr", CIRCUIT_FAILURES, CIRCUIT_RESET), retries=0)
+    
+    def prepare_image(self, base64_image: str) -> PreparedImage:
+        """Decode, size-check and downscale an uploaded image (CPU-bound)"""
+        return image_pipeline.prepare_image(base64_image, IMAGE_MAX_BYTES, IMAGE_MAX_SIDE)
+    
+    def describe_image(self, prepared: PreparedImage) -> str:
+        """Describe a prepared image with Gemini Vision, or with local OCR when no key is configured"""
+        if self.gemini_model:
+            response = self.gemini_model.generate_content([
+                "Describe what you see in this image. Focus on any text, code, error messages, or technical content that might be relevant to a data science course question.",
+                prepared.blob()
+            ])
+            return response.text
+        text = image_pipeline.ocr_text(prepared)
+        return f"Text in the image (OCR): {text}" if text else "No text found in the image (OCR)"
     
-    def process_image(self, base64_image: str) -> str:
-        """Process image using Gemini Vision or OCR"""
+    def can_describe_images(self) -> bool:
+        return self.gemini_model is not None or image_pipeline.ocr_available()
+    
+    async def aprocess_image(self, base64_image: str) -> str:
+        """Process image without blocking the event loop.
+
+        Decoding and downscaling run on the default executor; only a cache
+        miss takes an upstream slot for the vision call (or OCR), with the
+        retries and circuit breaker of upstream.Upstream.
+        """
+        if not self.can_describe_images():
+            return "Image processing not available (no API key configured)"
         try:
-            if self.gemini_model:
-                # Decode base64 image
-                image_data = base64.b64decode(base64_image)
-                image = Image.open(io.BytesIO(image_data))
-                
-                response = self.gemini_model.generate_content([
-                    "Describe what you see in this image. Focus on any text, code, error messages, or technical content that might be relevant to a data science course question.",
-                    image
-                ])
-                return response.text
-            else:
-                return "Image processing not available (no API key configured)"
+            with stage("image_prepare"):
+                prepared = await in_executor(self.prepare_image, base64_image)
+        except Exception as e:
+            return f"Error processing image: {str(e)}"
+        description = image_cache.get(prepared)
+        if description is not None:
+            return description
+        try:
+            with stage("image_describe"):
+                description = await (self.vision if self.gemini_model else self.ocr).call(self.describe_image, prepared)
+        except asyncio.TimeoutError:
+            return "Error processing image: vision request timed out"
         except Exception as e:
             return f"Error processing image: {str(e)}"
+        image_cache.put(prepared, description)
+        return description
     
-    def generate_answer(self, question: str, context: List[dict], image_description: str = "") -> str:
-        """Generate answer using OpenAI or fallback logic"""
-        
-        # Prepare context
-        context_text = "\n\n".join([
-            f"Source: {item.get('source', 'Unknown')}\n{item['content'][:500]}..."
-            for item in context[:3]
-        ])
+    def build_messages(self, question: str, context: List[dict], image_description: str = "", context_text: Optional[str] = None) -> List[dict]:
+        """Chat messages for a question.
+
+        context_text is the assembled prompt context (TDSDataProcessor.build_context);
+        without it whole documents are used, up to CONTEXT_TOKEN_BUDGET tokens.
+        """
+        if context_text is None:
+            context_text = format_context(format_documents(context, CONTEXT_TOKEN_BUDGET)[0])
         
         image_context = f"\n\nImage description: {image_description}" if image_description else ""
         
-        if self.openai_client:
-            try:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": """You are a helpful Teaching Assistant for the Tools in Data Science course at IIT Madras. 
-                            Answer student questions based on the provided context from course materials and forum discussions.
-                            Be concise, accurate, and helpful. If you're not sure about something, say so.
-                            Focus on practical guidance and direct answers."""
-                        },
-                        {
-                            "role": "user",
-                            "content": f"Question: {question}\n\nContext:\n{context_text}{image_context}\n\nPlease provide a helpful answer."
-                        }
-                    ],
-                    max_tokens=300,
-                    temperature=0.7
-                )
-                return response.choices[0].message.content
-            except Exception as e:
-                print(f"OpenAI API error: {e}")
+        return [
+            {
+                "role": "system",
+                "content": """You are a helpful Teaching Assistant for the Tools in Data Science course at IIT Madras. 
+                        Answer student questions based on the provided context from course materials and forum discussions.
+                        Be concise, accurate, and helpful. If you're not sure about something, say so.
+                        Focus on practical guidance and direct answers."""
+            },
+            {
+                "role": "user",
+                "content": f"Question: {question}\n\nContext:\n{context_text}{image_context}\n\nPlease provide a helpful answer."
+            }
+        ]
+    
+    async def aopenai_complete(self, messages: List[dict]) -> str:
+        # Async, so a timed-out or out-hedged call closes its connection instead of holding a thread
+        response = await self.async_openai_client.chat.completions.create(messages=messages, **self.CHAT_PARAMS)
+        return response.choices[0].message.content
+    
+    def gemini_complete(self, messages: List[dict]) -> str:
+        """The same prompt answered by Gemini, whose API takes a single text"""
+        response = self.gemini_text_model.generate_content(
+            "\n\n".join(" ".join(message["content"].split()) if message["role"] == "system" else message["content"]
+                         for message in messages),
+            generation_config={"max_output_tokens": self.CHAT_PARAMS["max_tokens"],
+                               "temperature": self.CHAT_PARAMS["temperature"]},
+        )
+        return response.text
+    
+    async def acomplete(self, messages: List[dict]) -> str:
+        """LLM answer from OpenAI, or from Gemini when failover or hedging is on and it answers first.
+
+        Raises CircuitOpen, asyncio.TimeoutError or the upstream error when no provider answered.
+        """
+        primary = ("openai", lambda: self.openai.call(self.aopenai_complete, messages))
+        if self.gemini_text_model is None:
+            return await primary[1]()
+        delay = self.openai.hedge_delay(HEDGE_QUANTILE, HEDGE_DELAY) if LLM_HEDGE else None
+        _, answer = await upstream.hedged(
+            primary, ("gemini_text", lambda: self.gemini_text.call(self.gemini_complete, messages)), delay
+        )
+        return answer
+    
+    async def agenerate_answer(self, question: str, context: List[dict], image_description: str = "", query_vector=None, index_version=None, context_text: Optional[str] = None) -> str:
+        """Generate answer without blocking the event loop, using the answer cache and falling back on failure"""
+        if not self.async_openai_client:
+            return self.fallback_answer("no_api_key", question, context, image_description)
+        
+        # Only plain LLM answers are cached; image-dependent ones and fallbacks are not
+        cacheable = not image_description
+        context_ids = [item.get('doc_id') for item in context]
+        index_version = index_version or processor.index_version
+        if cacheable:
+            cached = await cached_answer(question, context_ids, query_vector, index_version)
+            if cached is not None:
+                answers_total.labels("cache").inc()
+                return cached
         
-        # Fallback logic-based answer
+        try:
+            answer = await self.acomplete(self.build_messages(question, context, image_description, context_text))
+        except CircuitOpen:
+            return self.fallback_answer("circuit_open", question, context, image_description)
+        except Exception as e:
+            print(f"LLM API error: {e!r}")
+            reason = "timeout" if upstream.is_timeout(e) else "error"
+            return self.fallback_answer(reason, question, context, image_description)
+        if answer is None:
+            return self.fallback_answer("error", question, context, image_description)
+        answers_total.labels("llm").inc()
+        if cacheable:
+            answer_cache.put(question, context_ids, answer, query_vector, index_version)
+        return answer
+    
+    def fallback_answer(self, reason: str, question: str, context: List[dict], image_description: str = "") -> str:
+        """generate_fallback_answer, counted by why the LLM was not used"""
+        answers_total.labels("fallback").inc()
+        fallback_answers.labels(reason).inc()
         return self.generate_fallback_answer(question, context, image_description)
     
+    async def astream_llm_answer(self, messages: List[dict]):
+        """Yield answer text deltas from the OpenAI streaming API.
+
+        Run it through ``self.openai_stream.stream``: UPSTREAM_TIMEOUT then
+        bounds the wait for the response and for each chunk, so a stalled
+        stream fails instead of hanging the client.
+        """
+        stream = await self.async_openai_client.chat.completions.create(messages=messages, stream=True, **self.CHAT_PARAMS)
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.response.aclose()
+    
+    async def astream_answer(self, question: str, context: List[dict], image_description: str = "", query_vector=None, index_version=None, context_text: Optional[str] = None):
+        """Streaming counterpart of agenerate_answer, yielding (event, data) pairs.
+
+        Emits "token" events with answer text and ends with a "done" event
+        carrying the whole answer. If the upstream fails before finishing,
+        the fallback answer is streamed instead, preceded by a "reset" event
+        when some LLM tokens were already sent, or at once while the OpenAI
+        circuit breaker is open. Cache hits and fallback answers are sent as
+        word-sized tokens.
+        """
+        if not self.async_openai_client:
+            for event in answer_events(self.fallback_answer("no_api_key", question, context, image_description), fallback=True):
+                yield event
+            return
+        
+        cacheable = not image_description
+        context_ids = [item.get('doc_id') for item in context]
+        index_version = index_version or processor.index_version
+        if cacheable:
+            cached = await cached_answer(question, context_ids, query_vector, index_version)
+            if cached is not None:
+                answers_total.labels("cache").inc()
+                for event in answer_events(cached, cached=True):
+                    yield event
+                return
+        
+        parts = []
+        failure = None
+        start = time.perf_counter()
+        messages = self.build_messages(question, context, image_description, context_text)
+        try:
+            async for delta in self.openai_stream.stream(self.astream_llm_answer, messages):
+                if not parts:
+                    metrics.stage_seconds.labels("first_token").observe(time.perf_counter() - start)
+                parts.append(delta)
+                yield "token", {"text": delta}
+        except CircuitOpen:
+            failure = "circuit_open"
+        except Exception as e:  # includes asyncio.TimeoutError
+            print(f"OpenAI streaming error: {e!r}")
+            failure = "stream_error"
+        
+        if failure is not None or not parts:
+            if parts:
+                yield "reset", {"reason": "upstream failed mid-stream"}
+            for event in answer_events(self.fallback_answer(failure or "stream_error", question, context, image_description), fallback=True):
+                yield event
+            return
+        
+        answers_total.labels("llm").inc()
+        answer = "".join(parts)
+        if cacheable:
+            answer_cache.put(question, context_ids, answer, query_vector, index_version)
+        yield "done", {"answer": answer}
+    
     def generate_fallback_answer(self, question: str, context: List[dict], image_description: str = "") -> str:
         """Generate answer using rule-based logic"""
         question_lower = question.lower()
         
-        # Common question patterns
+        # Common question patterns (curated answers live in the FAQ store, see faq.py; this one
+        # is kept here too, so it is still answered if FAQ_FILE is missing or invalid)
         if "gpt" in question_lower and ("4o" in question_lower or "3.5" in question_lower):
             return "You must use `gpt-3.5-turbo-0125`, even if the AI Proxy only supports `gpt-4o-mini`. Use the OpenAI API directly for this question."
         
@@ -139,42 +568,284 @@ class TDSVirtualTA:
 
 virtual_ta = TDSVirtualTA()
 
+def build_links(search_results: List[dict]) -> List[LinkResponse]:
+    """Build response links from the top search results"""
+    links = []
+    for result in search_results[:3]:  # Top 3 results
+        if result['type'] == 'discourse' and result.get('url'):
+            links.append(LinkResponse(
+                url=result['url'],
+                text=result.get('title', result['content'][:100] + "...")
+            ))
+        elif result['type'] == 'course':
+            links.append(LinkResponse(
+                url="https://tds.s-anand.net/#/2025-01/",
+                text=f"Course: {result.get('section', 'TDS Content')}"
+            ))
+    return links
+
+def faq_links(entry: FAQEntry) -> List[LinkResponse]:
+    return [LinkResponse(url=link['url'], text=link.get('text') or link['url']) for link in entry.links]
+
+def faq_answer(request: QuestionRequest) -> Optional[FAQEntry]:
+    """The FAQ entry answering the request, if any; questions with an image always take the full path"""
+    if request.image:
+        return None
+    store = faq_store  # snapshot, like processor
+    with stage("faq"):
+        entry = store.match(request.question)
+    faq_lookups.labels("hit" if entry is not None else "miss").inc()
+    if entry is not None:
+        answers_total.labels("faq").inc()
+    return entry
+
+def filter_dict(filters: Optional[SearchFilters]) -> Optional[dict]:
+    return filters.model_dump(exclude_none=True) if filters else None
+
+def search_question(index: TDSDataProcessor, question: str, top_k: int = 5, backend: Optional[str] = None, filters: Optional[SearchFilters] = None):
+    """Search once, returning the results, the query vector for the answer cache and the prompt context text"""
+    if index.engine is None:
+        return [], None, None
+    with stage("encode"):
+        query_vector = index.encode_query(question)
+    with stage("retrieve"):
+        results = index.search(question, top_k, query_vector=query_vector, backend=backend, filters=filter_dict(filters))
+    with stage("context"):
+        context_text = index.build_context(results, query_vector, CONTEXT_TOKEN_BUDGET)['text']
+    return results, query_vector, context_text
+
+def search_questions(index: TDSDataProcessor, questions: List[str], top_k: int = 5, backends: Optional[List[Optional[str]]] = None, filters: Optional[List[Optional[SearchFilters]]] = None):
+    """Batch counterpart of search_question; questions are searched in one batch per backend and filter set"""
+    if index.engine is None:
+        return [[] for _ in questions], [None for _ in questions], [None for _ in questions]
+    with stage("encode"):
+        query_matrix = index.vectorizer.transform(questions)
+    backends = backends or [None] * len(questions)
+    filters = [filter_dict(f) for f in filters] if filters else [None] * len(questions)
+    groups = [(backend, json.dumps(f, sort_keys=True, default=str)) for backend, f in zip(backends, filters)]
+    results = [None] * len(questions)
+    with stage("retrieve"):
+        for group in set(groups):
+            rows = [i for i, g in enumerate(groups) if g == group]
+            for i, row_results in zip(rows, index.search_batch(
+                [questions[i] for i in rows], top_k, query_matrix=query_matrix[rows], backend=group[0], filters=filters[rows[0]]
+            )):
+                results[i] = row_results
+    query_vectors = [query_matrix[i] for i in range(len(questions))]
+    with stage("context"):
+        contexts = [
+            index.build_context(row_results, query_vector, CONTEXT_TOKEN_BUDGET)['text']
+            for row_results, query_vector in zip(results, query_vectors)
+        ]
+    return results, query_vectors, contexts
+
+def check_image_size(request: QuestionRequest):
+    """Reject an oversized image before any work is done on the request"""
+    if request.image:
+        image_pipeline.check_size(request.image, IMAGE_MAX_BYTES)
+
 @app.post("/api/", response_model=AnswerResponse)
 async def answer_question(request: QuestionRequest):
     try:
-        # Process image if provided
-        image_description = ""
-        if request.image:
-            image_description = virtual_ta.process_image(request.image)
+        check_image_size(request)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        # Frequent questions are answered from the FAQ store, without search or an upstream call
+        entry = faq_answer(request)
+        if entry is not None:
+            return AnswerResponse(answer=entry.answer, links=faq_links(entry))
         
-        # Search for relevant content
-        search_results = processor.search(request.question, top_k=5) or  []
+        index = processor  # snapshot: a concurrent reload must not change the index mid-request
+        
+        # Image description and search are independent, so run them concurrently
+        search_task = in_executor(search_question, index, request.question, 5, request.retrieval, request.filters)
+        if request.image:
+            image_description, (search_results, query_vector, context_text) = await asyncio.gather(
+                virtual_ta.aprocess_image(request.image), search_task
+            )
+        else:
+            image_description, (search_results, query_vector, context_text) = "", await search_task
+        search_results = search_results or []
         
         # Generate answer
-        answer = virtual_ta.generate_answer(request.question, search_results, image_description)
-        
-        # Prepare links
-        links = []
-        for result in search_results[:3]:  # Top 3 results
-            if result['type'] == 'discourse' and result.get('url'):
-                links.append(LinkResponse(
-                    url=result['url'],
-                    text=result.get('title', result['content'][:100] + "...")
-                ))
-            elif result['type'] == 'course':
-                links.append(LinkResponse(
-                    url="https://tds.s-anand.net/#/2025-01/",
-                    text=f"Course: {result.get('section', 'TDS Content')}"
-                ))
-        
-        return AnswerResponse(answer=answer, links=links)
+        with stage("answer"):
+            answer = await virtual_ta.agenerate_answer(
+                request.question, search_results, image_description, query_vector, index.index_version, context_text
+            )
+        
+        return AnswerResponse(answer=answer, links=build_links(search_results))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/batch", response_model=List[BatchAnswerResponse])
+async def answer_questions_batch(requests: List[QuestionRequest]):
+    """Answer many questions in one call, returning one response per question in order"""
+    if len(requests) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {BATCH_MAX_SIZE} questions)")
+    
+    # FAQ hits are answered at once; the rest share one vectorizer.transform and one
+    # batched search per retrieval backend and filter set
+    entries = [faq_answer(request) for request in requests]
+    misses = [request for request, entry in zip(requests, entries) if entry is None]
+    index = processor
+    try:
+        searched = await in_executor(
+            search_questions, index, [request.question for request in misses], 5,
+            [request.retrieval for request in misses], [request.filters for request in misses]
+        ) if misses else ([], [], [])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    searched = iter(zip(*searched))
+    
+    async def answer_one(request: QuestionRequest, search_results: List[dict], query_vector, context_text) -> BatchAnswerResponse:
+        try:
+            check_image_size(request)
+            image_description = await virtual_ta.aprocess_image(request.image) if request.image else ""
+            # Upstream calls are bounded by upstream_semaphore inside Upstream.call
+            with stage("answer"):
+                answer = await virtual_ta.agenerate_answer(
+                    request.question, search_results, image_description, query_vector, index.index_version, context_text
+                )
+            return BatchAnswerResponse(answer=answer, links=build_links(search_results))
+        except Exception as e:
+            return BatchAnswerResponse(answer="", links=[], error=str(e))
+    
+    async def faq_one(entry: FAQEntry) -> BatchAnswerResponse:
+        return BatchAnswerResponse(answer=entry.answer, links=faq_links(entry))
+    
+    return await asyncio.gather(*(
+        faq_one(entry) if entry is not None else answer_one(request, *next(searched))
+        for request, entry in zip(requests, entries)
+    ))
+
+def sse_event(event: str, data: dict) -> str:
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/stream")
+async def stream_answer(request: QuestionRequest):
+    """Answer as Server-Sent Events: a "links" event as soon as search returns, then
+    "token" events, then "done" with the whole answer (see TDSVirtualTA.astream_answer)"""
+    try:
+        check_image_size(request)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    entry = faq_answer(request)
+    if entry is not None:
+        def faq_events():
+            yield sse_event("links", {"links": [link.model_dump() for link in faq_links(entry)]})
+            for event, data in answer_events(entry.answer, faq=entry.id):
+                yield sse_event(event, data)
+        
+        return StreamingResponse(
+            faq_events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    
+    index = processor
+    # The image is described while searching and while the links are sent
+    image_task = asyncio.ensure_future(virtual_ta.aprocess_image(request.image)) if request.image else None
+    try:
+        search_results, query_vector, context_text = await in_executor(
+            search_question, index, request.question, 5, request.retrieval, request.filters
+        )
+    except Exception as e:
+        if image_task:
+            image_task.cancel()
+        raise HTTPException(status_code=500, detail=str(e))
+    search_results = search_results or []
+    
+    async def events():
+        try:
+            yield sse_event("links", {"links": [link.model_dump() for link in build_links(search_results)]})
+            image_description = await image_task if image_task else ""
+            async for event, data in virtual_ta.astream_answer(
+                request.question, search_results, image_description, query_vector, index.index_version, context_text
+            ):
+                yield sse_event(event, data)
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            if image_task and not image_task.done():
+                image_task.cancel()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "TDS Virtual TA is running"}
+    index = processor
+    return {
+        "status": "healthy" if index.engine is not None else "degraded",
+        "message": "TDS Virtual TA is running",
+        "index": {
+            "version": index.index_version,
+            "retrieval_backend": index.backend,
+            "documents": index.engine.live_count if index.engine is not None else 0,
+            "loaded_at": index_state['loaded_at'],
+            "reload_seconds": index_state['reload_seconds'],
+            "reloads": index_state['reloads'],
+            "last_error": index_state['last_error'],
+        },
+    }
+
+def require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN or token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: Optional[str] = Header(None)):
+    """Load the index from disk in the background and swap it in without downtime"""
+    require_admin(x_admin_token)
+    if reload_hook is not None:
+        reload_hook()
+        return {"status": "reload scheduled", "version": processor.index_version}
+    try:
+        new_processor = await reload_index()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+    return {"status": "reloaded", "version": new_processor.index_version, "reload_seconds": index_state['reload_seconds']}
+
+@app.post("/admin/faq/reload")
+async def admin_faq_reload(x_admin_token: Optional[str] = Header(None)):
+    """Load FAQ_FILE again, keeping the current entries if it is invalid; the index is not reloaded"""
+    require_admin(x_admin_token)
+    try:
+        store = load_faq()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid FAQ file {FAQ_FILE}: {e}")
+    if faq_reload_hook is not None:
+        faq_reload_hook()  # serve.py: the other workers reload their FAQ store too, without a restart
+    return {"status": "reloaded", **store.stats()}
+
+@app.post("/admin/profile")
+async def admin_profile_start(requests: int = 100, interval: float = 0.005, x_admin_token: Optional[str] = Header(None)):
+    """Sample stacks of all threads until `requests` more requests have finished (see metrics.SamplingProfiler)"""
+    require_admin(x_admin_token)
+    if requests < 1 or not 0.001 <= interval <= 1:
+        raise HTTPException(status_code=422, detail="requests must be >= 1 and interval between 0.001 and 1 seconds")
+    metrics.profiler.start(requests + 1, interval)  # + 1: this request finishes after starting the profiler
+    return metrics.profiler.status()
+
+@app.get("/admin/profile")
+async def admin_profile(x_admin_token: Optional[str] = Header(None)):
+    """Profiler status and the samples so far as folded stacks"""
+    require_admin(x_admin_token)
+    return {**metrics.profiler.status(), "folded": metrics.profiler.folded()}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {**answer_cache.stats(), 'images': image_cache.stats(), 'faq': faq_store.stats()}
 
 @app.get("/")
 async def root():
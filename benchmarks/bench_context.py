@@ -0,0 +1,90 @@
+"""Prompt context size and coverage: legacy ``context[:3]`` / ``content[:500]`` vs token-budgeted passages.
+
+Builds the index from the raw course HTML and discourse posts (as
+``python data_processor.py`` does) and, for every question in
+benchmarks/eval_questions.yaml, assembles the prompt context both ways.
+Reports mean and p95 context tokens, how often the expected thread made it
+into the context, the share of query terms present in the context, and the
+time taken to assemble it.
+
+Usage:
+    python benchmarks/bench_context.py --budget 150
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from bench_hybrid import load_questions
+from context_builder import CONTEXT_TOKEN_BUDGET, count_tokens
+from data_processor import TDSDataProcessor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def legacy_context(context):
+    """The original generate_answer context block"""
+    return "\n\n".join([
+        f"Source: {item.get('source', 'Unknown')}\n{item['content'][:500]}..."
+        for item in context[:3]
+    ])
+
+
+def term_coverage(processor, question, text):
+    analyzer = processor.vectorizer.build_analyzer()
+    terms = {term for term in analyzer(question) if ' ' not in term}
+    if not terms:
+        return 1.0
+    present = set(analyzer(text))
+    return len(terms & present) / len(terms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt context assembly")
+    parser.add_argument("--html", default=os.path.join(ROOT, "data", "tds_course_dump.html"))
+    parser.add_argument("--posts", default=os.path.join(ROOT, "data", "tds_discourse_posts.json"))
+    parser.add_argument("--questions", default=os.path.join(ROOT, "benchmarks", "eval_questions.yaml"))
+    parser.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--backend", default="tfidf")
+    args = parser.parse_args()
+
+    processor = TDSDataProcessor(args.backend)
+    processor.process_course_html(args.html)
+    processor.process_discourse_posts(args.posts)
+    processor.build_search_index()
+    questions = load_questions(args.questions)
+    print(f"{len(processor.engine)} documents, {len(processor.passage_index().segments[0].texts)} passages, "
+          f"{len(questions)} questions, budget {args.budget} tokens")
+
+    rows = {'legacy': [], 'passages': []}
+    for question, expected in questions:
+        query_vector = processor.encode_query(question)
+        results = processor.search(question, 5, query_vector=query_vector)
+
+        start = time.perf_counter()
+        text = legacy_context(results)
+        legacy_seconds = time.perf_counter() - start
+        legacy_urls = {result.get('url') for result in results[:3]}
+        rows['legacy'].append((count_tokens(text), bool(expected & legacy_urls),
+                               term_coverage(processor, question, text), legacy_seconds))
+
+        start = time.perf_counter()
+        context = processor.build_context(results, query_vector, args.budget)
+        seconds = time.perf_counter() - start
+        included = {result.get('url') for result in results if result['doc_id'] in context['doc_ids']}
+        rows['passages'].append((count_tokens(context['text']), bool(expected & included),
+                                 term_coverage(processor, question, context['text']), seconds))
+
+    print(f"{'context':>9} {'tokens':>7} {'p95':>6} {'expected':>9} {'terms':>6} {'assembly p50':>13}")
+    for name, values in rows.items():
+        tokens, hits, coverage, seconds = (np.array(column, dtype=float) for column in zip(*values))
+        print(f"{name:>9} {tokens.mean():>7.0f} {np.percentile(tokens, 95):>6.0f} {hits.mean():>9.2f} "
+              f"{coverage.mean():>6.2f} {np.percentile(seconds, 50) * 1000:>11.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
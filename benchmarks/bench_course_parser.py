@@ -0,0 +1,85 @@
+"""Course HTML parser benchmark: legacy nested find_all loop vs the single-pass parser.
+
+Reports parse time, document count and total indexed characters for
+data/tds_course_dump.html (or another dump) with each available parser backend.
+
+Usage:
+    python benchmarks/bench_course_parser.py --repeat 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from data_processor import TDSDataProcessor
+
+
+def legacy_process_course_html(html_file, parser='html.parser'):
+    """The original TDSDataProcessor.process_course_html body"""
+    with open(html_file, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+    soup = BeautifulSoup(html_content, parser)
+    sections = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+    content_blocks = soup.find_all(['p', 'div', 'li', 'td'])
+    course_data = []
+    current_section = "General"
+    for element in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'div', 'li']):
+        if element.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+            current_section = element.get_text().strip()
+        else:
+            text = element.get_text().strip()
+            if len(text) > 20:
+                course_data.append({
+                    'type': 'course',
+                    'section': current_section,
+                    'content': text,
+                    'source': 'TDS Course Content'
+                })
+    return course_data
+
+
+def single_pass(html_file, parser):
+    processor = TDSDataProcessor()
+    processor.process_course_html(html_file, parser=parser)
+    return processor.course_data
+
+
+def measure(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        docs = func()
+        best = min(best, time.perf_counter() - start)
+    return best, docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark course HTML parsing")
+    parser.add_argument("--html", default="data/tds_course_dump.html")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    backends = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        backends.append('lxml')
+    except ImportError:
+        pass
+
+    print(f"{'parser':<28} {'best time':>10} {'documents':>10} {'characters':>11}")
+    for backend in backends:
+        for name, func in (
+            (f"legacy ({backend})", lambda: legacy_process_course_html(args.html, backend)),
+            (f"single-pass ({backend})", lambda: single_pass(args.html, backend)),
+        ):
+            seconds, docs = measure(func, args.repeat)
+            chars = sum(len(doc['content']) for doc in docs)
+            print(f"{name:<28} {seconds * 1000:>8.1f}ms {len(docs):>10} {chars:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Memory and access cost of the document store: list of dicts vs ``ColumnarDocuments``.
+
+Replicates the documents of data/processed_data.json up to ``--documents``
+rows (giving each copy its own URL and a little unique content, as new
+posts would have) and compares:
+
+- retained memory of the documents as parsed from JSON (one dict per
+  document, the pre-columnar in-memory layout) and as a columnar store;
+- time to load them: ``json.load`` of the list vs ``ColumnarDocuments.load``
+  of a saved index directory (memory-mapped);
+- time to turn the top k rows of a query into results and read the fields
+  the API uses (``type``, ``url``, ``title``, ``content``): copying each
+  document into a result dict vs wrapping views in ``SearchResult``.
+
+Usage:
+    python benchmarks/bench_documents.py --documents 100000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from document_store import ColumnarDocuments
+from retrieval import SearchResult
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_documents(data_file, count):
+    with open(data_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    base = data['course_data'] + data['discourse_data']
+    documents = []
+    for i in range(count):
+        doc = dict(base[i % len(base)])
+        if 'url' in doc:
+            doc['url'] = f"{doc['url']}/{i}"
+        doc['content'] = f"{doc['content']} (post {i})"
+        documents.append(doc)
+    return documents
+
+
+def retained(build):
+    """Result of build() and the bytes it still holds once built"""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return np.percentile(times, 50)
+
+
+def read_fields(results):
+    for result in results:
+        result['type'], result.get('url'), result.get('title'), result['content']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the columnar document store")
+    parser.add_argument("--data", default=os.path.join(ROOT, "data", "processed_data.json"))
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    encoded = json.dumps(synthetic_documents(args.data, args.documents), ensure_ascii=False)
+    dicts, dict_bytes = retained(lambda: json.loads(encoded))
+    columns, column_bytes = retained(lambda: ColumnarDocuments.from_dicts(dicts))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'documents.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(encoded)
+        columns.save(directory)
+
+        def load_json():
+            with open(path, 'r', encoding='utf-8') as f:
+                json.load(f)
+
+        json_load = timed(load_json, 3)
+        column_load = timed(lambda: ColumnarDocuments.load(directory), 3)
+        mapped, mapped_bytes = retained(lambda: ColumnarDocuments.load(directory))
+        del mapped
+
+    rng = np.random.default_rng(0)
+    rows = [rng.choice(args.documents, args.top_k, replace=False).tolist() for _ in range(args.repeat)]
+    queries = iter(rows * 3)
+
+    def copy_results():
+        read_fields([dict(dicts[i], similarity=0.5, doc_id=i) for i in next(queries)])
+
+    def view_results():
+        read_fields([SearchResult(columns[i], 0.5, i) for i in next(queries)])
+
+    copy_topk = timed(copy_results, args.repeat)
+    view_topk = timed(view_results, args.repeat)
+
+    mb = 1024 * 1024
+    print(f"{args.documents} documents, {len(encoded) / mb:.1f} MB as JSON, top {args.top_k} results")
+    print(f"{'store':>14} {'retained':>10} {'load':>9} {'top-k + fields':>15}")
+    print(f"{'list of dicts':>14} {dict_bytes / mb:>8.1f}MB {json_load * 1000:>7.0f}ms {copy_topk * 1e6:>13.1f}us")
+    print(f"{'columnar':>14} {column_bytes / mb:>8.1f}MB {column_load * 1000:>7.1f}ms {view_topk * 1e6:>13.1f}us")
+    print(f"{'columnar mmap':>14} {mapped_bytes / mb:>8.1f}MB  (arrays {columns.nbytes / mb:.1f} MB in the page cache)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""FAQ fast path: match latency vs the retrieval it skips.
+
+Builds an FAQ store of ``--entries`` entries: data/faq.json plus synthetic
+entries whose example questions are the evaluation questions and shuffled
+words from them. Then times, per question:
+
+- ``faq hit``: ``FAQStore.match`` on a reworded example question;
+- ``faq miss``: ``FAQStore.match`` on a question no entry answers (every
+  non-hit request pays this before search);
+- ``search``: ``search_question`` (encode, retrieve, prompt context) on the
+  bundled index, the work a hit avoids besides the LLM call.
+
+Reports p50/p99 latency in microseconds.
+
+Usage:
+    python benchmarks/bench_faq.py --entries 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from faq import FAQEntry, FAQStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_store(questions, n, rng):
+    entries = FAQStore.load(os.path.join(ROOT, 'data', 'faq.json')).entries
+    words = " ".join(questions).split()
+    for i in range(n - len(entries)):
+        wordings = [" ".join(rng.sample(words, rng.randint(6, 14))) for _ in range(3)]
+        entries.append(FAQEntry(f"synthetic-{i}", wordings, f"Answer {i}", patterns=[rf"\bsynthetic{i}\b"]))
+    return FAQStore(entries)
+
+
+def reword(question, rng):
+    """The question with one word dropped and the rest lower-cased, as a student might retype it"""
+    words = question.lower().split()
+    if len(words) > 4:
+        del words[rng.randrange(len(words))]
+    return " ".join(words)
+
+
+def time_us(func, items, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            func(item)
+            latencies.append((time.perf_counter() - start) * 1e6)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAQ matching against search")
+    parser.add_argument("--entries", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--questions", default=os.path.join(ROOT, "benchmarks", "eval_questions.yaml"))
+    parser.add_argument("--data", default=os.path.join(ROOT, "data", "processed_data.json"))
+    args = parser.parse_args()
+
+    from bench_hybrid import load_questions
+
+    rng = random.Random(0)
+    questions = [question for question, _ in load_questions(args.questions)]
+    store = synthetic_store(questions, args.entries, rng)
+    hits = [reword(rng.choice(entry.questions), rng) for entry in store.entries for _ in range(2)]
+    misses = ["How do I deploy the FastAPI app on Vercel?", "When is the ROE exam?",
+              "My docker build fails with permission denied", "Is there a penalty for late submission of GA3?"]
+    matched = sum(store.match(question) is not None for question in hits)
+
+    print(f"{len(store)} FAQ entries; {matched}/{len(hits)} reworded example questions matched")
+    print(f"{'path':>10} {'p50':>10} {'p99':>10}")
+    for name, items in (('faq hit', hits), ('faq miss', misses)):
+        p50, p99 = time_us(store.match, items, args.repeat)
+        print(f"{name:>10} {p50:>8.1f}us {p99:>8.1f}us")
+
+    os.environ.update(DATA_FILE=args.data, INDEX_WATCH_INTERVAL="0")
+    import app as tds_app
+
+    index = tds_app.load_processor()
+    p50, p99 = time_us(lambda question: tds_app.search_question(index, question), questions, max(1, args.repeat // 4))
+    print(f"{'search':>10} {p50:>8.1f}us {p99:>8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Retrieval quality and latency per backend: tfidf, bm25, dense and hybrid.
+
+Builds the index from data/processed_data.json and runs the promptfoo-style
+questions in benchmarks/eval_questions.yaml as queries. For every backend it
+reports recall@1/3/5 (fraction of asserted URLs among the top k results),
+MRR and p50/p99 latency of TDSDataProcessor.search. ``--pad N`` adds N
+synthetic distractor documents (shuffled words from the real corpus) to see
+how quality and latency hold up on a bigger index; above
+hybrid.DenseIndex.EXACT_MAX documents the dense backend switches to IVF, and its
+top-k overlap with exact search is reported as well.
+
+Usage:
+    python benchmarks/bench_hybrid.py
+    python benchmarks/bench_hybrid.py --pad 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import yaml
+
+from data_processor import TDSDataProcessor
+from hybrid import BACKENDS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_questions(path):
+    """(question, set of expected URLs) pairs from a promptfoo test file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        tests = yaml.safe_load(f)
+    return [
+        (test['vars']['question'], {a['value'] for a in test.get('assert', []) if a.get('type') == 'contains'})
+        for test in tests
+    ]
+
+
+def distractors(documents, n, rng):
+    """Synthetic discourse posts made of shuffled words from the real corpus"""
+    words = np.array(" ".join(doc['content'] for doc in documents).split())
+    lengths = rng.integers(5, 40, n)
+    return [
+        {
+            'type': 'discourse',
+            'title': f'synthetic {i}',
+            'content': " ".join(rng.choice(words, length)),
+            'url': f'https://example.invalid/t/synthetic/{i}',
+            'date': '',
+            'source': 'Discourse Post',
+        }
+        for i, length in enumerate(lengths)
+    ]
+
+
+def evaluate(processor, questions, backend, ks=(1, 3, 5)):
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks, latencies = [], []
+    expected_total = 0
+    for question, expected in questions:
+        start = time.perf_counter()
+        results = processor.search(question, max(ks), backend=backend)
+        latencies.append(time.perf_counter() - start)
+        urls = [result.get('url') for result in results]
+        expected_total += len(expected)
+        for k in ks:
+            hits[k] += len(expected & set(urls[:k]))
+        rank = next((i for i, url in enumerate(urls, 1) if url in expected), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    recall = {k: hits[k] / expected_total for k in ks}
+    return recall, float(np.mean(reciprocal_ranks)), np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+
+def ann_overlap(processor, questions, top_k=5):
+    """Mean top-k overlap between IVF and exact dense search"""
+    hybrid = processor.hybrid_retriever()
+    dense = hybrid.dense
+    embeddings = hybrid.embedder.encode([question for question, _ in questions])
+    overlaps = []
+    for embedding in embeddings:
+        approx_ids, _ = dense.search(embedding, top_k)
+        scores = np.asarray(dense.base) @ embedding
+        exact_ids = [i for i in np.argsort(-scores)[:top_k] if scores[i] > dense.threshold]
+        if exact_ids:
+            overlaps.append(len(set(approx_ids) & set(exact_ids)) / len(exact_ids))
+    return float(np.mean(overlaps)) if overlaps else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall@k and latency per retrieval backend")
+    parser.add_argument("--data", default=os.path.join(ROOT, "data", "processed_data.json"))
+    parser.add_argument("--questions", default=os.path.join(ROOT, "benchmarks", "eval_questions.yaml"))
+    parser.add_argument("--pad", type=int, default=0, help="Synthetic distractor documents to add")
+    parser.add_argument("--embedding-model", default=os.getenv("EMBEDDING_MODEL"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.data, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    processor = TDSDataProcessor(embedding_model=args.embedding_model)
+    processor.course_data = data['course_data']
+    processor.discourse_data = data['discourse_data']
+    if args.pad:
+        processor.discourse_data += distractors(data['course_data'] + data['discourse_data'], args.pad, np.random.default_rng(args.seed))
+
+    start = time.perf_counter()
+    processor.build_search_index()
+    build_seconds = time.perf_counter() - start
+    questions = load_questions(args.questions)
+
+    print(f"{len(processor.engine)} documents, {len(questions)} questions, index built in {build_seconds:.2f}s")
+    print(f"{'backend':>8} {'R@1':>6} {'R@3':>6} {'R@5':>6} {'MRR':>6} {'p50':>9} {'p99':>9}")
+    for backend in BACKENDS:
+        recall, mrr, p50, p99 = evaluate(processor, questions, backend)
+        print(f"{backend:>8} {recall[1]:>6.2f} {recall[3]:>6.2f} {recall[5]:>6.2f} {mrr:>6.2f} {p50:>7.2f}ms {p99:>7.2f}ms")
+    if processor.hybrid.dense.centroids is not None:
+        print(f"IVF top-5 overlap with exact dense search: {ann_overlap(processor, questions):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Image preprocessing: payload size, upload size, memory and description cache hits.
+
+Generates synthetic screenshots (terminal-style text on a dark background)
+and compares the original path (``b64decode``, then the full-resolution PIL
+image re-encoded by the Gemini SDK: PNG stays PNG, anything else becomes
+JPEG) with image_pipeline.prepare_image. Reports the time to get the upload
+bytes, the upload size and the uploaded resolution.
+It then replays screenshots and variants of them through
+ImageDescriptionCache. Re-encoded (JPEG) and rescaled variants should reuse
+the first description. Blinking-cursor variants and variants with one line
+of text changed do not: a cursor block changes its thumbnail pixel by more
+than the allowed delta, so both report 0 hits with the defaults.
+
+Usage:
+    python benchmarks/bench_image.py --width 2560 --height 1440
+"""
+import argparse
+import base64
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+import image_pipeline
+
+LINES = [
+    "$ python app.py",
+    "Traceback (most recent call last):",
+    '  File "/home/student/project/app.py", line {n}, in <module>',
+    "    from fastapi import FastAPI",
+    "ModuleNotFoundError: No module named '{module}'",
+    "$ uv run --with {module} app.py",
+    "ERROR: HTTP {status} while calling https://aipipe.org/openai/v1/chat/completions",
+]
+
+
+def screenshot(seed, width, height, cursor=False, edit=False):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (30, 30, 30))
+    draw = ImageDraw.Draw(image)
+    y = 20
+    while y < height - 40:
+        line = rng.choice(LINES).format(n=rng.randint(1, 400), module=rng.choice(["httpx", "numpy", "pandas"]),
+                                        status=rng.choice([401, 429, 500]))
+        draw.text((20, y), line, fill=(220, 220, 220))
+        y += rng.choice([14, 16, 18])
+    if cursor:
+        draw.rectangle((20, y, 28, y + 12), fill=(220, 220, 220))
+    if edit:  # a different error on the first line, same layout
+        draw.rectangle((0, 18, width, 32), fill=(30, 30, 30))
+        draw.text((20, 20), "ModuleNotFoundError: No module named 'matplotlib'", fill=(220, 220, 220))
+    return image
+
+
+def encode(image, format="PNG", **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def measure(func, payload, repeat=5):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(payload)
+        seconds.append(time.perf_counter() - start)
+    return result, min(seconds)
+
+
+def legacy(payload):
+    """Upload bytes and size of the original path"""
+    image = Image.open(io.BytesIO(base64.b64decode(payload)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG" if image.format == "PNG" else "JPEG")
+    return buffer.getvalue(), image.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image preprocessing pipeline")
+    parser.add_argument("--width", type=int, default=2560)
+    parser.add_argument("--height", type=int, default=1440)
+    parser.add_argument("--screenshots", type=int, default=20)
+    parser.add_argument("--max-distance", type=int, default=8)
+    parser.add_argument("--max-pixel-delta", type=int, default=12)
+    args = parser.parse_args()
+
+    payload = encode(screenshot(0, args.width, args.height))
+    print(f"{args.width}x{args.height} PNG screenshot, base64 payload {len(payload) / 1e6:.2f} MB")
+    print(f"{'':>9} {'time':>8} {'upload':>9} {'size':>10}")
+    (data, size), seconds = measure(legacy, payload)
+    print(f"{'legacy':>9} {seconds * 1000:>6.0f}ms {len(data) / 1e6:>7.2f}MB {'%dx%d' % size:>10}")
+    prepared, seconds = measure(image_pipeline.prepare_image, payload)
+    print(f"{'pipeline':>9} {seconds * 1000:>6.0f}ms {len(prepared.data) / 1e6:>7.2f}MB {'%dx%d' % prepared.size:>10}")
+
+    cache = image_pipeline.ImageDescriptionCache(max_distance=args.max_distance, max_pixel_delta=args.max_pixel_delta)
+    width, height = args.width // 2, args.height // 2
+    variants = {
+        'jpeg': lambda seed, base: encode(base, "JPEG", quality=80),
+        'scaled': lambda seed, base: encode(base.resize((base.width * 9 // 10, base.height * 9 // 10))),
+        'cursor': lambda seed, base: encode(screenshot(seed, width, height, cursor=True)),
+        'edited': lambda seed, base: encode(screenshot(seed, width, height, edit=True)),
+    }
+    hits = {name: 0 for name in variants}
+    false_hits = 0
+    for seed in range(args.screenshots):
+        base = screenshot(seed, width, height)
+        prepared = image_pipeline.prepare_image(encode(base))
+        if cache.get(prepared) is not None:
+            false_hits += 1  # matched a different screenshot
+        cache.put(prepared, seed)
+        for name, variant in variants.items():
+            description = cache.get(image_pipeline.prepare_image(variant(seed, base)))
+            hits[name] += description == seed
+            false_hits += description is not None and description != seed
+    print(f"{args.screenshots} screenshots, cache hits per variant "
+          f"(max distance {args.max_distance} bits, max pixel delta {args.max_pixel_delta}): "
+          + ", ".join(f"{name} {count}/{args.screenshots}" for name, count in hits.items())
+          + f"; {false_hits} hits on other screenshots")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Load test for POST /api/ against stubbed upstreams.
+
+Drives the ASGI app in-process with N concurrent clients while the OpenAI and
+Gemini clients are replaced by stubs that wait for a fixed time: the async
+OpenAI client sleeps, the Gemini vision client blocks like its SDK. Reports p50/p99 latency for /api/ and for
+/health probes issued during the run, which shows whether upstream calls
+stall the event loop. The run fails if any answer fell back to the rules,
+since its latency would then not include the stubbed LLM call.
+
+Usage:
+    python benchmarks/bench_load.py --concurrency 64 --requests 512
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from PIL import Image
+
+import app as tds_app
+
+
+class _StubCompletions:
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        message = type("Message", (), {"content": "stubbed answer"})()
+        choice = type("Choice", (), {"message": message})()
+        return type("Response", (), {"choices": [choice]})()
+
+
+class StubOpenAI:
+    def __init__(self, delay):
+        self.chat = type("Chat", (), {"completions": _StubCompletions(delay)})()
+
+
+class StubGemini:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def generate_content(self, parts, **kwargs):
+        time.sleep(self.delay)
+        return type("Response", (), {"text": "stubbed image description"})()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def fallback_counts():
+    return {values[0]: child.value for values, child in tds_app.fallback_answers._children.items()}
+
+
+def sample_image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+async def run(args):
+    tds_app.processor.load_processed_data(args.data)
+    tds_app.virtual_ta.async_openai_client = StubOpenAI(args.llm_delay)
+    tds_app.virtual_ta.gemini_text_model = None  # answers come from the OpenAI stub only
+    tds_app.virtual_ta.gemini_model = StubGemini(args.vision_delay)
+
+    questions = [
+        "Should I use gpt-4o-mini or gpt-3.5-turbo?",
+        "How do I deploy FastAPI with Docker?",
+        "What is the deadline for project 1?",
+        "How are GA marks calculated?",
+    ]
+    image = sample_image()
+    latencies, health_latencies = [], []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    done = asyncio.Event()
+
+    transport = httpx.ASGITransport(app=tds_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i):
+            payload = {"question": questions[i % len(questions)]}
+            if args.image_every and i % args.image_every == 0:
+                payload["image"] = image
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/", json=payload)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        async def probe_health():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.05)
+
+        fallbacks_before = fallback_counts()
+        prober = asyncio.create_task(probe_health())
+        wall = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - wall
+        done.set()
+        await prober
+
+    print(f"requests={args.requests} concurrency={args.concurrency} "
+          f"llm_delay={args.llm_delay}s upstream_concurrency={tds_app.UPSTREAM_CONCURRENCY}")
+    print(f"/api/   p50={percentile(latencies, 50) * 1000:.1f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.1f}ms "
+          f"mean={statistics.mean(latencies) * 1000:.1f}ms "
+          f"throughput={args.requests / wall:.1f} req/s")
+    print(f"/health p50={percentile(health_latencies, 50) * 1000:.1f}ms "
+          f"p99={percentile(health_latencies, 99) * 1000:.1f}ms "
+          f"samples={len(health_latencies)}")
+    fallbacks = {reason: count - fallbacks_before.get(reason, 0) for reason, count in fallback_counts().items()}
+    fallbacks = {reason: int(count) for reason, count in fallbacks.items() if count}
+    print(f"fallback answers={sum(fallbacks.values())}" + (f" {fallbacks}" if fallbacks else ""))
+    if fallbacks:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the /api/ endpoint with stubbed upstreams")
+    parser.add_argument("--data", default="data/processed_data.json")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--llm-delay", type=float, default=0.2)
+    parser.add_argument("--vision-delay", type=float, default=0.1)
+    parser.add_argument("--image-every", type=int, default=4, help="Attach an image to every Nth request (0 = never)")
+    asyncio.run(run(parser.parse_args()))
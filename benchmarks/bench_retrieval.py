@@ -0,0 +1,99 @@
+"""Retrieval benchmark: legacy cosine_similarity + argsort vs SearchEngine.
+
+Builds synthetic L2-normalised TF-IDF corpora (Zipf-distributed terms, like
+real text) and times per-query top-5 search with both the original
+TDSDataProcessor.search logic and the inverted-index SearchEngine.
+
+Usage:
+    python benchmarks/bench_retrieval.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+from retrieval import SearchEngine
+
+
+def synthetic_matrix(n_docs, vocab_size, terms_per_doc, rng):
+    """Random sparse TF-IDF-like matrix with Zipfian term frequencies"""
+    ranks = np.arange(1, vocab_size + 1)
+    probs = (1.0 / ranks) / (1.0 / ranks).sum()
+    cols = rng.choice(vocab_size, size=n_docs * terms_per_doc, p=probs).astype(np.int32)
+    rows = np.repeat(np.arange(n_docs, dtype=np.int32), terms_per_doc)
+    idf = np.log(vocab_size / ranks) + 1
+    matrix = sparse.csr_matrix((idf[cols], (rows, cols)), shape=(n_docs, vocab_size))
+    matrix.sum_duplicates()
+    return normalize(matrix)
+
+
+def synthetic_queries(n_queries, vocab_size, rng):
+    """Short queries mixing a common term with rarer ones"""
+    rows, cols = [], []
+    for i in range(n_queries):
+        terms = np.concatenate([rng.integers(0, 50, 1), rng.integers(50, vocab_size, 3)])
+        rows.extend([i] * len(terms))
+        cols.extend(terms)
+    queries = sparse.csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(n_queries, vocab_size))
+    queries.sum_duplicates()
+    return normalize(queries)
+
+
+def legacy_search(query_vector, matrix, course_data, discourse_data, top_k=5):
+    """The original TDSDataProcessor.search body"""
+    similarities = cosine_similarity(query_vector, matrix)[0]
+    top_indices = similarities.argsort()[-top_k:][::-1]
+    all_data = course_data + discourse_data
+    results = []
+    for idx in top_indices:
+        if similarities[idx] > 0.1:
+            item = all_data[idx].copy()
+            item['similarity'] = similarities[idx]
+            results.append(item)
+    return results
+
+
+def time_queries(func, queries):
+    latencies = []
+    for i in range(queries.shape[0]):
+        start = time.perf_counter()
+        func(queries[i])
+        latencies.append(time.perf_counter() - start)
+    return np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark top-k retrieval")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--vocab", type=int, default=5000)
+    parser.add_argument("--terms-per-doc", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    queries = synthetic_queries(args.queries, args.vocab, rng)
+    print(f"{'docs':>9} {'legacy p50':>11} {'legacy p99':>11} {'engine p50':>11} {'engine p99':>11} {'speedup':>8}")
+    for n_docs in args.sizes:
+        matrix = synthetic_matrix(n_docs, args.vocab, args.terms_per_doc, rng)
+        half = n_docs // 2
+        course_data = [{'type': 'course', 'content': f'doc {i}'} for i in range(half)]
+        discourse_data = [{'type': 'discourse', 'content': f'doc {i}'} for i in range(half, n_docs)]
+        engine = SearchEngine(matrix, course_data + discourse_data)
+
+        legacy_p50, legacy_p99 = time_queries(
+            lambda q: legacy_search(q, matrix, course_data, discourse_data), queries)
+        engine_p50, engine_p99 = time_queries(lambda q: engine.search(q, 5), queries)
+        print(f"{n_docs:>9} {legacy_p50:>9.2f}ms {legacy_p99:>9.2f}ms "
+              f"{engine_p50:>9.2f}ms {engine_p99:>9.2f}ms {legacy_p50 / engine_p50:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Throughput of the retrieval-only /api/ path versus worker count.
+
+Starts ``serve.py --workers N`` (prefork, index loaded once in the master)
+for each N, and with ``--baseline`` also ``uvicorn app:app --workers N``
+(every worker loads its own index). No upstream keys are set, so every
+request is search + context assembly + the fallback answer. Load comes from
+``--clients`` client processes, each keeping ``--concurrency`` requests in
+flight for ``--duration`` seconds. Reports requests/second, p50/p99 latency
+and the proportional set size (PSS) of all server processes, which counts
+pages shared between workers only once.
+
+Usage:
+    python benchmarks/bench_serve.py --workers 1 2 4 --baseline
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = [
+    "When is the week 1 GA due?",
+    "My app fails when I deploy it on Vercel",
+    "How can I get more credits on the OpenAI key provided for the course?",
+    "Is there a mock end term exam to practice?",
+    "How should I manage Python dependencies and virtualenvs?",
+    "The GitHub workflow from the lecture video fails when I run it",
+]
+
+
+def client(url, duration, concurrency, results):
+    async def run():
+        latencies = []
+        deadline = time.perf_counter() + duration
+        async with httpx.AsyncClient(base_url=url, timeout=30) as http:
+            async def loop(i):
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    response = await http.post("/api/", json={"question": QUESTIONS[i % len(QUESTIONS)]})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                    i += 1
+            await asyncio.gather(*(loop(i) for i in range(concurrency)))
+        return latencies
+
+    results.put(asyncio.run(run()))
+
+
+def process_tree(pid):
+    pids = [pid]
+    for child in open(f"/proc/{pid}/task/{pid}/children").read().split():
+        pids.extend(process_tree(int(child)))
+    return pids
+
+
+def pss_mb(pid):
+    total = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/smaps_rollup") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("Pss:"))
+        except (FileNotFoundError, StopIteration):
+            pass
+    return total / 1024
+
+
+def start_server(command, url, env):
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            if httpx.get(url + "/health").json()['index']['documents']:
+                return server
+        except (httpx.HTTPError, KeyError):
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"server did not start: {' '.join(command)}")
+
+
+def measure(command, args, env):
+    url = f"http://127.0.0.1:{args.port}"
+    started = time.perf_counter()
+    server = start_server(command, url, env)
+    startup = time.perf_counter() - started
+    try:
+        for question in QUESTIONS:  # warm up every worker a little
+            httpx.post(url + "/api/", json={"question": question}, timeout=30)
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(url, args.duration, args.concurrency, results))
+                   for _ in range(args.clients)]
+        for process in clients:
+            process.start()
+        latencies = np.concatenate([results.get() for _ in clients])
+        for process in clients:
+            process.join()
+        memory = pss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    return len(latencies) / args.duration, np.percentile(latencies, 50), np.percentile(latencies, 99), memory, startup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark requests/second versus worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--data", default=os.path.join(ROOT, "data", "processed_data.json"))
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--baseline", action="store_true", help="Also run uvicorn --workers N")
+    args = parser.parse_args()
+
+    env = {key: value for key, value in os.environ.items() if key not in ("OPENAI_API_KEY", "GEMINI_API_KEY")}
+    env.update(DATA_FILE=os.path.abspath(args.data), INDEX_WATCH_INTERVAL="0")
+    print(f"{len(os.sched_getaffinity(0))} CPUs, {args.clients} client processes x {args.concurrency} in flight, "
+          f"{args.duration:.0f}s per run")
+    print(f"{'server':>8} {'workers':>7} {'req/s':>8} {'p50':>8} {'p99':>8} {'PSS':>8} {'startup':>8}")
+    for workers in args.workers:
+        commands = {'serve': [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(args.port),
+                              "--workers", str(workers), "--log-level", "warning"]}
+        if args.baseline:
+            commands['uvicorn'] = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+                                   "--port", str(args.port), "--workers", str(workers), "--log-level", "warning"]
+        for name, command in commands.items():
+            rps, p50, p99, memory, startup = measure(command, args, env)
+            print(f"{name:>8} {workers:>7} {rps:>8.0f} {p50 * 1000:>6.1f}ms {p99 * 1000:>6.1f}ms "
+                  f"{memory:>6.0f}MB {startup:>7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Time to first byte and first token: POST /api/ vs Server-Sent Events on /api/stream.
+
+Runs the app with uvicorn against a local fake OpenAI server
+(benchmarks/fake_upstreams.py) that waits ``--first-token`` seconds before
+answering and ``--token-delay`` between streamed chunks. For every question
+in benchmarks/eval_questions.yaml it reports the latency of the full /api/
+response and, for /api/stream, the time to the "links" event, to the first
+answer token and to the "done" event. The answer cache is disabled so every
+request reaches the upstream.
+
+It then points the app at a fake server that drops the stream after
+``--fail-after`` chunks and checks that /api/stream sends "reset" and the
+fallback answer, as /api/ does.
+
+Usage:
+    python benchmarks/bench_stream.py --first-token 0.5 --token-delay 0.02
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_events(response):
+    """(seconds since start, event, data) for each SSE message of a streaming httpx response"""
+    start = time.perf_counter()
+    event = None
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield time.perf_counter() - start, event, json.loads(line[len("data: "):])
+
+
+def stream(client, question):
+    start = time.perf_counter()
+    with client.stream("POST", "/api/stream", json={"question": question}) as response:
+        response.raise_for_status()
+        timings, events = {}, []
+        for _, event, data in read_events(response):
+            timings.setdefault(event, time.perf_counter() - start)
+            events.append((event, data))
+    return timings, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed vs buffered answers")
+    parser.add_argument("--data", default=os.path.join(ROOT, "data", "processed_data.json"))
+    parser.add_argument("--questions", default=os.path.join(ROOT, "benchmarks", "eval_questions.yaml"))
+    parser.add_argument("--first-token", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--fail-after", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    upstream_port, failing_port = args.port + 1, args.port + 2
+    os.environ.update(
+        OPENAI_API_KEY="fake",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{upstream_port}/v1",
+        DATA_FILE=args.data,
+        INDEX_WATCH_INTERVAL="0",
+    )
+    import httpx
+    import numpy as np
+    from openai import AsyncOpenAI
+
+    import app as tds_app
+    from answer_cache import AnswerCache
+    from bench_hybrid import load_questions
+    from fake_upstreams import fake_openai, serve
+
+    tds_app.answer_cache = AnswerCache(max_entries=0)
+    serve(fake_openai(first_token=args.first_token, token_delay=args.token_delay), upstream_port)
+    serve(fake_openai(first_token=args.first_token, token_delay=args.token_delay, fail_after=args.fail_after), failing_port)
+    serve(tds_app.app, args.port)
+    questions = [question for question, _ in load_questions(args.questions)]
+
+    rows = {'/api/': [], 'links': [], 'first token': [], 'done': []}
+    with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=60) as client:
+        for question in questions:
+            start = time.perf_counter()
+            client.post("/api/", json={"question": question}).raise_for_status()
+            rows['/api/'].append(time.perf_counter() - start)
+            timings, events = stream(client, question)
+            assert events[-1][0] == "done" and not events[-1][1].get("fallback"), events[-1]
+            rows['links'].append(timings['links'])
+            rows['first token'].append(timings['token'])
+            rows['done'].append(timings['done'])
+
+        print(f"{len(questions)} questions, upstream first token {args.first_token}s, {args.token_delay}s per token")
+        print(f"{'':>18} {'p50':>9} {'p95':>9}")
+        for name, seconds in rows.items():
+            label = name if name == '/api/' else f"stream {name}"
+            print(f"{label:>18} {np.percentile(seconds, 50) * 1000:>7.0f}ms {np.percentile(seconds, 95) * 1000:>7.0f}ms")
+
+        failing = f"http://127.0.0.1:{failing_port}/v1"
+        tds_app.virtual_ta.async_openai_client = AsyncOpenAI(api_key="fake", base_url=failing, max_retries=0)
+        question = questions[0]
+        _, events = stream(client, question)
+        names = [event for event, _ in events]
+        buffered = client.post("/api/", json={"question": question}).json()['answer']
+        ok = "reset" in names and events[-1][1].get("fallback") and events[-1][1]['answer'] == buffered
+        print(f"mid-stream failure after {args.fail_after} tokens: events {names[:args.fail_after + 2]}... "
+              f"-> {'fallback answer, same as /api/' if ok else 'UNEXPECTED'}")
+        if not ok:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
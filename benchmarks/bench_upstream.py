@@ -0,0 +1,131 @@
+"""Answer latency and outcome under upstream slowness, errors and outages.
+
+Runs TDSVirtualTA.agenerate_answer (answer cache disabled) against local
+fake OpenAI and Gemini servers (fake_upstreams.py) injecting faults, and
+reports p50/p95/p99/max latency and who answered: OpenAI, Gemini or the
+rule-based fallback. Each scenario compares the resilience features on and
+off:
+
+- ``healthy``: no faults, the baseline cost of the upstream layer;
+- ``slow tail``: ``--slow-rate`` of OpenAI requests stall for 3s, without
+  and with hedging to Gemini at OpenAI's p95 latency;
+- ``errors``: ``--error-rate`` of OpenAI requests get a 503, without and
+  with jittered retries;
+- ``stalled``: every OpenAI request hangs; the read timeout bounds each
+  attempt, and the circuit breaker turns later requests into immediate
+  fallbacks (or Gemini answers with failover);
+- ``outage``: OpenAI answers only 503s, with and without circuit breaker.
+
+Usage:
+    python benchmarks/bench_upstream.py --requests 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+GEMINI_ANSWER = "Gemini: check the course page and the Discourse threads."
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def configure(tds_app, fakes, openai_faults, gemini_faults=None, **settings):
+    """A TDSVirtualTA with app settings overridden, pointed at new fake servers"""
+    openai_port, gemini_port = free_port(), free_port()
+    fakes.serve(fakes.fake_openai(first_token=0.1, token_delay=0, faults=openai_faults), openai_port)
+    fakes.serve(fakes.fake_gemini(GEMINI_ANSWER, delay=0.15, faults=gemini_faults), gemini_port)
+    os.environ.update(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{openai_port}/v1",
+        GEMINI_BASE_URL=f"http://127.0.0.1:{gemini_port}",
+    )
+    defaults = dict(UPSTREAM_TIMEOUT=1.0, UPSTREAM_RETRIES=2, UPSTREAM_DEADLINE=3.0, CIRCUIT_FAILURES=5,
+                    CIRCUIT_RESET=30.0, LLM_HEDGE=False, LLM_FAILOVER=False, HEDGE_DELAY=0.5)
+    for name, value in {**defaults, **settings}.items():
+        setattr(tds_app, name, value)
+    return tds_app.TDSVirtualTA()
+
+
+async def run(virtual_ta, fakes, questions, requests, concurrency, warmup=0):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, sources = [], {'openai': 0, 'gemini': 0, 'fallback': 0}
+
+    async def one(i, record=True):
+        async with semaphore:
+            start = time.perf_counter()
+            answer = await virtual_ta.agenerate_answer(questions[i % len(questions)], [], context_text="")
+            if record:
+                latencies.append(time.perf_counter() - start)
+                source = 'openai' if answer == fakes.ANSWER else 'gemini' if answer == GEMINI_ANSWER else 'fallback'
+                sources[source] += 1
+
+    # Warm-up requests fill the latency window that hedging delays come from
+    await asyncio.gather(*(one(i, record=False) for i in range(warmup)))
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, sources
+
+
+def report(scenario, variant, latencies, sources):
+    ms = np.array(latencies) * 1000
+    print(f"{scenario:>10} {variant:>20} {np.percentile(ms, 50):>7.0f}ms {np.percentile(ms, 95):>7.0f}ms "
+          f"{np.percentile(ms, 99):>7.0f}ms {ms.max():>7.0f}ms {sources['openai']:>7} {sources['gemini']:>7} "
+          f"{sources['fallback']:>8}")
+
+
+async def main_async(args):
+    import app as tds_app
+    import fake_upstreams as fakes
+    from answer_cache import AnswerCache
+    from bench_hybrid import load_questions
+
+    tds_app.answer_cache = AnswerCache(max_entries=0)
+    questions = [question for question, _ in load_questions(args.questions)]
+    Faults = fakes.Faults
+    never = 10 ** 6  # a circuit breaker threshold that is never reached
+    scenarios = [
+        ('healthy', 'default', Faults(), {}),
+        ('slow tail', 'no hedging', Faults(args.slow_rate, 3.0, seed=1), dict(UPSTREAM_TIMEOUT=5.0, UPSTREAM_DEADLINE=10.0)),
+        ('slow tail', 'hedge at p95', Faults(args.slow_rate, 3.0, seed=1),
+         dict(UPSTREAM_TIMEOUT=5.0, UPSTREAM_DEADLINE=10.0, LLM_HEDGE=True, LLM_FAILOVER=True)),
+        ('errors', 'no retries', Faults(error_rate=args.error_rate, seed=2), dict(UPSTREAM_RETRIES=0, CIRCUIT_FAILURES=never)),
+        ('errors', 'jittered retries', Faults(error_rate=args.error_rate, seed=2), dict(CIRCUIT_FAILURES=never)),
+        ('stalled', 'no breaker', Faults(1.0, 30.0), dict(CIRCUIT_FAILURES=never)),
+        ('stalled', 'breaker', Faults(1.0, 30.0), {}),
+        ('stalled', 'breaker + failover', Faults(1.0, 30.0), dict(LLM_FAILOVER=True)),
+        ('outage', 'no breaker', Faults(error_rate=1.0), dict(CIRCUIT_FAILURES=never)),
+        ('outage', 'breaker', Faults(error_rate=1.0), {}),
+    ]
+    print(f"{args.requests} requests per run, concurrency {args.concurrency}, "
+          f"OpenAI 100ms, Gemini 150ms, per-attempt timeout 1s unless stated")
+    print(f"{'scenario':>10} {'variant':>20} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} "
+          f"{'openai':>7} {'gemini':>7} {'fallback':>8}")
+    for scenario, variant, faults, settings in scenarios:
+        virtual_ta = configure(tds_app, fakes, faults, **settings)
+        warmup = 40 if settings.get('LLM_HEDGE') else 0
+        latencies, sources = await run(virtual_ta, fakes, questions, args.requests, args.concurrency, warmup)
+        report(scenario, variant, latencies, sources)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark upstream timeouts, retries, circuit breaking and hedging")
+    parser.add_argument("--questions", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_questions.yaml"))
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    args = parser.parse_args()
+    os.environ.update(OPENAI_API_KEY="fake", GEMINI_API_KEY="fake", INDEX_WATCH_INTERVAL="0")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Local fake upstream servers for benchmarks.
+
+``fake_openai`` answers POST /v1/chat/completions like the OpenAI API, both
+plain and with ``stream: true`` (Server-Sent Events chunks ending in
+``data: [DONE]``). Latency and failures are configurable, including a
+fraction of slow requests and of errors (503 by default), so the app can be exercised
+end to end without network access: point the SDK at it with
+``OPENAI_BASE_URL=http://127.0.0.1:<port>/v1``.
+
+``fake_gemini`` answers ``generateContent`` like the Gemini REST API
+(``GEMINI_BASE_URL=http://127.0.0.1:<port>`` makes the app use it).
+
+``serve`` runs any ASGI app with uvicorn on a background thread.
+
+Usage:
+    python benchmarks/fake_upstreams.py --port 8001 --first-token 0.3 --token-delay 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = (
+    "You can find this in the course material and the linked Discourse threads. "
+    "Check the deadlines on the course page and ask on Discourse if anything is unclear."
+)
+
+
+class Faults:
+    """Random slow requests and errors: ``slow_rate`` of requests take ``slow_delay`` more
+    seconds (e.g. longer than the client's timeout), ``error_rate`` get an ``error_status``
+    (503 by default)"""
+
+    def __init__(self, slow_rate=0.0, slow_delay=5.0, error_rate=0.0, seed=0, error_status=503):
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+
+    async def delay(self):
+        if self.slow_rate and self.random.random() < self.slow_rate:
+            await asyncio.sleep(self.slow_delay)
+
+    def error(self):
+        if self.error_rate and self.random.random() < self.error_rate:
+            return JSONResponse({"error": {"code": self.error_status, "message": "fake upstream error"}},
+                                status_code=self.error_status)
+        return None
+
+
+def fake_openai(answer=ANSWER, first_token=0.3, token_delay=0.02, fail_after=None, faults=None):
+    """FastAPI app imitating the chat completions endpoint.
+
+    first_token: seconds before the first chunk (or before the whole answer
+    when not streaming). token_delay: seconds between chunks. fail_after:
+    drop the connection after this many chunks (streaming) or answer 500
+    (not streaming). faults: a Faults for random slowness and 503s.
+    """
+    app = FastAPI()
+    app.state.requests = 0
+    faults = faults or Faults()
+    tokens = answer.split(" ")
+    tokens = [token + " " for token in tokens[:-1]] + tokens[-1:]
+
+    def chunk(model, content=None, finish_reason=None):
+        delta = {"content": content} if content is not None else {}
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        model = body.get("model", "fake")
+        error = faults.error()
+        if error is not None:
+            return error
+        await faults.delay()
+        if not body.get("stream"):
+            await asyncio.sleep(first_token + token_delay * len(tokens))
+            if fail_after is not None:
+                return JSONResponse({"error": {"message": "fake upstream failure"}}, status_code=500)
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            }
+
+        async def events():
+            await asyncio.sleep(first_token)
+            for i, token in enumerate(tokens):
+                if fail_after is not None and i >= fail_after:
+                    raise RuntimeError("fake upstream failure")  # uvicorn drops the connection
+                yield f"data: {json.dumps(chunk(model, token))}\n\n"
+                await asyncio.sleep(token_delay)
+            yield f"data: {json.dumps(chunk(model, finish_reason='stop'))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def fake_gemini(description="A screenshot of a terminal showing a Python traceback.", delay=0.2, fail=False,
+                faults=None):
+    """FastAPI app imitating Gemini's POST /v1beta/models/{model}:generateContent.
+
+    delay: seconds before answering. fail: answer 500 instead. faults: a
+    Faults for random slowness and 503s.
+    """
+    app = FastAPI()
+    app.state.requests = 0
+    faults = faults or Faults()
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def generate_content(model: str):
+        app.state.requests += 1
+        error = faults.error()
+        if error is not None:
+            return error
+        await faults.delay()
+        await asyncio.sleep(delay)
+        if fail:
+            return JSONResponse({"error": {"code": 500, "message": "fake upstream failure"}}, status_code=500)
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": description}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+        }
+
+    return app
+
+
+def serve(app, port, host="127.0.0.1"):
+    """Run an ASGI app on a daemon thread; returns the uvicorn server once it is accepting connections"""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="critical"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--fail-after", type=int, default=None)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests delayed by --slow-delay")
+    parser.add_argument("--slow-delay", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+    faults = Faults(args.slow_rate, args.slow_delay, args.error_rate)
+    uvicorn.run(fake_openai(first_token=args.first_token, token_delay=args.token_delay, fail_after=args.fail_after,
+                            faults=faults),
+                host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""Benchmark suite with JSON results and a regression check; runs offline on CPU.
+
+Suites (all by default, or a subset with ``--suites``):
+
+- ``build``: TDSDataProcessor.build_search_index on data/processed_data.json
+  (scale 1) and on synthetic scale-ups (``--scales``: copies of the real
+  documents with their own URLs and content, see bench_documents.py);
+- ``load``: load_processed_data of the same files, cold (parse the JSON,
+  build and save the index) and warm (memory-mapped index);
+- ``search``: p50/p99 latency and sequential throughput of
+  TDSDataProcessor.search per retrieval backend and scale, using the
+  questions of benchmarks/eval_questions.yaml as queries;
+- ``quality``: recall@1/3/5 and MRR per backend on the same questions
+  (bundled data only, see bench_hybrid.py);
+- ``e2e``: POST /api/ latency and throughput, in process, with the app
+  pointed at local fake OpenAI and Gemini servers (fake_upstreams.py) and
+  its answer and image caches disabled, so every request goes upstream.
+
+Every metric is written to ``--out`` as ``{"value", "unit", "better"}``
+under a flat name such as ``search.x10.bm25.p50_ms``. With ``--baseline``
+(or ``--compare OLD NEW`` without running anything) each metric present in
+both files is checked: a timing or throughput that is worse by more than
+``--threshold`` (relative), or a recall/MRR lower by more than
+``--quality-drop`` (absolute), is a regression and the exit status is 1.
+
+Usage:
+    python benchmarks/run.py --out baseline.json
+    python benchmarks/run.py --out current.json --baseline baseline.json --threshold 0.25
+    python benchmarks/run.py --suites build search --scales 1 10 100
+    python benchmarks/run.py --compare baseline.json current.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from bench_documents import synthetic_documents
+from bench_hybrid import evaluate, load_questions
+from data_processor import TDSDataProcessor
+from hybrid import BACKENDS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITES = ('build', 'load', 'search', 'quality', 'e2e')
+
+
+class Results:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, better='lower'):
+        self.metrics[name] = {'value': round(float(value), 6), 'unit': unit, 'better': better}
+        print(f"  {name:<40} {value:>12.4f} {unit}")
+
+
+def median_seconds(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def write_data(path, documents):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'course_data': [doc for doc in documents if doc.get('type') == 'course'],
+            'discourse_data': [doc for doc in documents if doc.get('type') != 'course'],
+        }, f, ensure_ascii=False)
+
+
+def prepare_data(data_file, scales, directory):
+    """scale -> path of a data file in ``directory``; scale 1 is a copy of the real data"""
+    with open(data_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    size = len(data['course_data']) + len(data['discourse_data'])
+    paths = {}
+    for scale in scales:
+        path = os.path.join(directory, f'x{scale}', 'processed_data.json')
+        os.makedirs(os.path.dirname(path))
+        if scale == 1:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+        else:
+            write_data(path, synthetic_documents(data_file, size * scale))
+        paths[scale] = path
+    return paths
+
+
+def bench_build(results, paths, args):
+    for scale, path in paths.items():
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        def build():
+            processor = TDSDataProcessor()
+            processor.course_data = list(data['course_data'])
+            processor.discourse_data = list(data['discourse_data'])
+            processor.build_search_index()
+
+        results.add(f'build.x{scale}.seconds', median_seconds(build, args.repeat), 's')
+
+
+def bench_load(results, paths, args):
+    for scale, path in paths.items():
+        start = time.perf_counter()
+        TDSDataProcessor().load_processed_data(path)  # no index yet: parse, build and save it
+        results.add(f'load.x{scale}.cold_seconds', time.perf_counter() - start, 's')
+        warm = median_seconds(lambda: TDSDataProcessor().load_processed_data(path), args.repeat)
+        results.add(f'load.x{scale}.warm_ms', warm * 1000, 'ms')
+
+
+def bench_search(results, paths, questions, args):
+    queries = [question for question, _ in questions] * args.rounds
+    for scale, path in paths.items():
+        processor = TDSDataProcessor()
+        processor.load_processed_data(path)
+        for backend in BACKENDS:
+            processor.search(queries[0], 5, backend=backend)  # lazily built structures are not part of the timing
+            latencies = []
+            wall = time.perf_counter()
+            for query in queries:
+                start = time.perf_counter()
+                processor.search(query, 5, backend=backend)
+                latencies.append(time.perf_counter() - start)
+            wall = time.perf_counter() - wall
+            results.add(f'search.x{scale}.{backend}.p50_ms', np.percentile(latencies, 50) * 1000, 'ms')
+            results.add(f'search.x{scale}.{backend}.p99_ms', np.percentile(latencies, 99) * 1000, 'ms')
+            results.add(f'search.x{scale}.{backend}.qps', len(queries) / wall, 'queries/s', 'higher')
+
+
+def bench_quality(results, path, questions):
+    processor = TDSDataProcessor()
+    processor.load_processed_data(path)
+    for backend in BACKENDS:
+        recall, mrr, _, _ = evaluate(processor, questions, backend)
+        for k, value in recall.items():
+            results.add(f'quality.{backend}.recall@{k}', value, 'fraction', 'higher')
+        results.add(f'quality.{backend}.mrr', mrr, 'fraction', 'higher')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def sample_image():
+    import base64
+    import io
+
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def bench_e2e(results, path, questions, args):
+    openai_port, gemini_port = free_port(), free_port()
+    # Read when the app module creates its clients, so set before importing it
+    os.environ.update(
+        OPENAI_API_KEY="fake",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{openai_port}/v1",
+        GEMINI_API_KEY="fake",
+        GEMINI_BASE_URL=f"http://127.0.0.1:{gemini_port}",
+        DATA_FILE=path,
+        INDEX_WATCH_INTERVAL="0",
+    )
+    import httpx
+
+    import app as tds_app
+    from answer_cache import AnswerCache
+    from fake_upstreams import fake_gemini, fake_openai, serve
+    from image_pipeline import ImageDescriptionCache
+
+    openai_server = fake_openai(first_token=args.llm_delay, token_delay=0)
+    gemini_server = fake_gemini(delay=args.vision_delay)
+    serve(openai_server, openai_port)
+    serve(gemini_server, gemini_port)
+    tds_app.processor.load_processed_data(path)
+    tds_app.answer_cache = AnswerCache(max_entries=0)
+    tds_app.image_cache = ImageDescriptionCache(max_entries=0)
+    fallbacks = tds_app.answers_total.labels("fallback")
+    fallbacks_before = fallbacks.get()
+    image = sample_image()
+
+    async def run():
+        latencies = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+        transport = httpx.ASGITransport(app=tds_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def one(i):
+                payload = {"question": questions[i % len(questions)][0]}
+                if args.image_every and i % args.image_every == 0:
+                    payload["image"] = image
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/api/", json=payload)
+                    latencies.append(time.perf_counter() - start)
+                    response.raise_for_status()
+
+            await one(0)  # warm-up
+            latencies.clear()
+            wall = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.requests)))
+            return latencies, time.perf_counter() - wall
+
+    latencies, wall = asyncio.run(run())
+    results.add('e2e.api.p50_ms', np.percentile(latencies, 50) * 1000, 'ms')
+    results.add('e2e.api.p99_ms', np.percentile(latencies, 99) * 1000, 'ms')
+    results.add('e2e.api.rps', args.requests / wall, 'requests/s', 'higher')
+    results.add('e2e.api.fallback_answers', fallbacks.get() - fallbacks_before, 'answers')
+    print(f"  fake upstream requests: openai={openai_server.state.requests} gemini={gemini_server.state.requests}")
+
+
+def compare(baseline, current, threshold, quality_drop):
+    """Print old vs new for every shared metric; returns the names of regressed metrics"""
+    regressions = []
+    print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, new in current['metrics'].items():
+        old = baseline['metrics'].get(name)
+        if old is None:
+            print(f"{name:<40} {'-':>12} {new['value']:>12.4f}      new")
+            continue
+        before, after = old['value'], new['value']
+        change = (after - before) / before if before else 0.0
+        if new['unit'] == 'fraction':
+            regressed = after < before - quality_drop if new['better'] == 'higher' else after > before + quality_drop
+        elif new['better'] == 'higher':
+            regressed = after < before * (1 - threshold)
+        else:
+            regressed = after > before * (1 + threshold)
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<40} {before:>12.4f} {after:>12.4f} {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    for name in baseline['metrics'].keys() - current['metrics'].keys():
+        print(f"{name:<40} {baseline['metrics'][name]['value']:>12.4f} {'-':>12}  missing")
+    return regressions
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count(),
+        'numpy': np.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite and check for regressions")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--data", default=os.path.join(ROOT, "data", "processed_data.json"))
+    parser.add_argument("--questions", default=os.path.join(ROOT, "benchmarks", "eval_questions.yaml"))
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10],
+                        help="Corpus sizes as multiples of the bundled data")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per build/load timing (median is reported)")
+    parser.add_argument("--rounds", type=int, default=20, help="Passes over the questions per search timing")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="Fake OpenAI response time in seconds")
+    parser.add_argument("--vision-delay", type=float, default=0.05, help="Fake Gemini response time in seconds")
+    parser.add_argument("--image-every", type=int, default=4, help="Attach an image to every Nth request (0 = never)")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Results file to check this run against")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Only compare two results files")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative slowdown (or throughput loss) before a metric counts as regressed")
+    parser.add_argument("--quality-drop", type=float, default=0.0, help="Allowed absolute drop in recall and MRR")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold, args.quality_drop)
+        print(f"{len(regressions)} regressions")
+        sys.exit(1 if regressions else 0)
+
+    if 1 not in args.scales and ({'quality', 'e2e'} & set(args.suites)):
+        args.scales = [1, *args.scales]
+    questions = load_questions(args.questions)
+    results = Results()
+    with tempfile.TemporaryDirectory() as directory:
+        paths = prepare_data(args.data, sorted(set(args.scales)), directory)
+        for suite in SUITES:
+            if suite not in args.suites:
+                continue
+            print(f"{suite}:")
+            if suite == 'build':
+                bench_build(results, paths, args)
+            elif suite == 'load':
+                bench_load(results, paths, args)
+            elif suite == 'search':
+                bench_search(results, paths, questions, args)
+            elif suite == 'quality':
+                bench_quality(results, paths[1], questions)
+            else:
+                bench_e2e(results, paths[1], questions, args)
+
+    output = {
+        'environment': environment(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('out', 'baseline', 'compare')},
+        'metrics': results.metrics,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {len(results.metrics)} metrics to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, output, args.threshold, args.quality_drop)
+        print(f"{len(regressions)} regressions")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""Prompt context assembly: the best passages of the retrieved documents under a token budget.
+
+Documents are split into passages when the index is built. Each passage's
+token count, TF-IDF row and SimHash fingerprint are stored with it, so
+assembling the context for a request is one small sparse product and a
+greedy pass, with no tokenising or parsing on the request path. Saved into
+the index directory as a manifest component::
+
+    passages.npy, passage_offsets.npy      passage texts (a DocumentStore of JSON strings)
+    passage_doc_offsets.npy                 passages of document row i are [offsets[i], offsets[i + 1])
+    passage_tokens.npy                      token count per passage
+    passage_fingerprints.npy                64-bit SimHash per passage
+    passage_tfidf_{data,indices,indptr}.npy TF-IDF row per passage (CSR)
+"""
+import os
+import re
+
+import numpy as np
+from scipy import sparse
+
+import index_store
+from near_duplicates import normalise_text, simhash
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('cl100k_base')
+except Exception:  # not installed, or the encoding could not be loaded
+    _ENCODING = None
+
+PASSAGE_TOKENS = 120
+CONTEXT_TOKEN_BUDGET = 150
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def count_tokens(text):
+    """Tokens in text: exact with tiktoken, otherwise the usual ~4 characters per token"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, (len(text) + 3) // 4)
+
+
+def split_passages(text, max_tokens=PASSAGE_TOKENS):
+    """Split text into passages of at most max_tokens, on paragraph, then sentence, then word boundaries"""
+    passages, current, current_tokens = [], [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            passages.append(" ".join(current))
+        current, current_tokens = [], 0
+
+    for paragraph in re.split(r'\n\s*\n|\n', text):
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            sentence = " ".join(sentence.split())
+            if not sentence:
+                continue
+            tokens = count_tokens(sentence)
+            if tokens > max_tokens:
+                # One over-long sentence: cut it into word windows of about max_tokens
+                flush()
+                words = sentence.split()
+                step = max(1, len(words) * max_tokens // tokens)
+                passages.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+                continue
+            if current_tokens + tokens > max_tokens:
+                flush()
+            current.append(sentence)
+            current_tokens += tokens
+        flush()  # passages never span paragraphs
+    return passages
+
+
+def _hamming(a, b):
+    return bin(int(a) ^ int(b)).count('1')
+
+
+class _PassageSegment:
+    """Passages of a contiguous block of document rows"""
+    __slots__ = ('texts', 'doc_offsets', 'tokens', 'fingerprints', 'matrix')
+
+    def __init__(self, texts, doc_offsets, tokens, fingerprints, matrix):
+        self.texts = texts
+        self.doc_offsets = doc_offsets
+        self.tokens = tokens
+        self.fingerprints = fingerprints
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.doc_offsets) - 1
+
+    @classmethod
+    def build(cls, documents, vectorizer, max_tokens=PASSAGE_TOKENS):
+        texts, counts = [], []
+        for doc in documents:
+            passages = split_passages(doc['content'], max_tokens) or [doc['content']]
+            texts.extend(passages)
+            counts.append(len(passages))
+        doc_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=doc_offsets[1:])
+        return cls(
+            texts,
+            doc_offsets,
+            np.array([count_tokens(text) for text in texts], dtype=np.int32),
+            np.array([simhash(normalise_text(text)) for text in texts], dtype=np.uint64),
+            sparse.csr_matrix(vectorizer.transform(texts)) if texts else None,
+        )
+
+
+class PassageIndex:
+    """Precomputed passages for every document row of a search index.
+
+    Rows line up with SearchEngine rows; like the engine, updates append a
+    segment and return a new index (deleted rows are simply never asked for,
+    and are dropped on save).
+    """
+
+    def __init__(self, segments, max_tokens=PASSAGE_TOKENS):
+        self.segments = segments
+        self.starts = np.cumsum([0] + [len(segment) for segment in segments[:-1]])
+        self.max_tokens = max_tokens
+
+    @classmethod
+    def build(cls, documents, vectorizer, max_tokens=PASSAGE_TOKENS):
+        return cls([_PassageSegment.build(documents, vectorizer, max_tokens)], max_tokens)
+
+    def __len__(self):
+        return int(self.starts[-1]) + len(self.segments[-1])
+
+    def with_documents(self, documents, vectorizer):
+        """Return a new index with passages for rows appended after the current ones"""
+        documents = list(documents)
+        if not documents:
+            return self
+        return PassageIndex(self.segments + [_PassageSegment.build(documents, vectorizer, self.max_tokens)], self.max_tokens)
+
+    def _locate(self, doc_id):
+        i = int(np.searchsorted(self.starts, doc_id, side='right')) - 1
+        segment = self.segments[i]
+        row = doc_id - int(self.starts[i])
+        return segment, int(segment.doc_offsets[row]), int(segment.doc_offsets[row + 1])
+
+    def assemble(self, results, query_vector, budget, max_distance=3):
+        """Pick passages of the retrieved results for a prompt, within ``budget`` tokens.
+
+        Pass one adds the best passage of each result in rank order, pass
+        two fills the remaining budget with the next best passages overall
+        (those sharing at least one term with the query). A passage within
+        ``max_distance`` SimHash bits of one already chosen is merged into it,
+        i.e. left out and counted as merged. Returns
+        ``[(result, [passage, ...]), ...]`` in rank order, passages in
+        document order, plus the token count and number of merged passages.
+        """
+        # Passage rows of every result, grouped by segment so each segment is scored with one product
+        by_segment = {}
+        for rank, result in enumerate(results):
+            doc_id = result.get('doc_id')
+            if doc_id is None or not 0 <= doc_id < len(self):
+                continue
+            segment, start, end = self._locate(doc_id)
+            by_segment.setdefault(id(segment), (segment, []))[1].extend(
+                (rank, position, start + position) for position in range(end - start)
+            )
+        candidates = []  # (similarity, rank, position, segment, passage index)
+        for segment, rows in by_segment.values():
+            if query_vector is not None and segment.matrix is not None:
+                passages = segment.matrix[[i for _, _, i in rows]]
+                similarities = np.asarray((passages @ query_vector.T).todense()).ravel()
+            else:
+                similarities = np.zeros(len(rows))
+            candidates.extend(
+                (float(similarity), rank, position, segment, i)
+                for (rank, position, i), similarity in zip(rows, similarities)
+            )
+
+        best_first = sorted(candidates, key=lambda c: (-c[0], c[1], c[2]))
+        leaders = {}
+        for candidate in best_first:
+            leaders.setdefault(candidate[1], candidate)
+        ordered = sorted(leaders.values(), key=lambda c: c[1]) + [
+            c for c in best_first if leaders[c[1]] is not c and c[0] > 0
+        ]
+
+        chosen, fingerprints, headed = [], [], set()
+        used = merged = 0
+        for candidate in ordered:
+            _, rank, position, segment, i = candidate
+            fingerprint = segment.fingerprints[i]
+            if any(_hamming(fingerprint, other) <= max_distance for other in fingerprints):
+                merged += 1
+                continue
+            # The first passage of a document also pays for its "Source:" header
+            tokens = int(segment.tokens[i])
+            if rank not in headed:
+                tokens += count_tokens(context_header(results[rank]))
+            if used + tokens > budget:
+                continue
+            chosen.append(candidate)
+            fingerprints.append(fingerprint)
+            headed.add(rank)
+            used += tokens
+
+        by_rank = {}
+        for _, rank, position, segment, i in sorted(chosen, key=lambda c: (c[1], c[2])):
+            by_rank.setdefault(rank, []).append(segment.texts[i])
+        return [(results[rank], passages) for rank, passages in sorted(by_rank.items())], used, merged
+
+    def compact(self, deleted=None):
+        """Return a single-segment index holding only rows not marked in ``deleted``"""
+        if deleted is None and len(self.segments) == 1:
+            return self
+        live = np.flatnonzero(~deleted) if deleted is not None else np.arange(len(self))
+        texts, counts, tokens, fingerprints, rows = [], [], [], [], []
+        for doc_id in live:
+            segment, start, end = self._locate(int(doc_id))
+            texts.extend(segment.texts[i] for i in range(start, end))
+            counts.append(end - start)
+            tokens.append(segment.tokens[start:end])
+            fingerprints.append(segment.fingerprints[start:end])
+            if segment.matrix is not None:
+                rows.append(segment.matrix[start:end])
+        doc_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=doc_offsets[1:])
+        segment = _PassageSegment(
+            texts,
+            doc_offsets,
+            np.concatenate(tokens).astype(np.int32) if tokens else np.empty(0, dtype=np.int32),
+            np.concatenate(fingerprints).astype(np.uint64) if fingerprints else np.empty(0, dtype=np.uint64),
+            sparse.vstack(rows, format='csr') if rows else None,
+        )
+        return PassageIndex([segment], self.max_tokens)
+
+    def save(self, directory):
+        """Write the passage files into an index directory; returns its manifest entry.
+
+        Compact first (``compact(engine.deleted)``) so rows match the saved engine.
+        """
+        segment = self.compact().segments[0]
+        index_store.save_documents(directory, segment.texts, 'passages.npy', 'passage_offsets.npy')
+        np.save(os.path.join(directory, 'passage_doc_offsets.npy'), segment.doc_offsets)
+        np.save(os.path.join(directory, 'passage_tokens.npy'), segment.tokens)
+        np.save(os.path.join(directory, 'passage_fingerprints.npy'), segment.fingerprints)
+        if segment.matrix is not None:
+            index_store.save_csr(directory, 'passage_tfidf', segment.matrix)
+        return {
+            'max_tokens': self.max_tokens,
+            'passages': len(segment.texts),
+            'shape': list(segment.matrix.shape) if segment.matrix is not None else None,
+            'tokenizer': 'cl100k_base' if _ENCODING is not None else 'chars/4',
+        }
+
+    @classmethod
+    def load(cls, directory, config, mmap_mode='r'):
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+        segment = _PassageSegment(
+            index_store.load_documents(directory, 'passages.npy', 'passage_offsets.npy', mmap_mode),
+            load('passage_doc_offsets.npy'),
+            load('passage_tokens.npy'),
+            load('passage_fingerprints.npy'),
+            index_store.load_csr(directory, 'passage_tfidf', config['shape'], mmap_mode) if config['shape'] else None,
+        )
+        return cls([segment], config['max_tokens'])
+
+
+def context_header(result):
+    """First line of a source block; the title is left out when the content already starts with it"""
+    source = result.get('source', 'Unknown')
+    title = result.get('title') or result.get('section')
+    if not title or result.get('content', '').startswith(title):
+        return f"Source: {source}"
+    return f"Source: {source} - {title}"
+
+
+def format_context(selection):
+    """Prompt text for assembled passages, one block per source document"""
+    return "\n\n".join(
+        context_header(result) + "\n" + "\n...\n".join(passages) for result, passages in selection
+    )
+
+
+def format_documents(results, budget):
+    """Context from whole documents in rank order, cut at the token budget (no passage index)"""
+    selection, used = [], 0
+    for result in results:
+        tokens = count_tokens(context_header(result)) + count_tokens(result['content'])
+        if used + tokens > budget:
+            if used:
+                break
+            return [(result, [result['content'][:budget * 4]])], budget
+        selection.append((result, [result['content']]))
+        used += tokens
+    return selection, used
@@ -1,13 +1,181 @@
+import hashlib
 import json
 import re
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import argparse
+import os
 import numpy as np
-import pickle
+import index_store
+from context_builder import CONTEXT_TOKEN_BUDGET, PassageIndex, format_context, format_documents
+from document_store import ColumnarDocuments
+from facets import FacetIndex
+from hybrid import BACKENDS, HybridRetriever
+from near_duplicates import NearDuplicateIndex
+from retrieval import SearchEngine
+
+def _iter_json_array(f, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Expected a JSON array")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            if not buffer:
+                raise json.JSONDecodeError("Need more data", buffer, 0)
+            record, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        yield record
+        buffer = buffer[end:]
+
+def iter_posts(path):
+    """Yield scraped post records from a JSONL file or a legacy JSON array file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if not first:
+            return
+        f.seek(0)
+        if first == '[':
+            yield from _iter_json_array(f)
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ Skipping malformed record in {path}")
+
+def dedupe_posts(posts):
+    """Drop repeated posts, keeping the first record seen for each URL"""
+    seen = set()
+    for post in posts:
+        url = post.get('url')
+        if url:
+            if url in seen:
+                continue
+            seen.add(url)
+        yield post
+
+def iter_chunks(items, size):
+    """Group an iterable into lists of at most size items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+UPDATE_COUNTS = ('added', 'replaced', 'deleted', 'unchanged')
+
+def add_update(summary, update):
+    """Accumulate an ``update_documents`` summary into ``summary``: counts are summed, refit is or-ed"""
+    for name in UPDATE_COUNTS:
+        summary[name] = summary.get(name, 0) + update[name]
+    summary['refit'] = summary.get('refit', False) or update['refit']
+    return summary
+
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'body', 'dd', 'details', 'div', 'dl', 'dt',
+    'figcaption', 'figure', 'footer', 'form', 'header', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+    'section', 'summary', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul', 'br', 'hr',
+}
+SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'head', 'button'}
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+def _iter_course_blocks(root):
+    """Yield (section, text) for every leaf-level text block, in document order, in one pass"""
+    section = "General"
+    parts = []
+    
+    def flush():
+        text = " ".join("".join(parts).split())
+        parts.clear()
+        return text
+    
+    # Iterative walk; the flag marks block elements, whose text ends at their closing tag
+    stack = [(iter(root.children), False)]
+    while stack:
+        children, is_block = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if is_block:
+                text = flush()
+                if text:
+                    yield section, text
+            continue
+        if isinstance(child, NavigableString):
+            if type(child) is NavigableString:  # skip comments, doctypes, CDATA
+                parts.append(str(child))
+            continue
+        if child.name in SKIP_TAGS:
+            continue
+        if child.name in HEADING_TAGS:
+            text = flush()
+            if text:
+                yield section, text
+            section = child.get_text().strip() or section
+            continue
+        if child.name in BLOCK_TAGS:
+            text = flush()
+            if text:
+                yield section, text
+        stack.append((iter(child.children), child.name in BLOCK_TAGS))
+    
+    text = flush()
+    if text:
+        yield section, text
+
+def _chunk_blocks(blocks, max_tokens):
+    """Merge consecutive blocks of the same section into chunks of at most max_tokens words"""
+    chunk, chunk_section, chunk_tokens = [], None, 0
+    for section, text in blocks:
+        words = text.split()
+        if chunk and (section != chunk_section or chunk_tokens + len(words) > max_tokens):
+            yield chunk_section, " ".join(chunk)
+            chunk, chunk_tokens = [], 0
+        # A single block longer than the budget is split on word boundaries
+        while len(words) > max_tokens:
+            yield section, " ".join(words[:max_tokens])
+            words = words[max_tokens:]
+        if words:
+            chunk.append(" ".join(words))
+            chunk_section, chunk_tokens = section, chunk_tokens + len(words)
+    if chunk:
+        yield chunk_section, " ".join(chunk)
 
 class TDSDataProcessor:
-    def __init__(self):
+    def __init__(self, backend='tfidf', embedding_model=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown retrieval backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+        # Default backend for search(); 'bm25', 'dense' and 'hybrid' use self.hybrid
+        self.backend = backend
+        # sentence-transformers model for dense retrieval; LSA over TF-IDF when None
+        self.embedding_model = embedding_model
         self.vectorizer = TfidfVectorizer(
             max_features=5000,
             stop_words='english',
@@ -16,121 +184,464 @@ class TDSDataProcessor:
         self.course_data = []
         self.discourse_data = []
         self.all_texts = []
-        self.tfidf_matrix = None
+        self.engine = None
+        self.hybrid = None
+        self.passages = None
+        self.facets = None
+        self.index_version = None
+        self.index_dir = None
+        self._doc_keys = None
+        # Vocabulary drift since the last full fit, used to decide when to refit
+        self.drift = self._new_drift_stats(0, 0.0)
+    
+    @property
+    def tfidf_matrix(self):
+        """TF-IDF rows of the current index (None until an index is built or loaded)"""
+        return self.engine.matrix if self.engine is not None else None
         
-    def process_course_html(self, html_file):
-        """Process course HTML dump"""
+    def process_course_html(self, html_file, max_tokens=200, parser=None):
+        """Process course HTML dump.
+
+        The page is walked once. Only leaf-level text blocks are emitted (a
+        parent ``div`` no longer repeats the text of everything nested in it).
+        Consecutive blocks under the same heading are merged into chunks of up
+        to ``max_tokens`` words, and exact or near-duplicate chunks are dropped.
+        """
         with open(html_file, 'r', encoding='utf-8') as f:
             html_content = f.read()
         
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Extract course sections
-        sections = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
-        content_blocks = soup.find_all(['p', 'div', 'li', 'td'])
-        
-        current_section = "General"
+        soup = BeautifulSoup(html_content, parser or HTML_PARSER)
+        seen = NearDuplicateIndex()
         
-        for element in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'div', 'li']):
-            if element.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                current_section = element.get_text().strip()
+        for section, text in _chunk_blocks(_iter_course_blocks(soup), max_tokens):
+            if len(text) > 20 and seen.add(text):  # Filter out short snippets and duplicates
+                self.course_data.append({
+                    'type': 'course',
+                    'section': section,
+                    'content': text,
+                    'source': 'TDS Course Content'
+                })
+    
+    def process_discourse_posts(self, json_file, incremental=False, chunk_size=1000, refit_threshold=0.2, refit_min_fraction=0.05):
+        """Process discourse posts (JSONL or JSON array), streaming records in chunks.
+
+        Posts are read one record at a time and deduplicated by URL. Cleaned
+        documents are handed on in chunks: appended to ``discourse_data`` for a
+        full build, or applied with ``update_documents`` when ``incremental``.
+        Returns a summary of what was ingested.
+
+        Only the incremental mode keeps memory flat: the index grows by the new
+        rows, and at most one chunk of staged documents is held at a time. A
+        full build stages every document in ``discourse_data``, because the
+        TF-IDF vocabulary, the BM25 and dense indexes and the passage index
+        are all fitted over the whole corpus. Its peak memory grows with the
+        corpus; reading the input is what no longer does.
+        """
+        summary = {'documents': 0, 'chunks': 0}
+        if incremental:
+            summary.update(dict.fromkeys(UPDATE_COUNTS, 0), refit=False)
+        for chunk in iter_chunks(self.discourse_documents(iter_posts(json_file)), chunk_size):
+            if incremental:
+                add_update(summary, self.update_documents(chunk, refit_threshold=refit_threshold, refit_min_fraction=refit_min_fraction))
             else:
-                text = element.get_text().strip()
-                if len(text) > 20:  # Filter out short snippets
-                    self.course_data.append({
-                        'type': 'course',
-                        'section': current_section,
-                        'content': text,
-                        'source': 'TDS Course Content'
-                    })
-    
-    def process_discourse_posts(self, json_file):
-        """Process discourse posts JSON"""
-        with open(json_file, 'r', encoding='utf-8') as f:
-            posts = json.load(f)
-        
-        for post in posts:
+                self.discourse_data.extend(chunk)
+            summary['documents'] += len(chunk)
+            summary['chunks'] += 1
+        return summary
+    
+    def discourse_documents(self, posts):
+        """Turn raw scraped posts into indexable documents"""
+        for post in dedupe_posts(posts):
             content = post.get('content', '') or post.get('title', '')
             if len(content) > 20:
-                self.discourse_data.append({
+                yield {
                     'type': 'discourse',
                     'title': post.get('title', ''),
                     'content': content,
                     'url': post.get('url', ''),
-                    'date': post.get('date', ''),
+                    'date': post.get('date') or post.get('created_at', ''),
                     'source': 'Discourse Post'
-                })
+                }
     
     def build_search_index(self):
-        """Build TF-IDF search index"""
+        """Build TF-IDF search index.
+
+        The staged ``course_data``/``discourse_data`` dicts are moved into a
+        columnar store (``self.engine.documents``) and the lists emptied, as
+        after ``load_index``; the built documents are returned. Every staged
+        document is in memory during the fit (see ``process_discourse_posts``).
+        """
         all_data = self.course_data + self.discourse_data
-        self.all_texts = [item['content'] for item in all_data]
+        texts = [item['content'] for item in all_data]
         
-        if self.all_texts:
-            self.tfidf_matrix = self.vectorizer.fit_transform(self.all_texts)
+        if texts:
+            documents = ColumnarDocuments.from_dicts(all_data)
+            matrix = self.vectorizer.fit_transform(texts)
+            self.engine = SearchEngine(matrix, documents)
+            self.hybrid = HybridRetriever.build(texts, documents, matrix, self.vectorizer, self.embedding_model)
+            self.passages = PassageIndex.build(documents, self.vectorizer)
+            self.facets = FacetIndex.build(documents)
+            self.index_version = self._compute_index_version(texts)
+            self._doc_keys = None
+            self.drift = self._new_drift_stats(len(texts), self._held_out_oov_rate(texts[::max(1, len(texts) // 1000)], len(texts)))
+            self.course_data, self.discourse_data, self.all_texts = [], [], []
             return all_data
         return []
     
-    def search(self, query, top_k=5):
-        """Search for relevant content"""
-        if self.tfidf_matrix is None or self.tfidf_matrix.shape[0] == 0:
-            return []
+    @staticmethod
+    def _new_drift_stats(fit_documents, fit_oov_rate):
+        return {
+            'fit_documents': fit_documents,
+            'fit_oov_rate': fit_oov_rate,
+            'changed_documents': 0,
+            'new_tokens': 0,
+            'new_oov_tokens': 0,
+        }
+    
+    def _iter_words(self, texts):
+        """Analysed words of each text; bigrams are mostly out of vocabulary in any new text, so drift ignores them"""
+        analyzer = self.vectorizer.build_analyzer()
+        for text in texts:
+            yield [token for token in analyzer(text) if ' ' not in token]
+    
+    def _count_oov(self, texts):
+        """Count analysed words and how many fall outside the fitted vocabulary"""
+        vocabulary = self.vectorizer.vocabulary_
+        total = oov = 0
+        for tokens in self._iter_words(texts):
+            total += len(tokens)
+            oov += sum(1 for token in tokens if token not in vocabulary)
+        return total, oov
+    
+    def _held_out_oov_rate(self, texts, fit_documents):
+        """Leave-one-out estimate of the OOV rate of unseen text, from a sample of the fitted texts.
+
+        A fitted text has every frequent word in the vocabulary, so its own OOV
+        rate is near zero and any new text would look like drift. Held out from
+        the fit, a text would also miss the words no other document has, which
+        are the vocabulary words with a document frequency of 1.
+        """
+        vocabulary = self.vectorizer.vocabulary_
+        # TfidfVectorizer's smoothed idf = ln((1 + n) / (1 + df)) + 1
+        df = np.rint((1 + fit_documents) / np.exp(self.vectorizer.idf_ - 1) - 1)
+        total = oov = 0
+        for tokens in self._iter_words(texts):
+            total += len(tokens)
+            oov += sum(1 for token in tokens if token not in vocabulary or df[vocabulary[token]] <= 1)
+        return oov / total if total else 0.0
+    
+    def vocabulary_drift(self):
+        """How far the corpus has moved from the fitted vocabulary and IDF weights (0 = not at all)"""
+        drift = self.drift
+        changed = drift['changed_documents'] / max(drift['fit_documents'], 1)
+        oov_rate = drift['new_oov_tokens'] / drift['new_tokens'] if drift['new_tokens'] else drift['fit_oov_rate']
+        return max(changed, oov_rate - drift['fit_oov_rate'])
+    
+    def _document_keys(self):
+        """{document key: (row, content hash)} for the current index, loaded or computed on first use"""
+        if self._doc_keys is None:
+            keys = index_store.load_document_keys(self.index_dir) if self.index_dir else None
+            if keys is None or len(keys) != len(self.engine):
+                keys = {
+                    index_store.document_key(doc): (row, index_store.content_hash(doc))
+                    for row, doc in enumerate(self.engine.documents)
+                }
+            self._doc_keys = keys
+        return self._doc_keys
+    
+    def update_documents(self, documents, deleted_keys=(), refit_threshold=0.2, refit_min_fraction=0.05):
+        """Add, replace and delete documents without refitting the whole index.
+
+        Documents are matched by ``index_store.document_key`` (URL, or a hash of
+        section and content). New and changed documents are transformed with the
+        current vocabulary and IDF weights and appended to the engine as a new
+        segment; replaced and deleted rows are tombstoned. The work is
+        proportional to the number of changed documents. When vocabulary drift
+        since the last fit exceeds ``refit_threshold``, and the documents changed
+        since then are at least ``refit_min_fraction`` of the fitted corpus (a
+        few posts are too small a sample to judge drift), the index is refit
+        from scratch instead. Returns a summary dict.
+        """
+        documents = list(documents)
+        if self.engine is None:
+            self.course_data = [doc for doc in documents if doc['type'] == 'course']
+            self.discourse_data = [doc for doc in documents if doc['type'] == 'discourse']
+            self.build_search_index()
+            return {'added': len(documents), 'replaced': 0, 'deleted': 0, 'unchanged': 0, 'refit': True}
         
-        query_vector = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vector, self.tfidf_matrix)[0]
+        keys = self._document_keys()
+        upserts, tombstones = {}, []
+        replaced = unchanged = 0
+        for doc in documents:
+            key, digest = index_store.document_key(doc), index_store.content_hash(doc)
+            existing = keys.get(key)
+            if existing is not None and existing[1] == digest:
+                unchanged += 1
+                continue
+            if existing is not None and key not in upserts:
+                tombstones.append(existing[0])
+                replaced += 1
+            upserts[key] = (digest, doc)
+        deleted = 0
+        for key in deleted_keys:
+            existing = keys.get(key)
+            if existing is not None and key not in upserts:
+                tombstones.append(existing[0])
+                deleted += 1
+        summary = {'added': len(upserts) - replaced, 'replaced': replaced, 'deleted': deleted,
+                   'unchanged': unchanged, 'refit': False}
+        if not upserts and not tombstones:
+            return summary
         
-        # Get top k most similar documents
-        top_indices = similarities.argsort()[-top_k:][::-1]
+        new_docs = [doc for _, doc in upserts.values()]
+        new_texts = [doc['content'] for doc in new_docs]
+        tokens, oov = self._count_oov(new_texts)
+        self.drift['changed_documents'] += len(upserts) + deleted
+        self.drift['new_tokens'] += tokens
+        self.drift['new_oov_tokens'] += oov
         
-        all_data = self.course_data + self.discourse_data
-        results = []
+        enough_changes = self.drift['changed_documents'] >= refit_min_fraction * self.drift['fit_documents']
+        if enough_changes and self.vocabulary_drift() > refit_threshold:
+            _, live_docs = self.engine.with_updates(None, (), tombstones).compact()
+            all_docs = list(live_docs) + new_docs
+            self.course_data = [doc for doc in all_docs if doc['type'] == 'course']
+            self.discourse_data = [doc for doc in all_docs if doc['type'] == 'discourse']
+            self.build_search_index()
+            summary['refit'] = True
+            return summary
         
-        for idx in top_indices:
-            if similarities[idx] > 0.1:  # Minimum similarity threshold
-                item = all_data[idx].copy()
-                item['similarity'] = similarities[idx]
-                results.append(item)
+        matrix = self.vectorizer.transform(new_texts) if new_texts else None
+        first_row = len(self.engine)
+        new_docs = ColumnarDocuments.from_dicts(new_docs)
+        self.engine = self.engine.with_updates(matrix, new_docs, tombstones)
+        if self.hybrid is not None:
+            self.hybrid = self.hybrid.with_updates(new_texts, new_docs, matrix, tombstones)
+        if self.passages is not None:
+            self.passages = self.passages.with_documents(new_docs, self.vectorizer)
+        if self.facets is not None:
+            self.facets = self.facets.with_documents(new_docs)
+        for key in deleted_keys:
+            keys.pop(key, None)
+        digest = hashlib.sha1(str(self.index_version).encode('utf-8'))
+        for offset, (key, (doc_hash, _)) in enumerate(upserts.items()):
+            keys[key] = (first_row + offset, doc_hash)
+            digest.update(f"{key}\0{doc_hash}\0".encode('utf-8'))
+        for row in tombstones:
+            digest.update(f"-{row}".encode('utf-8'))
+        self.index_version = digest.hexdigest()[:16]
+        return summary
+
+    def _compute_index_version(self, texts):
+        """Content hash identifying this index; changes whenever the indexed documents change"""
+        digest = hashlib.sha1(repr(self.vectorizer.get_params()).encode('utf-8'))
+        for text in texts:
+            digest.update(text.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()[:16]
+    
+    def encode_query(self, query):
+        """TF-IDF vector for a query, reusable across search and the answer cache"""
+        return self.vectorizer.transform([query])
+    
+    def hybrid_retriever(self):
+        """BM25/dense retriever for the current index, built on first use if the index was saved without one"""
+        if self.hybrid is None:
+            documents = self.engine.documents
+            texts = documents.texts() if isinstance(documents, ColumnarDocuments) else [doc['content'] for doc in documents]
+            hybrid = HybridRetriever.build(
+                texts, documents, self.engine.matrix,
+                self.vectorizer, self.embedding_model
+            )
+            if self.engine.deleted is not None:
+                hybrid = hybrid.with_updates((), (), None, np.flatnonzero(self.engine.deleted))
+            self.hybrid = hybrid
+        return self.hybrid
+    
+    def passage_index(self):
+        """Passages of the current index, split on first use if the index was saved without them"""
+        if self.passages is None:
+            self.passages = PassageIndex.build(self.engine.documents, self.vectorizer)
+        return self.passages
+    
+    def facet_index(self):
+        """Type/section/date facets of the current index, built on first use if the index was saved without them"""
+        if self.facets is None:
+            self.facets = FacetIndex.build(self.engine.documents)
+        return self.facets
+    
+    def filter_mask(self, filters):
+        """Row mask for search filters (see facets.FacetIndex), or None when there are none"""
+        return self.facet_index().mask(filters) if filters else None
+    
+    def build_context(self, results, query_vector=None, budget=CONTEXT_TOKEN_BUDGET):
+        """Prompt context for search results: the passages most similar to the query within a token budget.
+
+        Returns a dict with the context ``text``, its passage ``tokens``, the
+        ``doc_ids`` it draws on, and the number of ``passages`` used and
+        near-duplicates ``merged``.
+        """
+        if self.engine is None or not results:
+            return {'text': '', 'tokens': 0, 'doc_ids': [], 'passages': 0, 'merged': 0}
+        if all(result.get('doc_id') is not None for result in results):
+            selection, tokens, merged = self.passage_index().assemble(results, query_vector, budget)
+        else:
+            selection, tokens = format_documents(results, budget)
+            merged = 0
+        return {
+            'text': format_context(selection),
+            'tokens': tokens,
+            'doc_ids': [result.get('doc_id') for result, _ in selection],
+            'passages': sum(len(passages) for _, passages in selection),
+            'merged': merged,
+        }
+    
+    def search(self, query, top_k=5, query_vector=None, backend=None, filters=None):
+        """Search for relevant content.
+
+        ``backend`` is one of ``BACKENDS`` (default ``self.backend``);
+        ``query_vector`` is the query's TF-IDF row, if already computed;
+        ``filters`` restricts the rows searched, e.g.
+        ``{'types': ['discourse'], 'date_from': '2025-01-01'}``.
+        """
+        if self.engine is None or len(self.engine) == 0:
+            return []
         
-        return results
+        mask = self.filter_mask(filters)
+        if mask is not None and not mask.any():
+            return []
+        if query_vector is None:
+            query_vector = self.encode_query(query)
+        backend = backend or self.backend
+        if backend == 'tfidf':
+            return self.engine.search(query_vector, top_k, mask)
+        return self.hybrid_retriever().search(query, top_k, backend, tfidf_vector=query_vector, mask=mask)
+
+    def search_batch(self, queries, top_k=5, query_matrix=None, backend=None, filters=None):
+        """Search for relevant content for many queries at once, all with the same filters"""
+        if self.engine is None or len(self.engine) == 0:
+            return [[] for _ in queries]
+        
+        mask = self.filter_mask(filters)
+        if mask is not None and not mask.any():
+            return [[] for _ in queries]
+        if query_matrix is None:
+            query_matrix = self.vectorizer.transform(queries)
+        backend = backend or self.backend
+        if backend == 'tfidf':
+            return self.engine.search_batch(query_matrix, top_k, mask)
+        return self.hybrid_retriever().search_batch(queries, top_k, backend, tfidf_matrix=query_matrix, mask=mask)
 
     
     def save_processed_data(self, filename):
         """Save processed data and search index"""
+        # The engine's documents are authoritative (course_data/discourse_data
+        # are not populated when the index was memory-mapped from disk)
+        documents = self.engine.compact()[1] if self.engine is not None else self.course_data + self.discourse_data
         data = {
-            'course_data': self.course_data,
-            'discourse_data': self.discourse_data
+            'course_data': [dict(doc) for doc in documents if doc['type'] == 'course'],
+            'discourse_data': [dict(doc) for doc in documents if doc['type'] == 'discourse']
         }
         
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
         
-        # Save vectorizer and matrix
-        with open('search_index.pkl', 'wb') as f:
-            pickle.dump({
-                'vectorizer': self.vectorizer,
-                'tfidf_matrix': self.tfidf_matrix,
-                'all_data': self.course_data + self.discourse_data
-            }, f)
+        self.save_index(filename)
+    
+    def save_index(self, data_file):
+        """Save the search index next to the data file it was built from"""
+        if self.engine is None:
+            return
+        # Deleted rows are dropped on save, so row numbers change: rebuild the key map on next use
+        matrix, documents = self.engine.compact()
+        self.index_dir = index_store.index_dir_for(data_file)
+        index_store.save_index(
+            self.index_dir, self.vectorizer, matrix, documents, self.index_version,
+            source_file=data_file, extra={'drift': self.drift},
+            components={
+                name: component for name, component in (
+                    ('hybrid', self.hybrid),
+                    ('passages', self.passages.compact(self.engine.deleted) if self.passages is not None else None),
+                    ('facets', self.facets.compact(self.engine.deleted) if self.facets is not None else None),
+                ) if component is not None
+            }
+        )
+        self._doc_keys = None
+    
+    def load_index(self, index_dir):
+        """Load a saved search index; arrays and documents are memory-mapped, not copied"""
+        manifest, vectorizer, matrix, postings, documents = index_store.load_index(index_dir)
+        self.vectorizer = vectorizer
+        self.course_data = []
+        self.discourse_data = []
+        self.all_texts = []
+        self.engine = SearchEngine(matrix, documents, postings=postings)
+        hybrid_config = manifest.get('components', {}).get('hybrid')
+        self.hybrid = HybridRetriever.load(index_dir, hybrid_config, vectorizer, documents) if hybrid_config else None
+        passages_config = manifest.get('components', {}).get('passages')
+        self.passages = PassageIndex.load(index_dir, passages_config) if passages_config else None
+        facets_config = manifest.get('components', {}).get('facets')
+        self.facets = FacetIndex.load(index_dir, facets_config) if facets_config else None
+        self.index_version = manifest['index_version']
+        self.index_dir = index_dir
+        self._doc_keys = None
+        self.drift = manifest['extra'].get('drift') or self._new_drift_stats(len(documents), 0.0)
     
     def load_processed_data(self, filename):
-        """Load processed data and search index"""
+        """Load processed data and search index.
+
+        Uses the memory-mapped index next to the data file when its manifest
+        matches the file; otherwise parses the JSON, rebuilds and saves the index.
+        """
+        index_dir = index_store.index_dir_for(filename)
+        if index_store.is_index_fresh(index_dir, filename):
+            self.load_index(index_dir)
+            return
+        
         with open(filename, 'r', encoding='utf-8') as f:
             data = json.load(f)
         
         self.course_data = data['course_data']
         self.discourse_data = data['discourse_data']
         
+        print("Search index missing or stale, rebuilding...")
+        self.build_search_index()
         try:
-            with open('search_index.pkl', 'rb') as f:
-                index_data = pickle.load(f)
-                self.vectorizer = index_data['vectorizer']
-                self.tfidf_matrix = index_data['tfidf_matrix']
-        except FileNotFoundError:
-            print("Search index not found, rebuilding...")
-            self.build_search_index()
+            self.save_index(filename)
+        except OSError as e:
+            print(f"⚠️ Could not save search index: {e}")
+
+def update_processed_data(processor, data_file, posts_file, deleted_urls=(), refit_threshold=0.2, refit_min_fraction=0.05):
+    """Incrementally apply new/changed discourse posts (and deletions) to a saved index"""
+    processor.load_processed_data(data_file)
+    summary = {}
+    if posts_file:
+        summary = processor.process_discourse_posts(
+            posts_file, incremental=True, refit_threshold=refit_threshold, refit_min_fraction=refit_min_fraction
+        )
+    if deleted_urls:
+        add_update(summary, processor.update_documents(
+            [], deleted_keys=deleted_urls, refit_threshold=refit_threshold, refit_min_fraction=refit_min_fraction
+        ))
+    processor.save_processed_data(data_file)
+    return summary
 
 if __name__ == "__main__":
-    processor = TDSDataProcessor()
+    parser = argparse.ArgumentParser(description='Process TDS data and build the search index')
+    parser.add_argument('--update', metavar='POSTS_JSON', help='Incrementally add/replace discourse posts from this file instead of a full rebuild')
+    parser.add_argument('--delete', metavar='URL', nargs='*', default=[], help='Discourse post URLs to remove (with --update)')
+    parser.add_argument('--refit-threshold', type=float, default=0.2, help='Vocabulary drift above which an update does a full refit')
+    parser.add_argument('--refit-min-fraction', type=float, default=0.05, help='Share of the corpus that must have changed since the last fit before a refit')
+    parser.add_argument('--embedding-model', default=os.getenv('EMBEDDING_MODEL'), help='sentence-transformers model for dense retrieval (default: LSA over TF-IDF)')
+    args = parser.parse_args()
+    
+    processor = TDSDataProcessor(embedding_model=args.embedding_model)
+    
+    if args.update or args.delete:
+        summary = update_processed_data(
+            processor, 'data/processed_data.json', args.update, args.delete, args.refit_threshold, args.refit_min_fraction
+        )
+        print(f"✅ Updated search index: {summary} (drift {processor.vocabulary_drift():.3f})")
+        raise SystemExit(0)
     
     # Process data files
     try:
@@ -139,10 +650,15 @@ if __name__ == "__main__":
     except FileNotFoundError:
         print("⚠️ Course HTML file not found")
     
-    try:
-        processor.process_discourse_posts('data/tds_discourse_posts.json')
-        print("✅ Processed discourse posts")
-    except FileNotFoundError:
+    # Prefer the streamed JSONL output of the scrapers, fall back to the JSON array
+    posts_file = next(
+        (path for path in ('data/tds_discourse_posts.jsonl', 'data/tds_discourse_posts.json') if os.path.exists(path)),
+        None
+    )
+    if posts_file:
+        processor.process_discourse_posts(posts_file)
+        print(f"✅ Processed discourse posts from {posts_file}")
+    else:
         print("⚠️ Discourse posts file not found")
     
     # Build search index
@@ -0,0 +1,198 @@
+"""Columnar storage for indexed documents.
+
+A document is a small dict (``type``, ``section``/``title``, ``content``,
+``url``, ``date``, ``source``). Kept as one dict per document, every key and
+every repeated value (``'Discourse Post'``, a thread title shared by all its
+posts) costs a Python object per document. ``ColumnarDocuments`` stores the
+same data as columns instead:
+
+- ``type``, ``source``, ``section`` and ``title`` are interned: one table of
+  distinct strings plus an int32 code per row (-1 when the key is absent);
+- ``content``, ``url`` and ``date`` are UTF-8 bytes concatenated into one
+  buffer per field, with int64 offsets;
+- any other keys go into a small ``extras`` dict keyed by row.
+
+Indexing returns a ``DocumentView``, a read-only mapping that decodes fields
+on access, so search results are materialised only for the top k. Saved
+into an index directory as::
+
+    doc_{field}_codes.npy                 int32 codes of an interned field
+    doc_{field}.npy, doc_{field}_offsets.npy   UTF-8 buffer and offsets of a text field
+    doc_fields.npy                        uint8 bitmask of the text fields each row has
+    document_tables.json                  interned strings per field, and extras
+"""
+import json
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+FIELDS = ('type', 'section', 'title', 'content', 'url', 'date', 'source')  # dict key order
+INTERNED = ('type', 'section', 'title', 'source')
+TEXT = ('content', 'url', 'date')
+_TEXT_BIT = {field: 1 << i for i, field in enumerate(TEXT)}
+_MISSING = object()
+
+
+class DocumentView(Mapping):
+    """One row of a ColumnarDocuments store, behaving like the original document dict"""
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, key):
+        return self.store.value(self.row, key)
+
+    def get(self, key, default=None):
+        # Mapping.get goes through a KeyError for every absent key; results read 'title' and 'url' a lot
+        return self.store.value(self.row, key, default)
+
+    def __iter__(self):
+        return iter(self.store.keys(self.row))
+
+    def __len__(self):
+        return len(self.store.keys(self.row))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ColumnarDocuments:
+    """Immutable sequence of documents stored column by column (see module docstring)"""
+
+    def __init__(self, codes, tables, buffers, offsets, fields, extras=None):
+        self.codes = codes        # interned field -> int32 array
+        self.tables = tables      # interned field -> list of strings
+        self.buffers = buffers    # text field -> uint8 array
+        self.offsets = offsets    # text field -> int64 array of len(self) + 1
+        self.fields = fields      # uint8 bitmask of present text fields per row
+        self.extras = extras or {}
+        self._text = {field: memoryview(buffer) for field, buffer in buffers.items()}  # cheaper slices than numpy
+
+    @classmethod
+    def from_dicts(cls, documents):
+        """Build a store from document mappings in one pass"""
+        interned = {field: {} for field in INTERNED}
+        codes = {field: [] for field in INTERNED}
+        parts = {field: [] for field in TEXT}
+        lengths = {field: [] for field in TEXT}
+        fields, extras = [], {}
+        for row, doc in enumerate(documents):
+            mask = 0
+            for field in INTERNED:
+                value = doc.get(field)
+                if isinstance(value, str):
+                    codes[field].append(interned[field].setdefault(value, len(interned[field])))
+                else:
+                    codes[field].append(-1)
+            for field in TEXT:
+                value = doc.get(field)
+                encoded = value.encode('utf-8') if isinstance(value, str) else b''
+                parts[field].append(encoded)
+                lengths[field].append(len(encoded))
+                if isinstance(value, str):
+                    mask |= _TEXT_BIT[field]
+            fields.append(mask)
+            # Keys outside FIELDS, and non-string values, are kept as they are
+            other = {key: value for key, value in doc.items() if key not in FIELDS or not isinstance(value, str)}
+            if other:
+                extras[row] = other
+
+        offsets = {}
+        for field in TEXT:
+            offsets[field] = np.zeros(len(fields) + 1, dtype=np.int64)
+            np.cumsum(lengths[field], out=offsets[field][1:])
+        return cls(
+            {field: np.array(codes[field], dtype=np.int32) for field in INTERNED},
+            {field: list(interned[field]) for field in INTERNED},
+            {field: np.frombuffer(b''.join(parts[field]), dtype=np.uint8) for field in TEXT},
+            offsets,
+            np.array(fields, dtype=np.uint8),
+            extras,
+        )
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return DocumentView(self, int(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield DocumentView(self, i)
+
+    def keys(self, row):
+        present = set()
+        for field in INTERNED:
+            if self.codes[field][row] >= 0:
+                present.add(field)
+        mask = int(self.fields[row])
+        present.update(field for field in TEXT if mask & _TEXT_BIT[field])
+        extra = self.extras.get(row)
+        if extra:
+            present.update(extra)
+        return [field for field in FIELDS if field in present] + [
+            key for key in (extra or ()) if key not in FIELDS
+        ]
+
+    def value(self, row, key, default=_MISSING):
+        """Field ``key`` of ``row``; KeyError (or ``default``) if the document has no such key"""
+        if self.extras:
+            extra = self.extras.get(row)
+            if extra and key in extra:
+                return extra[key]
+        if key in self.codes:
+            code = int(self.codes[key][row])
+            if code >= 0:
+                return self.tables[key][code]
+        elif key in self.buffers and int(self.fields[row]) & _TEXT_BIT[key]:
+            offsets = self.offsets[key]
+            return str(self._text[key][offsets[row]:offsets[row + 1]], 'utf-8')
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def texts(self, field='content'):
+        """All values of a text field as strings ('' where absent), without building views"""
+        data, offsets = self._text[field], self.offsets[field].tolist()
+        return [str(data[start:end], 'utf-8') for start, end in zip(offsets, offsets[1:])]
+
+    @property
+    def nbytes(self):
+        """Bytes held by the column arrays (not counting the interned strings and extras)"""
+        arrays = [*self.codes.values(), *self.buffers.values(), *self.offsets.values(), self.fields]
+        return sum(array.nbytes for array in arrays)
+
+    def save(self, directory):
+        """Write the columns into an index directory"""
+        for field in INTERNED:
+            np.save(os.path.join(directory, f'doc_{field}_codes.npy'), self.codes[field])
+        for field in TEXT:
+            np.save(os.path.join(directory, f'doc_{field}.npy'), self.buffers[field])
+            np.save(os.path.join(directory, f'doc_{field}_offsets.npy'), self.offsets[field])
+        np.save(os.path.join(directory, 'doc_fields.npy'), self.fields)
+        with open(os.path.join(directory, 'document_tables.json'), 'w', encoding='utf-8') as f:
+            json.dump({'tables': self.tables, 'extras': {str(row): extra for row, extra in self.extras.items()}},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+        with open(os.path.join(directory, 'document_tables.json'), 'r', encoding='utf-8') as f:
+            tables = json.load(f)
+        return cls(
+            {field: load(f'doc_{field}_codes.npy') for field in INTERNED},
+            tables['tables'],
+            {field: load(f'doc_{field}.npy') for field in TEXT},
+            {field: load(f'doc_{field}_offsets.npy') for field in TEXT},
+            load('doc_fields.npy'),
+            {int(row): extra for row, extra in tables['extras'].items()},
+        )
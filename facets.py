@@ -0,0 +1,219 @@
+"""Facet indexes for filtered search: which rows have a given type, section or date.
+
+``FacetIndex`` is built alongside the search index and answers filters
+without reading the documents:
+
+- ``type`` and ``section``: one packed bitmap (``np.packbits``) per distinct
+  value, so a filter is the OR of a few bitmaps;
+- ``date``: the dates of the rows that have one, sorted, with their row ids
+  in the same order, so a date range is two binary searches.
+
+Filters are a mapping with any of ``types`` and ``sections`` (accepted
+values) and ``date_from`` / ``date_to`` (ISO 8601 dates or datetimes, or
+``date``/``datetime`` objects; both ends inclusive, a date-only ``date_to``
+includes the whole day). Empty filters are ignored, and rows without a date
+never match a date range. ``mask`` turns filters into a boolean row mask,
+which SearchEngine and DenseIndex apply before scoring.
+
+Like PassageIndex, rows added by incremental updates go into a new segment,
+and the index is saved into the index directory as a manifest component::
+
+    facet_{field}.npy       packed bitmaps of a field, one row per value (values in the manifest)
+    facet_dates.npy         int64 seconds since the epoch, sorted
+    facet_date_rows.npy     row id of each entry of facet_dates.npy
+"""
+import os
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from document_store import ColumnarDocuments
+
+FACETS = {'types': 'type', 'sections': 'section'}  # filter key -> document field
+FILTER_KEYS = (*FACETS, 'date_from', 'date_to')
+_DAY = 24 * 60 * 60
+
+
+def parse_date(value):
+    """Seconds since the epoch of an ISO 8601 string, date or datetime (naive means UTC); None if not a date"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    if isinstance(value, date):
+        return int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp())
+    return None
+
+
+def _date_only(value):
+    if isinstance(value, str):
+        return len(value.strip()) == 10
+    return isinstance(value, date) and not isinstance(value, datetime)
+
+
+def date_bounds(filters):
+    """(start, end) in seconds with end exclusive, either None when open; ValueError on a malformed date"""
+    bounds = []
+    for key in ('date_from', 'date_to'):
+        value = filters.get(key)
+        if value is None:
+            bounds.append(None)
+            continue
+        seconds = parse_date(value)
+        if seconds is None:
+            raise ValueError(f"{key} is not an ISO 8601 date: {value!r}")
+        if key == 'date_to':
+            seconds += _DAY if _date_only(value) else 1
+        bounds.append(seconds)
+    return tuple(bounds)
+
+
+def _codes(documents, field):
+    """(distinct values, int32 code per row with -1 for missing) of an interned field"""
+    if isinstance(documents, ColumnarDocuments):
+        return documents.tables[field], np.asarray(documents.codes[field])
+    table = {}
+    codes = [table.setdefault(value, len(table)) if isinstance(value, str) else -1
+             for value in (doc.get(field) for doc in documents)]
+    return list(table), np.array(codes, dtype=np.int32)
+
+
+class _FacetSegment:
+    """Facets of one block of rows"""
+    __slots__ = ('size', 'values', 'bitmaps', 'dates', 'date_rows')
+
+    def __init__(self, size, values, bitmaps, dates, date_rows):
+        self.size = size
+        self.values = values        # field -> {value: bitmap row}
+        self.bitmaps = bitmaps      # field -> uint8 array of shape (n_values, ceil(size / 8))
+        self.dates = dates          # sorted int64 seconds of the rows that have a date
+        self.date_rows = date_rows  # their row ids
+
+    @classmethod
+    def build(cls, documents):
+        size = len(documents)
+        values, bitmaps = {}, {}
+        for field in FACETS.values():
+            table, codes = _codes(documents, field)
+            values[field] = {value: i for i, value in enumerate(table)}
+            bitmaps[field] = np.stack([np.packbits(codes == code) for code in range(len(table))]) if table \
+                else np.zeros((0, (size + 7) // 8), dtype=np.uint8)
+        texts = documents.texts('date') if isinstance(documents, ColumnarDocuments) \
+            else [doc.get('date') or '' for doc in documents]
+        parsed = [(parse_date(text), row) for row, text in enumerate(texts) if text]
+        parsed = np.array([entry for entry in parsed if entry[0] is not None], dtype=np.int64).reshape(-1, 2)
+        order = np.argsort(parsed[:, 0], kind='stable')
+        return cls(size, values, bitmaps, parsed[order, 0], parsed[order, 1])
+
+    def field_mask(self, field, accepted):
+        rows = [self.values[field][value] for value in accepted if value in self.values[field]]
+        if not rows:
+            return np.zeros(self.size, dtype=bool)
+        bits = np.bitwise_or.reduce(self.bitmaps[field][rows], axis=0)
+        return np.unpackbits(bits, count=self.size).view(bool)
+
+    def date_mask(self, start, end):
+        first = np.searchsorted(self.dates, start) if start is not None else 0
+        last = np.searchsorted(self.dates, end) if end is not None else len(self.dates)
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.date_rows[first:last]] = True
+        return mask
+
+    def mask(self, filters, bounds):
+        mask = np.ones(self.size, dtype=bool)
+        for key, field in FACETS.items():
+            if filters.get(key):
+                mask &= self.field_mask(field, filters[key])
+        if bounds != (None, None):
+            mask &= self.date_mask(*bounds)
+        return mask
+
+
+class FacetIndex:
+    """Type, section and date facets over the rows of a SearchEngine (see module docstring)"""
+
+    def __init__(self, segments):
+        self.segments = segments
+
+    @classmethod
+    def build(cls, documents):
+        return cls([_FacetSegment.build(documents)])
+
+    def __len__(self):
+        return sum(segment.size for segment in self.segments)
+
+    def with_documents(self, documents):
+        """Return a new index with facets for rows appended after the current ones"""
+        if not len(documents):
+            return self
+        return FacetIndex(self.segments + [_FacetSegment.build(documents)])
+
+    def mask(self, filters):
+        """Boolean mask over all rows matching ``filters``, or None when no filter is set"""
+        filters = {key: value for key, value in (filters or {}).items() if value not in (None, '', [], ())}
+        unknown = set(filters) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown filters {', '.join(sorted(unknown))}, expected {', '.join(FILTER_KEYS)}")
+        if not filters:
+            return None
+        bounds = date_bounds(filters)
+        masks = [segment.mask(filters, bounds) for segment in self.segments]
+        return masks[0] if len(masks) == 1 else np.concatenate(masks)
+
+    def values(self, field):
+        """Distinct values of a facet field, e.g. the sections a filter can name"""
+        return sorted({value for segment in self.segments for value in segment.values[field]})
+
+    def compact(self, deleted=None):
+        """Return an index of one segment holding only live rows, matching SearchEngine.compact()"""
+        if len(self.segments) == 1 and deleted is None:
+            return self
+        size = len(self)
+        live = ~deleted if deleted is not None else np.ones(size, dtype=bool)
+        values, bitmaps = {}, {}
+        for field in FACETS.values():
+            values[field] = {value: i for i, value in enumerate(self.values(field))}
+            rows = [np.concatenate([segment.field_mask(field, [value]) for segment in self.segments])[live]
+                    for value in values[field]]
+            bitmaps[field] = np.stack([np.packbits(row) for row in rows]) if rows \
+                else np.zeros((0, (int(live.sum()) + 7) // 8), dtype=np.uint8)
+        offsets = np.cumsum([0] + [segment.size for segment in self.segments])
+        dates = np.concatenate([segment.dates for segment in self.segments])
+        rows = np.concatenate([segment.date_rows + offset for segment, offset in zip(self.segments, offsets)])
+        keep = live[rows]
+        new_rows = np.cumsum(live) - 1  # row id after dropping deleted rows
+        dates, rows = dates[keep], new_rows[rows[keep]]
+        order = np.argsort(dates, kind='stable')
+        return FacetIndex([_FacetSegment(int(live.sum()), values, bitmaps, dates[order], rows[order])])
+
+    def save(self, directory):
+        """Write the facet files into an index directory; returns its manifest entry.
+
+        Compact first (``compact(engine.deleted)``) so rows match the saved engine.
+        """
+        segment = self.compact().segments[0]
+        for field in FACETS.values():
+            np.save(os.path.join(directory, f'facet_{field}.npy'), segment.bitmaps[field])
+        np.save(os.path.join(directory, 'facet_dates.npy'), segment.dates)
+        np.save(os.path.join(directory, 'facet_date_rows.npy'), segment.date_rows)
+        return {
+            'rows': segment.size,
+            'values': {field: list(segment.values[field]) for field in FACETS.values()},
+        }
+
+    @classmethod
+    def load(cls, directory, config, mmap_mode='r'):
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+        values = {field: {value: i for i, value in enumerate(config['values'][field])} for field in FACETS.values()}
+        return cls([_FacetSegment(
+            config['rows'], values,
+            {field: load(f'facet_{field}.npy') for field in FACETS.values()},
+            load('facet_dates.npy'), load('facet_date_rows.npy'),
+        )])
@@ -0,0 +1,220 @@
+"""Precomputed answers to frequent questions, matched before retrieval and the LLM.
+
+``data/faq.json`` is a list of curated entries::
+
+    {
+      "id": "gpt-model-choice",
+      "questions": ["Should I use gpt-4o-mini or gpt-3.5-turbo?", ...],  # example wordings
+      "patterns": ["4o.{0,80}3\\\\.5"],                                  # regexes, matched case-insensitively
+      "answer": "...",
+      "links": [{"url": "...", "text": "..."}]
+    }
+
+``FAQStore.match(question)`` returns the matching entry or None:
+
+- the question is compared with the entries' example questions by TF-IDF
+  cosine similarity (IDF over the example questions, English stop words
+  dropped), through an inverted index over the few hundred FAQ terms;
+- going down the entries by score, the first one that reaches
+  ``similarity``, or reaches ``pattern_similarity`` and whose compiled
+  patterns match the question, is the answer.
+
+Patterns are only run for the few entries that share terms with the
+question: one alternation over every entry's patterns would cost
+milliseconds with a few hundred entries, as ``re`` tries each alternative
+at each position. A lookup takes microseconds and no upstream call.
+
+Candidate entries can be mined offline from scraped Discourse threads, with
+the most viewed and most replied-to threads first, using their accepted (or
+first) reply as a draft answer::
+
+    python faq.py --mine data/tds_discourse_posts.json --out data/faq_candidates.json
+
+Candidates need review before they are copied into data/faq.json.
+"""
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokens(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in ENGLISH_STOP_WORDS]
+
+
+class FAQEntry:
+    __slots__ = ('id', 'questions', 'patterns', 'answer', 'links')
+
+    def __init__(self, id, questions, answer, patterns=(), links=()):
+        self.id = id
+        self.questions = list(questions)
+        self.patterns = list(patterns)
+        self.answer = answer
+        self.links = [dict(link) for link in links]
+
+    @classmethod
+    def from_dict(cls, data):
+        missing = {'id', 'questions', 'answer'} - set(data)
+        if missing:
+            raise ValueError(f"FAQ entry {data.get('id', '?')} lacks {', '.join(sorted(missing))}")
+        return cls(data['id'], data['questions'], data['answer'], data.get('patterns', ()), data.get('links', ()))
+
+    def to_dict(self):
+        return {'id': self.id, 'questions': self.questions, 'patterns': self.patterns,
+                'answer': self.answer, 'links': self.links}
+
+
+class FAQStore:
+    """Curated FAQ entries with a pattern matcher and TF-IDF check (see module docstring)"""
+
+    def __init__(self, entries, similarity=0.75, pattern_similarity=0.3, path=None):
+        self.entries = list(entries)
+        self.similarity = similarity
+        self.pattern_similarity = pattern_similarity
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        ids = [entry.id for entry in self.entries]
+        if len(set(ids)) != len(ids):
+            raise ValueError("FAQ entry ids must be unique")
+
+        # One compiled alternation per entry
+        self.matchers = []
+        for entry in self.entries:
+            for pattern in entry.patterns:
+                re.compile(pattern)  # report a bad pattern on its own, not as part of the alternation
+            self.matchers.append(
+                re.compile('|'.join(f'(?:{pattern})' for pattern in entry.patterns), re.IGNORECASE)
+                if entry.patterns else None
+            )
+
+        # Example questions as l2-normalised TF-IDF dicts, indexed by term
+        documents = [tokens(question) for entry in self.entries for question in entry.questions]
+        self.question_entry = [i for i, entry in enumerate(self.entries) for _ in entry.questions]
+        df = Counter(term for terms in documents for term in set(terms))
+        n = len(documents)
+        self.idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+        self.unknown_idf = math.log(1 + n) + 1  # a term no FAQ question has
+        self.postings = {}  # term -> [(question index, weight)]
+        for q, terms in enumerate(documents):
+            for term, weight in self._vector(terms).items():
+                self.postings.setdefault(term, []).append((q, weight))
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Store from a JSON file of entries; an empty store if the file does not exist"""
+        if not os.path.exists(path):
+            return cls([], path=path, **kwargs)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls([FAQEntry.from_dict(entry) for entry in data], path=path, **kwargs)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _vector(self, terms):
+        counts = Counter(terms)
+        vector = {term: count * self.idf.get(term, self.unknown_idf) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def scores(self, question):
+        """entry index -> best cosine similarity between the question and the entry's example questions"""
+        dots = {}
+        for term, weight in self._vector(tokens(question)).items():
+            for q, question_weight in self.postings.get(term, ()):
+                dots[q] = dots.get(q, 0.0) + weight * question_weight
+        scores = {}
+        for q, dot in dots.items():
+            i = self.question_entry[q]
+            if dot > scores.get(i, 0.0):
+                scores[i] = dot
+        return scores
+
+    def match(self, question):
+        """The entry answering ``question``, or None"""
+        entry = self._match(question) if self.entries else None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def _match(self, question):
+        for i, score in sorted(self.scores(question).items(), key=lambda item: item[1], reverse=True):
+            if score < self.pattern_similarity:
+                break
+            matcher = self.matchers[i]
+            if score >= self.similarity or (matcher is not None and matcher.search(question)):
+                return self.entries[i]
+        return None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def thread_score(post):
+    """Traffic of a scraped thread: views, with replies and likes weighted up"""
+    replies = max(0, int(post.get('posts_count') or 1) - 1)
+    return int(post.get('views') or 0) + 20 * replies + 5 * int(post.get('like_count') or 0)
+
+
+def mine(posts, limit=50, known_urls=()):
+    """Draft FAQ entries for the ``limit`` busiest threads not already linked from an entry"""
+    from data_processor import dedupe_posts
+
+    threads = [post for post in dedupe_posts(posts) if post.get('title') and post.get('url') not in known_urls]
+    threads.sort(key=thread_score, reverse=True)
+    candidates = []
+    for post in threads[:limit]:
+        candidates.append({
+            'id': post.get('slug') or post['url'].rstrip('/').split('/')[-2],  # .../t/<slug>/<topic id>
+            'questions': [post['title']],
+            'patterns': [],
+            'answer': (post.get('answer') or '').strip(),  # accepted answer or first reply, to be edited
+            'links': [{'url': post['url'], 'text': post['title']}],
+            'score': thread_score(post),
+        })
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mine FAQ candidates from Discourse threads, or test FAQ matching")
+    parser.add_argument('--faq', default='data/faq.json')
+    parser.add_argument('--mine', metavar='POSTS_JSON', help='Scraped Discourse posts (JSON array or JSONL)')
+    parser.add_argument('--out', default='data/faq_candidates.json')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--check', metavar='QUESTION', nargs='*', default=[], help='Print the entry each question matches')
+    args = parser.parse_args()
+
+    store = FAQStore.load(args.faq)
+    if args.mine:
+        from data_processor import iter_posts
+
+        known = {link['url'] for entry in store.entries for link in entry.links}
+        candidates = mine(iter_posts(args.mine), args.limit, known)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(candidates, f, ensure_ascii=False, indent=2)
+        drafted = sum(1 for candidate in candidates if candidate['answer'])
+        print(f"✅ Wrote {len(candidates)} FAQ candidates ({drafted} with a draft answer) to {args.out}")
+    for question in args.check:
+        scores = store.scores(question)
+        entry = store.match(question)
+        best = max(scores.values(), default=0.0)
+        print(f"{question!r}: {entry.id if entry else 'no match'} (best similarity {best:.2f})")
+
+
+if __name__ == "__main__":
+    main()
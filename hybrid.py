@@ -0,0 +1,427 @@
+"""Hybrid retrieval: BM25 over an inverted index plus dense embeddings behind an IVF index.
+
+Both backends score the same rows as the TF-IDF SearchEngine (row i is the
+same document everywhere), share its tombstones, and are saved into the same
+index directory as a manifest component::
+
+    bm25_{data,indices,indptr}.npy           BM25 weight per posting (CSR)
+    bm25_postings_{data,indices,indptr}.npy  the same matrix in CSC form
+    bm25_vocabulary.json, bm25_idf.npy       BM25 vocabulary and IDF
+    embeddings.npy                           float32 document embeddings, L2-normalised
+    lsa_components.npy                       LSA projection (when no embedding model is set)
+    ivf_{centroids,list_ids,list_offsets}.npy  IVF clusters (large corpora only)
+
+The two result lists are merged with reciprocal-rank fusion.
+"""
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import CountVectorizer
+
+import index_store
+from retrieval import SearchEngine
+
+BACKENDS = ('tfidf', 'bm25', 'dense', 'hybrid')
+RRF_K = 60
+
+
+def _normalise_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """Merge ranked id lists: score(d) = sum over lists of 1 / (k + rank of d), best first"""
+    fused = {}
+    for doc_ids in rankings:
+        for rank, doc_id in enumerate(doc_ids, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    best = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+    return (np.array([doc_id for doc_id, _ in best], dtype=np.int64),
+            np.array([score for _, score in best]))
+
+
+class BM25Encoder:
+    """Okapi BM25 with the per-document term weights precomputed.
+
+    A document's score for a query is the sum over query terms of
+    ``idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))``. That
+    weight depends only on the document, so it is stored per posting at index
+    time and a query becomes a binary term vector; scoring is then the same
+    sparse dot product SearchEngine already runs through its inverted index.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.vectorizer = CountVectorizer(stop_words='english')
+        self.idf = None
+        self.avgdl = 1.0
+
+    def fit_transform(self, texts):
+        counts = self.vectorizer.fit_transform(texts)
+        n_docs = counts.shape[0]
+        df = np.bincount(counts.indices, minlength=counts.shape[1])
+        self.idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        self.avgdl = float(counts.sum()) / n_docs or 1.0
+        return self._weights(counts)
+
+    def transform(self, texts):
+        """BM25 rows for new documents, using the fitted vocabulary, IDF and average length"""
+        return self._weights(self.vectorizer.transform(texts))
+
+    def _weights(self, counts):
+        counts = sparse.csr_matrix(counts, dtype=np.float64)
+        lengths = np.asarray(counts.sum(axis=1)).ravel()
+        length_norm = self.k1 * (1 - self.b + self.b * lengths / self.avgdl)
+        tf = counts.data
+        counts.data = self.idf[counts.indices] * tf * (self.k1 + 1) / (tf + np.repeat(length_norm, np.diff(counts.indptr)))
+        return counts
+
+    def encode_queries(self, queries):
+        """Binary query rows: each distinct query term counts once"""
+        queries = sparse.csr_matrix(self.vectorizer.transform(queries), dtype=np.float64)
+        queries.data[:] = 1.0
+        return queries
+
+
+class LSAEmbedder:
+    """Latent semantic analysis: a truncated SVD of the TF-IDF matrix.
+
+    The CPU-only default model; it needs no download and is fitted with the
+    index. Terms that co-occur across the corpus share dimensions, so a
+    paraphrase can match a document it shares few words with.
+    """
+    name = 'lsa'
+
+    def __init__(self, vectorizer, n_components=256, components=None):
+        self.vectorizer = vectorizer
+        self.n_components = n_components
+        self.components = components
+
+    def fit(self, tfidf_matrix):
+        n_components = min(self.n_components, tfidf_matrix.shape[0] - 1, tfidf_matrix.shape[1] - 1)
+        if n_components < 1:
+            self.components = np.zeros((0, tfidf_matrix.shape[1]), dtype=np.float32)
+            return self
+        svd = TruncatedSVD(n_components=n_components, random_state=0)
+        svd.fit(tfidf_matrix)
+        self.components = svd.components_.astype(np.float32)
+        return self
+
+    def encode(self, texts, tfidf=None):
+        """Embed texts; pass their TF-IDF rows if already computed"""
+        if tfidf is None:
+            tfidf = self.vectorizer.transform(texts)
+        return _normalise_rows(tfidf @ self.components.T)
+
+    def config(self):
+        return {'name': self.name, 'n_components': self.n_components}
+
+
+class SentenceTransformerEmbedder:
+    """Embeddings from a local sentence-transformers model (e.g. all-MiniLM-L6-v2), run on CPU"""
+    name = 'sentence-transformers'
+
+    def __init__(self, model_name, batch_size=64):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                raise ImportError(
+                    f"Embedding model {self.model_name!r} needs the sentence-transformers package"
+                ) from None
+            self._model = SentenceTransformer(self.model_name, device='cpu')
+        return self._model
+
+    def fit(self, tfidf_matrix):
+        return self
+
+    def encode(self, texts, tfidf=None):
+        vectors = self.model.encode(
+            list(texts), batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+    def config(self):
+        return {'name': self.name, 'model': self.model_name}
+
+
+def make_embedder(vectorizer, embedding_model=None):
+    """sentence-transformers model when one is configured, LSA over the TF-IDF vectorizer otherwise"""
+    if embedding_model:
+        return SentenceTransformerEmbedder(embedding_model)
+    return LSAEmbedder(vectorizer)
+
+
+class DenseIndex:
+    """Nearest-neighbour search over L2-normalised embeddings (inner product = cosine).
+
+    Up to ``EXACT_MAX`` vectors every query is an exact matrix-vector
+    product. Larger indexes use IVF: spherical k-means partitions the vectors
+    into clusters whose row ids are stored contiguously, and a query scans
+    only the ``n_probe`` clusters with the closest centroids. Vectors added by
+    ``with_updates`` go to an unclustered tail that is always scanned exactly;
+    like SearchEngine, updates return a new index and deleted rows are
+    tombstoned. A row ``mask`` that allows fewer rows than the probed
+    clusters hold is scanned exactly instead.
+    """
+
+    EXACT_MAX = 20000
+
+    def __init__(self, vectors, threshold=0.2, n_probe=16, centroids=None, list_ids=None, list_offsets=None):
+        self.base = vectors
+        self.tail = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        self.threshold = threshold
+        self.n_probe = n_probe
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.deleted = None
+        if centroids is None and len(vectors) > self.EXACT_MAX:
+            self._train()
+
+    def __len__(self):
+        return len(self.base) + len(self.tail)
+
+    def _assign(self, vectors, chunk_size=65536):
+        return np.concatenate([
+            np.argmax(vectors[start:start + chunk_size] @ self.centroids.T, axis=1)
+            for start in range(0, len(vectors), chunk_size)
+        ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+    def _build_lists(self, assignments):
+        self.list_ids = np.argsort(assignments, kind='stable').astype(np.int64)
+        self.list_offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=len(self.centroids)), out=self.list_offsets[1:])
+
+    def _train(self, seed=0):
+        n_lists = int(2 * np.sqrt(len(self.base)))
+        rng = np.random.default_rng(seed)
+        # A sample of ~64 vectors per list is plenty to place the centroids
+        sample_size = min(len(self.base), 64 * n_lists)
+        sample = self.base[np.sort(rng.choice(len(self.base), sample_size, replace=False))]
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=seed, batch_size=4096, n_init=1)
+        kmeans.fit(sample)
+        self.centroids = _normalise_rows(kmeans.cluster_centers_)
+        self._build_lists(self._assign(self.base))
+
+    def _candidates(self, query):
+        """Row ids of the base vectors to score for one query (None = all of them)"""
+        if self.centroids is None:
+            return None
+        n_probe = min(self.n_probe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        ids = np.concatenate([self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe])
+        ids.sort()  # sequential reads from a memory-mapped base
+        return ids
+
+    def score(self, query, mask=None):
+        """Candidate row ids and cosine similarities for one query embedding, restricted to ``mask`` if given"""
+        ids = self._candidates(query)
+        allowed = mask if mask is None or self.deleted is None else mask & ~self.deleted
+        if allowed is not None:
+            rows = np.flatnonzero(allowed[:len(self.base)])
+            ids = rows if ids is None or len(rows) < len(ids) else ids[allowed[ids]]
+        if ids is None:
+            ids, scores = np.arange(len(self.base)), self.base @ query
+        else:
+            scores = self.base[ids] @ query
+        if len(self.tail):
+            tail_ids = np.arange(len(self.base), len(self))
+            if allowed is not None:
+                tail_ids = tail_ids[allowed[len(self.base):]]
+            ids = np.concatenate([ids, tail_ids])
+            scores = np.concatenate([scores, self.tail[tail_ids - len(self.base)] @ query])
+        if allowed is None and self.deleted is not None:
+            keep = ~self.deleted[ids]
+            ids, scores = ids[keep], scores[keep]
+        return ids, scores
+
+    def search(self, query, top_k, mask=None):
+        """Top k (row ids, similarities) above the threshold, best first"""
+        ids, scores = self.score(query, mask)
+        keep = scores > self.threshold
+        ids, scores = ids[keep], scores[keep]
+        if len(scores) > top_k:
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+            ids, scores = ids[part], scores[part]
+        order = np.argsort(-scores, kind='stable')
+        return ids[order], scores[order]
+
+    def with_updates(self, vectors, deleted_ids=()):
+        """Return a new index with vectors appended to the tail and deleted_ids tombstoned"""
+        index = DenseIndex.__new__(DenseIndex)
+        index.__dict__.update(self.__dict__)
+        if vectors is not None and len(vectors):
+            index.tail = np.vstack([self.tail, vectors]).astype(np.float32)
+        deleted = np.zeros(len(index), dtype=bool)
+        if self.deleted is not None:
+            deleted[:len(self.deleted)] = self.deleted
+        deleted[np.asarray(list(deleted_ids), dtype=np.int64)] = True
+        index.deleted = deleted if deleted.any() else None
+        return index
+
+    def compact(self):
+        """Return a new index holding only live rows, the tail folded into the existing clusters"""
+        vectors = np.vstack([self.base, self.tail]) if len(self.tail) else np.asarray(self.base)
+        if self.deleted is not None:
+            vectors = vectors[~self.deleted]
+        if self.centroids is None:
+            return DenseIndex(vectors, self.threshold, self.n_probe)
+        index = DenseIndex(vectors, self.threshold, self.n_probe, centroids=self.centroids)
+        index._build_lists(index._assign(vectors))
+        return index
+
+
+class HybridRetriever:
+    """BM25 and dense retrieval over the rows of a TF-IDF SearchEngine.
+
+    ``search`` runs one backend: ``bm25``, ``dense``, or ``hybrid``, which
+    fuses the top ``depth`` hits of both with reciprocal-rank fusion. The
+    ``similarity`` of a hybrid result is its fused RRF score. A row ``mask``
+    (see facets.FacetIndex) restricts both backends before ranking.
+    """
+
+    def __init__(self, bm25, bm25_engine, embedder, dense):
+        self.bm25 = bm25
+        self.bm25_engine = bm25_engine
+        self.embedder = embedder
+        self.dense = dense
+
+    @classmethod
+    def build(cls, texts, documents, tfidf_matrix, vectorizer, embedding_model=None):
+        bm25 = BM25Encoder()
+        bm25_engine = SearchEngine(bm25.fit_transform(texts), documents, threshold=0.0)
+        embedder = make_embedder(vectorizer, embedding_model).fit(tfidf_matrix)
+        dense = DenseIndex(embedder.encode(texts, tfidf_matrix))
+        return cls(bm25, bm25_engine, embedder, dense)
+
+    def __len__(self):
+        return len(self.bm25_engine)
+
+    def with_updates(self, texts, documents, tfidf_rows, deleted_ids=()):
+        """Return a new retriever with rows appended and deleted_ids tombstoned, mirroring SearchEngine"""
+        texts = list(texts)
+        matrix = self.bm25.transform(texts) if texts else None
+        vectors = self.embedder.encode(texts, tfidf_rows) if texts else None
+        return HybridRetriever(
+            self.bm25,
+            self.bm25_engine.with_updates(matrix, documents, deleted_ids),
+            self.embedder,
+            self.dense.with_updates(vectors, deleted_ids),
+        )
+
+    def _ranked(self, backend, bm25_vector, embedding, top_k, depth, mask=None):
+        engine = self.bm25_engine
+        if backend == 'bm25':
+            return engine.top_k(*engine.score(bm25_vector, mask), top_k)
+        if backend == 'dense':
+            return self.dense.search(embedding, top_k, mask)
+        if backend == 'hybrid':
+            bm25_ids, _ = engine.top_k(*engine.score(bm25_vector, mask), depth)
+            dense_ids, _ = self.dense.search(embedding, depth, mask)
+            return reciprocal_rank_fusion([bm25_ids, dense_ids], top_k)
+        raise ValueError(f"Unknown retrieval backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+    def search(self, query, top_k=5, backend='hybrid', tfidf_vector=None, depth=50, mask=None):
+        """Top k result dicts for one query; tfidf_vector saves re-encoding it for LSA"""
+        return self.search_batch([query], top_k, backend, tfidf_vector, depth, mask)[0]
+
+    def search_batch(self, queries, top_k=5, backend='hybrid', tfidf_matrix=None, depth=50, mask=None):
+        """Top k result dicts for every query; queries are encoded in one call per model"""
+        if top_k <= 0 or len(self) == 0:
+            return [[] for _ in queries]
+        depth = max(depth, top_k)
+        bm25_matrix = self.bm25.encode_queries(queries) if backend in ('bm25', 'hybrid') else None
+        embeddings = self.embedder.encode(queries, tfidf_matrix) if backend in ('dense', 'hybrid') else None
+        results = []
+        for i in range(len(queries)):
+            doc_ids, scores = self._ranked(
+                backend,
+                bm25_matrix[i] if bm25_matrix is not None else None,
+                embeddings[i] if embeddings is not None else None,
+                top_k, depth, mask,
+            )
+            results.append(self.bm25_engine.results(doc_ids, scores))
+        return results
+
+    def compact(self):
+        """Return a retriever holding only live rows, for saving alongside SearchEngine.compact()"""
+        matrix, documents = self.bm25_engine.compact()
+        return HybridRetriever(
+            self.bm25, SearchEngine(matrix, documents, threshold=0.0), self.embedder, self.dense.compact()
+        )
+
+    def save(self, directory):
+        """Write this retriever's files into an index directory; returns its manifest entry"""
+        retriever = self.compact()
+        matrix = sparse.csr_matrix(retriever.bm25_engine.matrix)
+        index_store.save_csr(directory, 'bm25', matrix)
+        index_store.save_csr(directory, 'bm25_postings', matrix.tocsc())
+        terms = [None] * len(self.bm25.vectorizer.vocabulary_)
+        for term, column in self.bm25.vectorizer.vocabulary_.items():
+            terms[column] = term
+        with open(os.path.join(directory, 'bm25_vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        np.save(os.path.join(directory, 'bm25_idf.npy'), self.bm25.idf)
+
+        dense = retriever.dense
+        np.save(os.path.join(directory, 'embeddings.npy'), np.ascontiguousarray(dense.base, dtype=np.float32))
+        if isinstance(self.embedder, LSAEmbedder):
+            np.save(os.path.join(directory, 'lsa_components.npy'), self.embedder.components)
+        if dense.centroids is not None:
+            np.save(os.path.join(directory, 'ivf_centroids.npy'), dense.centroids)
+            np.save(os.path.join(directory, 'ivf_list_ids.npy'), dense.list_ids)
+            np.save(os.path.join(directory, 'ivf_list_offsets.npy'), dense.list_offsets)
+        return {
+            'bm25': {'k1': self.bm25.k1, 'b': self.bm25.b, 'avgdl': self.bm25.avgdl, 'shape': list(matrix.shape)},
+            'embedder': self.embedder.config(),
+            'dense': {'threshold': dense.threshold, 'n_probe': dense.n_probe, 'ivf': dense.centroids is not None},
+        }
+
+    @classmethod
+    def load(cls, directory, config, vectorizer, documents, mmap_mode='r'):
+        """Open a retriever saved by ``save``; arrays are memory-mapped"""
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+        bm25 = BM25Encoder(config['bm25']['k1'], config['bm25']['b'])
+        bm25.avgdl = config['bm25']['avgdl']
+        with open(os.path.join(directory, 'bm25_vocabulary.json'), 'r', encoding='utf-8') as f:
+            bm25.vectorizer.vocabulary_ = {term: column for column, term in enumerate(json.load(f))}
+        bm25.idf = np.load(os.path.join(directory, 'bm25_idf.npy'))
+        shape = config['bm25']['shape']
+        bm25_engine = SearchEngine(
+            index_store.load_csr(directory, 'bm25', shape, mmap_mode), documents, threshold=0.0,
+            postings=index_store.load_csc(directory, 'bm25_postings', shape, mmap_mode),
+        )
+
+        embedder_config = config['embedder']
+        if embedder_config['name'] == LSAEmbedder.name:
+            embedder = LSAEmbedder(vectorizer, embedder_config['n_components'], np.load(os.path.join(directory, 'lsa_components.npy')))
+        else:
+            embedder = SentenceTransformerEmbedder(embedder_config['model'])
+
+        dense_config = config['dense']
+        if dense_config['ivf']:
+            dense = DenseIndex(
+                load('embeddings.npy'), dense_config['threshold'], dense_config['n_probe'],
+                centroids=np.load(os.path.join(directory, 'ivf_centroids.npy')),
+                list_ids=load('ivf_list_ids.npy'), list_offsets=load('ivf_list_offsets.npy'),
+            )
+        else:
+            dense = DenseIndex(load('embeddings.npy'), dense_config['threshold'], dense_config['n_probe'])
+        return cls(bm25, bm25_engine, embedder, dense)
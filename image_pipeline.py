@@ -0,0 +1,204 @@
+"""Preprocessing for uploaded images before they reach a vision model.
+
+Screenshots arrive as base64 strings of arbitrary size. ``prepare_image``
+decodes them in bounded chunks (refusing payloads over ``max_bytes`` before
+decoding anything), checks the pixel count from the header before the
+pixels are loaded, downscales to at most ``max_side`` pixels on the long
+side and re-encodes as JPEG. It also computes a 256-bit difference hash
+(dHash) and a 64x64 grayscale thumbnail, which ``ImageDescriptionCache``
+uses to reuse the description of an identical or near-identical screenshot.
+
+When no vision model is configured, ``ocr_text`` extracts the text locally
+with Tesseract if ``pytesseract`` and the ``tesseract`` binary are installed.
+"""
+import binascii
+import io
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+try:
+    import pytesseract
+except ImportError:  # OCR is optional
+    pytesseract = None
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+MAX_IMAGE_SIDE = 1568
+JPEG_QUALITY = 85
+HASH_SIZE = 16  # 16x16 gradient bits
+THUMBNAIL_SIZE = 64
+_CHUNK = 64 * 1024  # base64 characters per decode step, a multiple of 4
+_DATA_URL = re.compile(r'^data:[\w/+.-]+;base64,')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class ImageTooLarge(ValueError):
+    """The image payload or its pixel count is over the configured limit"""
+
+
+class PreparedImage:
+    """A downscaled, re-encoded image ready for upload, with its perceptual hash"""
+    __slots__ = ('data', 'mime_type', 'size', 'original_size', 'original_bytes', 'dhash', 'thumbnail', 'image')
+
+    def __init__(self, data, mime_type, size, original_size, original_bytes, dhash, thumbnail, image):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.original_size = original_size
+        self.original_bytes = original_bytes
+        self.dhash = dhash
+        self.thumbnail = thumbnail
+        self.image = image
+
+    def blob(self):
+        """Inline image part for the Gemini SDK"""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+def decoded_size(base64_image):
+    """Upper bound of the decoded size of a base64 string, without decoding it"""
+    return len(base64_image) * 3 // 4
+
+
+def check_size(base64_image, max_bytes=MAX_IMAGE_BYTES):
+    """Raise ImageTooLarge if the payload would decode to more than max_bytes"""
+    if decoded_size(base64_image) > max_bytes * 1.02 + 1024:
+        # Slack for a data: URL prefix and line breaks; decode_base64 enforces the exact limit
+        raise ImageTooLarge(f"image larger than {max_bytes / (1024 * 1024):.1f} MB")
+
+
+def decode_base64(base64_image, max_bytes=MAX_IMAGE_BYTES):
+    """Decode a (possibly data: URL) base64 string chunk by chunk into a buffer.
+
+    Only one chunk of the ASCII encoding exists at a time, so the peak
+    overhead is the decoded image rather than another copy of the payload.
+    """
+    check_size(base64_image, max_bytes)
+    base64_image = _DATA_URL.sub('', base64_image[:128]) + base64_image[128:]
+    if _WHITESPACE.search(base64_image):
+        base64_image = _WHITESPACE.sub('', base64_image)
+    buffer = io.BytesIO()
+    try:
+        for start in range(0, len(base64_image), _CHUNK):
+            buffer.write(binascii.a2b_base64(base64_image[start:start + _CHUNK].encode('ascii')))
+            if buffer.tell() > max_bytes:
+                raise ImageTooLarge(f"image larger than {max_bytes / (1024 * 1024):.1f} MB")
+    except (binascii.Error, UnicodeEncodeError) as e:
+        raise ValueError(f"invalid base64 image: {e}") from None
+    buffer.seek(0)
+    return buffer
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a (hash_size + 1) x hash_size thumbnail"""
+    pixels = list(image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = value << 1 | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def prepare_image(base64_image, max_bytes=MAX_IMAGE_BYTES, max_side=MAX_IMAGE_SIDE, max_pixels=MAX_IMAGE_PIXELS):
+    """Decode, bound and re-encode an uploaded image (see module docstring)"""
+    buffer = decode_base64(base64_image, max_bytes)
+    original_bytes = buffer.getbuffer().nbytes
+    image = Image.open(buffer)  # reads the header only
+    original_size = image.size
+    if image.width * image.height > max_pixels:
+        raise ImageTooLarge(f"image has {image.width}x{image.height} pixels (max {max_pixels})")
+
+    # JPEG can decode straight to a reduced scale; other formats are resized after loading
+    image.draft('RGB', (max_side, max_side))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.thumbnail((max_side, max_side), Image.BICUBIC, reducing_gap=2.0)
+
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=JPEG_QUALITY)
+    thumbnail = np.asarray(image.convert('L').resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BOX), dtype=np.uint8)
+    return PreparedImage(output.getvalue(), 'image/jpeg', image.size, original_size, original_bytes,
+                         dhash(image), thumbnail, image)
+
+
+def ocr_available():
+    if pytesseract is None:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception:  # binary missing or not runnable
+        return False
+    return True
+
+
+def ocr_text(prepared):
+    """Text in the image according to Tesseract, whitespace-normalised"""
+    return " ".join(pytesseract.image_to_string(prepared.image).split())
+
+
+class ImageDescriptionCache:
+    """LRU cache of image descriptions keyed on the dHash of the image.
+
+    Candidates are entries whose hash is within ``max_distance`` bits (of
+    256). A low-resolution hash cannot tell apart two screenshots of the
+    same window with different text, so a candidate only matches if no
+    pixel of the 64x64 thumbnails differs by more than ``max_pixel_delta``
+    grey levels. Re-uploads of a screenshot that were recompressed or
+    rescaled then reuse the first description. An edited line of text is a
+    miss, and so is a blinking cursor: the cursor block shifts its thumbnail
+    pixel by more than ``max_pixel_delta`` (benchmarks/bench_image.py
+    measures 0 hits for both).
+    """
+
+    def __init__(self, max_entries=256, max_distance=8, max_pixel_delta=12):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.max_pixel_delta = max_pixel_delta
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # dhash -> (thumbnail, description)
+        self._lock = threading.Lock()
+
+    def get(self, prepared):
+        """Description of a cached image matching this PreparedImage, or None"""
+        with self._lock:
+            candidates = sorted(
+                (bin(prepared.dhash ^ other).count('1'), other) for other in self._entries
+            )
+            for distance, key in candidates:
+                if distance > self.max_distance:
+                    break
+                thumbnail, description = self._entries[key]
+                delta = np.abs(thumbnail.astype(np.int16) - prepared.thumbnail).max()
+                if delta <= self.max_pixel_delta:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return description
+            self.misses += 1
+            return None
+
+    def put(self, prepared, description):
+        with self._lock:
+            self._entries[prepared.dhash] = (prepared.thumbnail, description)
+            self._entries.move_to_end(prepared.dhash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+        }
@@ -0,0 +1,245 @@
+"""On-disk search index: memory-mapped CSR arrays, vocabulary/IDF and a columnar document store.
+
+Layout of an index directory (``FORMAT_VERSION`` 2)::
+
+    manifest.json              format version, shapes, vectorizer params, source checksum
+    matrix_{data,indices,indptr}.npy      TF-IDF rows (CSR)
+    postings_{data,indices,indptr}.npy    the same matrix in CSC form (inverted index)
+    vocabulary.json            terms in column order
+    idf.npy                    IDF weight per column
+    doc_*.npy, document_tables.json       documents, column by column (see document_store)
+    document_keys.json         [key, content hash] per row, for incremental updates
+
+Components passed to ``save_index`` (e.g. the hybrid BM25/dense retriever)
+add their own files and a ``components`` entry in the manifest.
+
+Arrays are opened with ``mmap_mode='r'`` so every worker process on a host
+shares the same pages through the OS page cache instead of unpickling a
+private copy. The manifest records the size, mtime and SHA-256 of the JSON
+file the index was built from, which is how a stale index is detected.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from document_store import ColumnarDocuments
+
+FORMAT_VERSION = 2
+MANIFEST = 'manifest.json'
+
+# TfidfVectorizer parameters that affect transform() and are stored in the manifest
+VECTORIZER_PARAMS = [
+    'lowercase', 'strip_accents', 'analyzer', 'token_pattern', 'stop_words', 'ngram_range',
+    'max_df', 'min_df', 'max_features', 'binary', 'norm', 'use_idf', 'smooth_idf', 'sublinear_tf',
+]
+
+
+def index_dir_for(data_file):
+    """Index directory that lives next to a processed data file (data/processed_data.index/)"""
+    return os.path.splitext(os.path.abspath(data_file))[0] + '.index'
+
+
+def document_key(doc):
+    """Stable identity of a document: its URL, or a hash of section and content for course blocks"""
+    if doc.get('url'):
+        return doc['url']
+    digest = hashlib.sha1(f"{doc.get('section', '')}\0{doc['content']}".encode('utf-8')).hexdigest()
+    return f"{doc['type']}:{digest[:16]}"
+
+
+def content_hash(doc):
+    """Hash of the indexed fields, used to detect changed documents"""
+    fields = (doc.get('title', ''), doc.get('section', ''), doc.get('date', ''), doc['content'])
+    return hashlib.sha1('\0'.join(fields).encode('utf-8')).hexdigest()[:16]
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path):
+    stat = os.stat(path)
+    return {
+        'file': os.path.basename(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_checksum(path),
+    }
+
+
+class DocumentStore:
+    """Read-only sequence of documents decoded on access from one contiguous buffer"""
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return json.loads(self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes())
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def save_csr(index_dir, prefix, matrix):
+    np.save(os.path.join(index_dir, f'{prefix}_data.npy'), matrix.data)
+    np.save(os.path.join(index_dir, f'{prefix}_indices.npy'), matrix.indices)
+    np.save(os.path.join(index_dir, f'{prefix}_indptr.npy'), matrix.indptr)
+
+
+def save_documents(index_dir, documents, buffer_file='documents.npy', offsets_file='document_offsets.npy'):
+    """Write JSON-encoded documents as one uint8 buffer plus int64 offsets, for a DocumentStore"""
+    encoded = [json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode('utf-8') for doc in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(doc) for doc in encoded], out=offsets[1:])
+    np.save(os.path.join(index_dir, buffer_file), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(index_dir, offsets_file), offsets)
+
+
+def load_documents(index_dir, buffer_file='documents.npy', offsets_file='document_offsets.npy', mmap_mode='r'):
+    return DocumentStore(
+        np.load(os.path.join(index_dir, buffer_file), mmap_mode=mmap_mode),
+        np.load(os.path.join(index_dir, offsets_file), mmap_mode=mmap_mode),
+    )
+
+
+def _load_arrays(index_dir, prefix, mmap_mode):
+    return tuple(
+        np.load(os.path.join(index_dir, f'{prefix}_{name}.npy'), mmap_mode=mmap_mode)
+        for name in ('data', 'indices', 'indptr')
+    )
+
+
+def load_csr(index_dir, prefix, shape, mmap_mode='r'):
+    return sparse.csr_matrix(_load_arrays(index_dir, prefix, mmap_mode), shape=tuple(shape), copy=False)
+
+
+def load_csc(index_dir, prefix, shape, mmap_mode='r'):
+    return sparse.csc_matrix(_load_arrays(index_dir, prefix, mmap_mode), shape=tuple(shape), copy=False)
+
+
+def save_index(index_dir, vectorizer, matrix, documents, index_version, source_file=None, extra=None,
+               components=None):
+    """Write an index directory atomically (build in a temp dir, then rename over the old one).
+
+    ``extra`` is stored verbatim in the manifest (e.g. incremental update statistics).
+    ``components`` maps a name to an object with a ``save(directory)`` method
+    that writes its own files; the dict it returns is stored in the manifest
+    under ``components[name]``.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    tmp_dir = f'{index_dir}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    save_csr(tmp_dir, 'matrix', matrix)
+    postings = matrix.tocsc()
+    save_csr(tmp_dir, 'postings', postings)
+
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, column in vectorizer.vocabulary_.items():
+        terms[column] = term
+    with open(os.path.join(tmp_dir, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+        json.dump(terms, f, ensure_ascii=False)
+    np.save(os.path.join(tmp_dir, 'idf.npy'), vectorizer.idf_)
+
+    if not isinstance(documents, ColumnarDocuments):
+        documents = ColumnarDocuments.from_dicts(documents)
+    documents.save(tmp_dir)
+    keys = [[document_key(doc), content_hash(doc)] for doc in documents]
+    with open(os.path.join(tmp_dir, 'document_keys.json'), 'w', encoding='utf-8') as f:
+        json.dump(keys, f, ensure_ascii=False)
+
+    params = vectorizer.get_params()
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'index_version': index_version,
+        'created': time.time(),
+        'shape': list(matrix.shape),
+        'vectorizer': {name: params[name] for name in VECTORIZER_PARAMS},
+        'source': source_fingerprint(source_file) if source_file else None,
+        'extra': extra or {},
+        'components': {name: component.save(tmp_dir) for name, component in (components or {}).items()},
+    }
+    with open(os.path.join(tmp_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    old_dir = f'{index_dir}.old-{os.getpid()}'
+    if os.path.exists(index_dir):
+        os.rename(index_dir, old_dir)
+    os.rename(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(index_dir):
+    try:
+        with open(os.path.join(index_dir, MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def is_index_fresh(index_dir, source_file):
+    """True if the index exists, has a supported format and was built from source_file as it is now"""
+    manifest = read_manifest(index_dir)
+    if not manifest or manifest.get('format_version') != FORMAT_VERSION:
+        return False
+    source = manifest.get('source')
+    if not source:
+        return False
+    stat = os.stat(source_file)
+    if stat.st_size != source['size']:
+        return False
+    if stat.st_mtime_ns == source['mtime_ns']:
+        return True
+    # Touched but possibly unchanged (e.g. a fresh checkout): fall back to the checksum
+    return file_checksum(source_file) == source['sha256']
+
+
+def load_index(index_dir, mmap_mode='r'):
+    """Load an index directory; returns (manifest, vectorizer, matrix, postings, documents)"""
+    manifest = read_manifest(index_dir)
+    if not manifest or manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"No supported search index in {index_dir}")
+
+    shape = tuple(manifest['shape'])
+    matrix = load_csr(index_dir, 'matrix', shape, mmap_mode)
+    postings = load_csc(index_dir, 'postings', shape, mmap_mode)
+
+    params = dict(manifest['vectorizer'])
+    params['ngram_range'] = tuple(params['ngram_range'])
+    vectorizer = TfidfVectorizer(**params)
+    with open(os.path.join(index_dir, 'vocabulary.json'), 'r', encoding='utf-8') as f:
+        vectorizer.vocabulary_ = {term: column for column, term in enumerate(json.load(f))}
+    vectorizer.idf_ = np.load(os.path.join(index_dir, 'idf.npy'))
+
+    documents = ColumnarDocuments.load(index_dir, mmap_mode=mmap_mode)
+    return manifest, vectorizer, matrix, postings, documents
+
+
+def load_document_keys(index_dir):
+    """Return {key: (row, content hash)} for a saved index, or None if it has no key file"""
+    try:
+        with open(os.path.join(index_dir, 'document_keys.json'), 'r', encoding='utf-8') as f:
+            return {key: (row, digest) for row, (key, digest) in enumerate(json.load(f))}
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,544 @@
+"""In-process metrics, per-request stage timings and an on-demand sampling profiler.
+
+``Counter``, ``Gauge`` and ``Histogram`` are minimal versions of the
+Prometheus client types: a family has a fixed tuple of label names, and
+``labels(*values)`` returns the child holding one series. An update is one
+dict lookup and an uncontended lock, so instrumentation stays on in
+production. Label values must come from small fixed sets (stage names,
+upstream names, route templates), never from request data. ``render()``
+produces the Prometheus text exposition format for ``GET /metrics``.
+
+The registry is per process. Under ``serve.py`` each worker sets
+``shared`` to a ``SharedMetrics``: it writes a snapshot of its registry to
+a directory shared with the other workers every second, and ``render()``
+merges its own live values with their snapshots, so ``GET /metrics``
+reports the whole server whichever worker answers it. Counters and
+histograms are summed, and those of exited workers are kept; gauges, and
+counters created with ``aggregate='max'``, are the maximum over the
+workers. Other workers' values can be up to a
+second old. ``uvicorn --workers N`` has no such directory: there every
+scrape reports the one worker that answered it.
+
+``stage(name)`` times a block into ``tds_stage_seconds{stage=...}`` and,
+inside a request started with ``start_trace()``, into that request's
+``Trace`` (carried by a ContextVar, so it follows the request into
+executor threads run with ``contextvars.copy_context().run``).
+``MetricsMiddleware`` starts the trace, records request counts and
+latency per route and returns the stages as a ``Server-Timing`` header.
+
+``profiler`` samples the Python stacks of all threads every few
+milliseconds while it is armed for the next N requests, and reports them
+as folded stacks (``frame;frame;frame count``) for flamegraph.pl or
+speedscope. Idle threads are skipped. When disarmed it costs one attribute
+check per request. The profiler is not shared: with several workers it
+samples the worker that received ``POST /admin/profile``, counts only that
+worker's requests, and ``GET /admin/profile`` returns the profile of
+whichever worker answers it (its ``pid`` tells which). Profile with
+``serve.py --workers 1``.
+"""
+import bisect
+import collections
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _ValueChild:
+    """One series of a counter or gauge; its value can also be read from a function at render time"""
+    __slots__ = ('value', 'function', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+    def set_function(self, function):
+        """Report ``function()`` instead of a stored value (for values kept elsewhere, e.g. cache stats)"""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            value = self.function()
+            return float(value) if value is not None else float('nan')
+        return self.value
+
+    def snapshot(self):
+        return self.get()
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return [list(self.counts), self.sum]
+
+
+class _Family:
+    kind = ''
+    aggregate = 'sum'  # how SharedMetrics combines a series across workers: 'sum' or 'max'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, aggregate=None):
+        self.name = name
+        if aggregate is not None:
+            self.aggregate = aggregate
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_text(self, values, extra=()):
+        pairs = [*zip(self.labelnames, values), *extra]
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def snapshot(self):
+        """``[label values, value]`` per series; a histogram's value is ``[bucket counts, sum]``"""
+        return [[list(values), child.snapshot()] for values, child in sorted(self._children.items())]
+
+    def merge(self, snapshots):
+        """One snapshot combining the series of several processes' snapshots"""
+        merged = {}
+        for snapshot in snapshots:
+            for values, value in snapshot:
+                values = tuple(values)
+                merged[values] = value if values not in merged else self._combine(merged[values], value)
+        return [[list(values), value] for values, value in sorted(merged.items())]
+
+    def _combine(self, a, b):
+        if self.aggregate == 'max':
+            return b if a != a else max(a, b)  # a NaN (no value) loses
+        return a + b
+
+    def render(self, snapshot=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in (snapshot if snapshot is not None else self.snapshot()):
+            lines.extend(self._render_child(tuple(values), value))
+        return lines
+
+    def _render_child(self, values, value):
+        return [f"{self.name}{self._label_text(values)} {_format_value(value)}"]
+
+
+class Counter(_Family):
+    """Monotonic count, e.g. ``tds_fallback_answers_total{reason}``.
+
+    Pass ``aggregate='max'`` for a count that every serve.py worker inherits
+    from the master (e.g. index reloads): summing the workers would count it
+    once per worker.
+    """
+    kind = 'counter'
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class Gauge(_Family):
+    """Value that goes up and down, e.g. the number of indexed documents"""
+    kind = 'gauge'
+
+    aggregate = 'max'
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class Histogram(_Family):
+    """Distribution of observed values in cumulative buckets, e.g. latency in seconds"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _combine(self, a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1]]
+
+    def _render_child(self, values, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip((*self.buckets, float('inf')), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self._label_text(values, [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+
+    def register(self, family):
+        if family.name in self.families:
+            raise ValueError(f"Metric {family.name} is already registered")
+        self.families[family.name] = family
+
+    def snapshot(self):
+        return {name: family.snapshot() for name, family in self.families.items()}
+
+    def merge(self, snapshots, gauges=True):
+        """Registry snapshots of several processes combined per family (see ``SharedMetrics``)"""
+        return {
+            name: family.merge([snapshot[name] for snapshot in snapshots if name in snapshot])
+            for name, family in self.families.items() if gauges or family.kind != 'gauge'
+        }
+
+    def render(self, snapshot=None):
+        """All metrics in the Prometheus text format (version 0.0.4), from ``snapshot`` if given"""
+        lines = []
+        for name, family in self.families.items():
+            lines.extend(family.render(snapshot.get(name, []) if snapshot is not None else None))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class SharedMetrics:
+    """The metrics of all serve.py workers, through snapshot files in a shared directory (see module docstring).
+
+    Workers ``start()`` writing ``<pid>.json`` and ``stop()`` with a last
+    write; the master calls ``archive(pid)`` for each exited worker, which
+    folds its counters and histograms into ``exited.json``.
+    """
+    ARCHIVE = 'exited.json'
+
+    def __init__(self, directory, interval=1.0, registry=None):
+        self.directory = directory
+        self.interval = interval
+        self.registry = registry if registry is not None else REGISTRY
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, name, data):
+        # Readers only ever see a complete file
+        temp = os.path.join(self.directory, f".{name}.{os.getpid()}.tmp")
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp, os.path.join(self.directory, name))
+
+    def write(self):
+        self._write(f"{os.getpid()}.json", self.registry.snapshot())
+
+    def start(self):
+        self.write()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-snapshot', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+    def archive(self, pid):
+        snapshot = self._read(f"{pid}.json")
+        if snapshot is None:
+            return
+        archive = self._read(self.ARCHIVE) or {'pids': [], 'metrics': {}}
+        # Readers skip the files of archived pids until they are removed; after that the pids can go
+        pids = [p for p in archive['pids'] if os.path.exists(os.path.join(self.directory, f"{p}.json"))]
+        self._write(self.ARCHIVE, {'pids': pids + [pid],
+                                   'metrics': self.registry.merge([archive['metrics'], snapshot], gauges=False)})
+        os.remove(os.path.join(self.directory, f"{pid}.json"))
+
+    def _others(self):
+        """Snapshots of the archive and the other workers, or None if a worker was archived meanwhile"""
+        archive = self._read(self.ARCHIVE) or {'pids': [], 'metrics': {}}
+        skip = {*archive['pids'], os.getpid()}
+        snapshots = [archive['metrics']]
+        for name in os.listdir(self.directory):
+            pid, ext = os.path.splitext(name)
+            if ext != '.json' or not pid.isdigit() or int(pid) in skip:
+                continue
+            snapshot = self._read(name)
+            if snapshot is None:
+                return None
+            snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        snapshots = None
+        for _ in range(5):
+            snapshots = self._others()
+            if snapshots is not None:
+                break
+        return self.registry.render(self.registry.merge([*(snapshots or []), self.registry.snapshot()]))
+
+
+shared = None  # a SharedMetrics in serve.py workers
+
+
+def render():
+    return shared.render() if shared is not None else REGISTRY.render()
+
+
+stage_seconds = Histogram('tds_stage_seconds', "Time spent in each request stage", ['stage'])
+http_requests = Counter('tds_http_requests_total', "HTTP requests by route and status", ['route', 'status'])
+http_request_seconds = Histogram(
+    'tds_http_request_seconds', "HTTP request latency by route, up to the response headers", ['route']
+)
+
+
+class Trace:
+    """Stage timings of one request"""
+    __slots__ = ('spans', 'start')
+
+    def __init__(self):
+        self.spans = []
+        self.start = time.perf_counter()
+
+    def server_timing(self):
+        """Value of a Server-Timing header: time per stage (summed over repeats) plus the total so far"""
+        totals, counts = {}, collections.Counter()
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+            counts[name] += 1
+        entries = [
+            f"{name};dur={seconds * 1000:.1f}" + (f';desc="x{counts[name]}"' if counts[name] > 1 else '')
+            for name, seconds in totals.items()
+        ]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ', '.join(entries)
+
+
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+def start_trace():
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+class stage:
+    """Time a block as request stage ``name``: ``with stage("retrieve"): ...``"""
+    __slots__ = ('name', 'start')  # a class rather than @contextmanager: half the overhead
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        stage_seconds.labels(self.name).observe(seconds)
+        trace = _trace.get()
+        if trace is not None:
+            trace.spans.append((self.name, seconds))
+
+
+class SamplingProfiler:
+    """Statistical profiler over all threads, armed for a number of requests (see module docstring)"""
+
+    IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py', 'thread.py')  # innermost frame of a waiting thread
+
+    def __init__(self):
+        self.remaining = 0
+        self.interval = 0.005
+        self.samples = 0
+        self.stacks = collections.Counter()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, requests, interval=0.005):
+        """Start sampling until ``requests`` more requests have finished; discards the previous profile"""
+        self.stop()
+        with self._lock:
+            self.stacks = collections.Counter()
+            self.samples = 0
+            self.interval = interval
+            self.remaining = requests
+            self.started_at = time.time()
+            self.finished_at = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.remaining = 0
+
+    def request_finished(self):
+        if not self.remaining:
+            return
+        with self._lock:
+            self.remaining -= 1
+            done = self.remaining <= 0
+        if done:
+            self._stop.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or os.path.basename(frame.f_code.co_filename) in self.IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                with self._lock:
+                    self.stacks[';'.join(reversed(stack))] += 1
+                    self.samples += 1
+        self.finished_at = time.time()
+
+    def folded(self):
+        """Sampled stacks in folded format, most frequent first"""
+        with self._lock:
+            return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'running': self.running,
+            'remaining_requests': max(self.remaining, 0),
+            'interval': self.interval,
+            'samples': self.samples,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+profiler = SamplingProfiler()
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request trace, request count and latency per route, Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        trace = start_trace()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                route = scope.get('route')
+                http_request_seconds.labels(route.path if route is not None else 'unmatched').observe(
+                    time.perf_counter() - trace.start
+                )
+                message['headers'] = [*message.get('headers', []),
+                                      (b'server-timing', trace.server_timing().encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get('route')
+            http_requests.labels(route.path if route is not None else 'unmatched', str(status)).inc()
+            profiler.request_finished()
@@ -0,0 +1,68 @@
+import hashlib
+import re
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+_BITS = np.arange(64, dtype=np.uint64)
+
+
+def normalise_text(text):
+    """Lowercased word tokens joined by single spaces"""
+    return " ".join(_TOKEN.findall(text.lower()))
+
+
+def simhash(text, shingle=1):
+    """64-bit SimHash over word shingles (single words by default); near-identical texts differ in only a few bits"""
+    tokens = _TOKEN.findall(text.lower())
+    if len(tokens) >= shingle:
+        features = [" ".join(tokens[i:i + shingle]) for i in range(len(tokens) - shingle + 1)]
+    else:
+        features = [" ".join(tokens)]
+    values = np.array(
+        [int.from_bytes(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest(), 'big') for f in features],
+        dtype=np.uint64
+    )
+    ones = ((values[:, None] >> _BITS) & np.uint64(1)).sum(axis=0)
+    return sum(1 << int(bit) for bit in np.flatnonzero(2 * ones > len(values)))
+
+
+class NearDuplicateIndex:
+    """Detects exact and near-duplicate texts in roughly constant time per text.
+
+    Exact duplicates are caught by a hash of the normalised text. Near
+    duplicates use SimHash with banded locality-sensitive lookup: the 64-bit
+    fingerprint is split into ``bands`` 16-bit bands and only texts sharing a
+    band are compared, which finds every pair within ``max_distance`` bits as
+    long as ``max_distance < bands``.
+    """
+
+    def __init__(self, max_distance=3, bands=4):
+        self.max_distance = max_distance
+        self.bands = bands
+        self.band_bits = 64 // bands
+        self._exact = set()
+        self._buckets = {}
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [(band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def add(self, text):
+        """Record text; return True if it is new, False if it duplicates an earlier text"""
+        normalised = normalise_text(text)
+        digest = hashlib.blake2b(normalised.encode('utf-8'), digest_size=16).digest()
+        if digest in self._exact:
+            return False
+
+        fingerprint = simhash(normalised)
+        keys = self._band_keys(fingerprint)
+        for key in keys:
+            for other in self._buckets.get(key, ()):
+                if bin(fingerprint ^ other).count('1') <= self.max_distance:
+                    return False
+
+        self._exact.add(digest)
+        for key in keys:
+            self._buckets.setdefault(key, []).append(fingerprint)
+        return True
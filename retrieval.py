@@ -0,0 +1,282 @@
+import bisect
+from collections.abc import Mapping
+
+import numpy as np
+from scipy import sparse
+
+
+class _Segment:
+    """One immutable block of index rows with its inverted index and documents"""
+    __slots__ = ('matrix', 'postings', 'documents', 'offset')
+
+    def __init__(self, matrix, documents, offset, postings=None):
+        self.matrix = sparse.csr_matrix(matrix)
+        # A prebuilt (e.g. memory-mapped) CSC copy can be passed in to avoid rebuilding it
+        self.postings = postings if postings is not None else self.matrix.tocsc()
+        self.documents = documents
+        self.offset = offset
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def _query(self, terms, weights):
+        return sparse.csr_matrix((weights, terms, [0, len(terms)]), shape=(1, self.matrix.shape[1]))
+
+    def score(self, terms, weights, allowed=None):
+        """Candidate row ids (offset applied) and scores; ``allowed`` optionally masks this segment's rows"""
+        indptr = self.postings.indptr
+        starts, ends = indptr[terms], indptr[terms + 1]
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Common terms: a dense scan is cheaper than merging long posting lists
+        dense_scan = total > len(self) // 4
+        if allowed is not None:
+            # A selective filter: slicing out and scoring just the allowed rows (about twice their
+            # entries) touches less than either the dense scan or the posting lists
+            count = np.count_nonzero(allowed)
+            if 2 * count * self.matrix.nnz < (self.matrix.nnz if dense_scan else total) * len(self):
+                rows = np.flatnonzero(allowed)
+                scores = np.asarray((self.matrix[rows] @ self._query(terms, weights).T).todense()).ravel()
+                nonzero = np.flatnonzero(scores)
+                return rows[nonzero] + self.offset, scores[nonzero]
+
+        if dense_scan:
+            scores = np.asarray((self.matrix @ self._query(terms, weights).T).todense()).ravel()
+            doc_ids = np.flatnonzero(scores)
+            scores = scores[doc_ids]
+        else:
+            positions = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends) if e > s])
+            contributions = self.postings.data[positions] * np.repeat(weights, lengths)
+            doc_ids, inverse = np.unique(self.postings.indices[positions], return_inverse=True)
+            scores = np.bincount(inverse, weights=contributions)
+        if allowed is not None:
+            keep = np.flatnonzero(allowed[doc_ids])  # take() is faster than boolean indexing on mixed masks
+            doc_ids, scores = doc_ids.take(keep), scores.take(keep)
+        return doc_ids + self.offset, scores
+
+
+class SearchResult(Mapping):
+    """A retrieved document plus its ``similarity`` and ``doc_id``, without copying the document"""
+    __slots__ = ('document', 'similarity', 'doc_id')
+
+    def __init__(self, document, similarity, doc_id):
+        self.document = document
+        self.similarity = similarity
+        self.doc_id = doc_id
+
+    def __getitem__(self, key):
+        if key == 'similarity':
+            return self.similarity
+        if key == 'doc_id':
+            return self.doc_id
+        return self.document[key]
+
+    def get(self, key, default=None):
+        if key == 'similarity':
+            return self.similarity
+        if key == 'doc_id':
+            return self.doc_id
+        return self.document.get(key, default)
+
+    def __iter__(self):
+        yield from (key for key in self.document if key not in ('similarity', 'doc_id'))
+        yield 'similarity'
+        yield 'doc_id'
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _ChainedDocuments:
+    """Read-only sequence over the documents of several segments"""
+
+    def __init__(self, segments):
+        self.segments = segments
+        self.offsets = [segment.offset for segment in segments]
+
+    def __len__(self):
+        last = self.segments[-1]
+        return last.offset + len(last)
+
+    def __getitem__(self, i):
+        segment = self.segments[bisect.bisect_right(self.offsets, i) - 1]
+        return segment.documents[i - segment.offset]
+
+    def __iter__(self):
+        for segment in self.segments:
+            yield from segment.documents
+
+
+class SearchEngine:
+    """Top-k retrieval over L2-normalised sparse TF-IDF rows.
+
+    TfidfVectorizer already L2-normalises every row, so cosine similarity is a
+    plain dot product. Queries are scored through an inverted index (the CSC
+    form of the matrix, where column j lists the documents containing term j),
+    so only documents sharing at least one term with the query are touched.
+    The similarity threshold is applied before selection and the top k are
+    picked with argpartition instead of a full sort.
+
+    Incremental updates (``with_updates``) append rows as a new segment and
+    tombstone deleted rows, returning a new engine; an existing engine is
+    never mutated, so in-flight searches keep a consistent snapshot.
+
+    ``mask`` (a boolean array over all rows, see facets.FacetIndex) restricts
+    a search to the rows it allows; they are filtered before top-k selection,
+    and a selective mask scores only its own rows.
+    """
+
+    # Delta segments beyond this count are merged into one
+    MAX_SEGMENTS = 8
+
+    def __init__(self, matrix, documents, threshold=0.1, postings=None):
+        self.segments = [_Segment(matrix, documents, 0, postings)]
+        self.threshold = threshold
+        self.deleted = None  # boolean mask over all rows, or None when nothing is deleted
+
+    def __len__(self):
+        last = self.segments[-1]
+        return last.offset + len(last)
+
+    @property
+    def live_count(self):
+        return len(self) - (int(self.deleted.sum()) if self.deleted is not None else 0)
+
+    @property
+    def matrix(self):
+        """All rows as one CSR matrix (rows of deleted documents are still present)"""
+        if len(self.segments) == 1:
+            return self.segments[0].matrix
+        return sparse.vstack([segment.matrix for segment in self.segments], format='csr')
+
+    @property
+    def documents(self):
+        if len(self.segments) == 1:
+            return self.segments[0].documents
+        return _ChainedDocuments(self.segments)
+
+    def with_updates(self, matrix, documents, deleted_ids=()):
+        """Return a new engine with rows appended and deleted_ids tombstoned"""
+        engine = SearchEngine.__new__(SearchEngine)
+        engine.threshold = self.threshold
+        segments = list(self.segments)
+        if matrix is not None and matrix.shape[0]:
+            documents = documents if hasattr(documents, '__getitem__') else list(documents)
+            segments.append(_Segment(matrix, documents, len(self)))
+        if len(segments) > self.MAX_SEGMENTS:
+            # Merge the deltas only; the (possibly memory-mapped) base segment is left alone
+            deltas = segments[1:]
+            merged_documents = [doc for segment in deltas for doc in segment.documents]
+            merged = sparse.vstack([segment.matrix for segment in deltas], format='csr')
+            segments = [segments[0], _Segment(merged, merged_documents, deltas[0].offset)]
+        engine.segments = segments
+
+        total = segments[-1].offset + len(segments[-1])
+        deleted = np.zeros(total, dtype=bool)
+        if self.deleted is not None:
+            deleted[:len(self.deleted)] = self.deleted
+        deleted[np.asarray(list(deleted_ids), dtype=np.int64)] = True
+        engine.deleted = deleted if deleted.any() else None
+        return engine
+
+    def compact(self):
+        """Return (matrix, documents) holding only live rows, in order"""
+        if self.deleted is None:
+            return self.matrix, self.documents
+        live = np.flatnonzero(~self.deleted)
+        documents = self.documents
+        return self.matrix[live], [documents[i] for i in live]
+
+    def _allowed(self, mask):
+        """Mask of searchable rows: ``mask`` without the deleted ones (None for all live rows)"""
+        if mask is None:
+            return None
+        if len(mask) != len(self):
+            raise ValueError(f"Row mask has {len(mask)} entries for {len(self)} index rows")
+        return mask if self.deleted is None else mask & ~self.deleted
+
+    def _drop_deleted(self, doc_ids, scores):
+        if self.deleted is None or len(doc_ids) == 0:
+            return doc_ids, scores
+        keep = ~self.deleted[doc_ids]
+        return doc_ids[keep], scores[keep]
+
+    def score(self, query_vector, mask=None):
+        """Return candidate document ids and their similarities for one query row"""
+        query = sparse.csr_matrix(query_vector)
+        terms, weights = query.indices, query.data
+        if len(terms) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        allowed = self._allowed(mask)
+        parts = [
+            segment.score(terms, weights, allowed[segment.offset:segment.offset + len(segment)] if allowed is not None else None)
+            for segment in self.segments
+        ]
+        if len(parts) == 1:
+            doc_ids, scores = parts[0]
+        else:
+            doc_ids, scores = np.concatenate([ids for ids, _ in parts]), np.concatenate([scores for _, scores in parts])
+        # A mask already excludes the deleted rows
+        return self._drop_deleted(doc_ids, scores) if allowed is None else (doc_ids, scores)
+
+    def top_k(self, doc_ids, scores, top_k):
+        """Select the top k (doc_id, score) pairs above the threshold, best first"""
+        keep = scores > self.threshold
+        doc_ids, scores = doc_ids[keep], scores[keep]
+        if len(scores) > top_k:
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+            doc_ids, scores = doc_ids[part], scores[part]
+        order = np.argsort(-scores, kind='stable')
+        return doc_ids[order], scores[order]
+
+    def search_batch(self, query_matrix, top_k=5, mask=None):
+        """Return the top k documents for every row of a query matrix.
+
+        All queries are scored with a single sparse matrix-matrix product per
+        segment; row i of the product holds the similarities for query i.
+        With a ``mask``, the product only covers the allowed rows.
+        """
+        n_queries = query_matrix.shape[0]
+        if top_k <= 0 or len(self) == 0:
+            return [[] for _ in range(n_queries)]
+        allowed = self._allowed(mask)
+        if allowed is None:
+            products = [query_matrix @ segment.matrix.T for segment in self.segments]
+            columns = None
+        else:
+            rows = [np.flatnonzero(allowed[segment.offset:segment.offset + len(segment)]) for segment in self.segments]
+            products = [query_matrix @ segment.matrix[ids].T for segment, ids in zip(self.segments, rows)]
+            columns = np.concatenate([ids + segment.offset for segment, ids in zip(self.segments, rows)])
+        scores = sparse.csr_matrix(products[0] if len(products) == 1 else sparse.hstack(products))
+        results = []
+        for i in range(n_queries):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            if columns is None:
+                doc_ids, row_scores = self._drop_deleted(scores.indices[start:end], scores.data[start:end])
+            else:
+                doc_ids, row_scores = columns[scores.indices[start:end]], scores.data[start:end]
+            results.append(self.results(*self.top_k(doc_ids, row_scores, top_k)))
+        return results
+
+    def search(self, query_vector, top_k=5, mask=None):
+        """Return the top k documents for a query vector as result dicts"""
+        if top_k <= 0 or len(self) == 0:
+            return []
+        doc_ids, scores = self.top_k(*self.score(query_vector, mask), top_k)
+        return self.results(doc_ids, scores)
+
+    def results(self, doc_ids, scores):
+        """Result mappings for selected rows; documents are wrapped, not copied"""
+        # doc_id identifies the row within this index
+        documents = self.documents
+        return [
+            SearchResult(documents[doc_id], float(score), int(doc_id))
+            for doc_id, score in zip(doc_ids, scores)
+        ]
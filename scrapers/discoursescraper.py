@@ -5,7 +5,7 @@ from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
 import time
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 
 # ✅ Connect to running Chrome instance with your IITM session
 options = Options()
@@ -25,9 +25,10 @@ for _ in range(10):
 
 soup = BeautifulSoup(driver.page_source, "html.parser")
 
-# Extract topics
-posts_data = []
+# Extract topics, appending one JSON record per line as each is found
 topics = soup.select("tr.topic-list-item")
+saved = 0
+out = open("tds_discourse_posts.jsonl", "w", encoding="utf-8")
 
 for topic in topics:
     title_tag = topic.select_one("a.title")
@@ -44,16 +45,15 @@ for topic in topics:
     date_str = date_tag["datetime"]
     date = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
 
-    if datetime(2025, 1, 1) <= date <= datetime(2025, 4, 14):
-        posts_data.append({
+    if datetime(2025, 1, 1, tzinfo=timezone.utc) <= date <= datetime(2025, 4, 14, tzinfo=timezone.utc):
+        out.write(json.dumps({
             "title": title,
             "url": link,
             "date": date.isoformat()
-        })
+        }, ensure_ascii=False) + "\n")
+        out.flush()
+        saved += 1
 
-# Save to JSON
-with open("tds_discourse_posts.json", "w", encoding="utf-8") as f:
-    json.dump(posts_data, f, indent=2)
-
-print(f"✅ Saved {len(posts_data)} Discourse posts")
+out.close()
+print(f"✅ Saved {saved} Discourse posts to tds_discourse_posts.jsonl")
 driver.quit()
@@ -1,108 +1,301 @@
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+import requests
+import random
+import threading
 import time
 import json
+import os
 import argparse
-from datetime import datetime, timedelta
-import re
+from datetime import datetime, timezone
+
+BASE_URL = "https://discourse.onlinedegree.iitm.ac.in"
+POSTS_CHUNK_SIZE = 20  # posts per /t/<id>/posts.json request, as the Discourse web client asks for
+
+class RateLimiter:
+    """Token bucket shared by all worker threads"""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 class TDSDiscourseScraperEnhanced:
-    def __init__(self):
+    """Scrape Discourse topics through its JSON API with a pool of workers.
+
+    Selenium is only used to borrow the logged-in session cookies from a running
+    Chrome instance (started with --remote-debugging-port=9222); topic lists and
+    threads are then fetched over a pooled HTTP session. Requests are rate
+    limited and retried with exponential backoff, and every finished topic is
+    appended to a checkpoint file so an interrupted run resumes where it stopped.
+    """
+    def __init__(self, base_url=BASE_URL, use_browser=True, workers=8, rate_limit=5.0,
+                 max_retries=4, timeout=30, checkpoint_file=None):
+        self.base_url = base_url.rstrip("/")
+        self.workers = workers
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.checkpoint_file = checkpoint_file
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.checkpoint_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept"] = "application/json"
+
+        self.driver = None
+        if use_browser:
+            self.driver = self._connect_browser()
+            self._copy_browser_cookies()
+
+    def _connect_browser(self):
         # Connect to running Chrome instance with IITM session
         options = Options()
         options.add_experimental_option("debuggerAddress", "127.0.0.1:9222")
-        self.driver = webdriver.Chrome(
-            service=Service(ChromeDriverManager().install()), 
+        return webdriver.Chrome(
+            service=Service(ChromeDriverManager().install()),
             options=options
         )
-    
-    def scrape_discourse_posts(self, start_date, end_date, course_code="tds-kb"):
-        """Scrape Discourse posts within date range"""
-        URL = f"https://discourse.onlinedegree.iitm.ac.in/c/courses/{course_code}/34/l/latest"
-        self.driver.get(URL)
-        time.sleep(10)
-        
-        # Scroll to load more posts
-        for _ in range(15):  # Increased scrolling
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
-        
-        soup = BeautifulSoup(self.driver.page_source, "html.parser")
-        posts_data = []
-        topics = soup.select("tr.topic-list-item")
-        
-        for topic in topics:
-            title_tag = topic.select_one("a.title")
-            if not title_tag:
-                continue
-                
-            title = title_tag.text.strip()
-            link = "https://discourse.onlinedegree.iitm.ac.in" + title_tag["href"]
-            date_tag = topic.select_one("td:nth-last-child(1) time")
-            
-            if not date_tag or not date_tag.has_attr("datetime"):
-                continue
-                
-            date_str = date_tag["datetime"]
-            date = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-            
-            if start_date <= date <= end_date:
-                # Scrape individual post content
-                post_content = self.scrape_post_content(link)
-                posts_data.append({
-                    "title": title,
-                    "url": link,
-                    "date": date.isoformat(),
-                    "content": post_content
-                })
-        
-        return posts_data
-    
-    def scrape_post_content(self, url):
-        """Scrape content from individual post"""
+
+    def _copy_browser_cookies(self):
+        """Open the forum once in the browser and reuse its session cookies for HTTP requests"""
+        self.driver.get(self.base_url)
+        WebDriverWait(self.driver, 30).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+        for cookie in self.driver.get_cookies():
+            self.session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+        self.session.headers["User-Agent"] = self.driver.execute_script("return navigator.userAgent")
+
+    def _get_json(self, path, params=None):
+        """GET a Discourse JSON endpoint with rate limiting and retry with backoff"""
+        url = self.base_url + path
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            retry_after = None
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            else:
+                if response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                    return response.json()
+                error = requests.HTTPError(f"HTTP {response.status_code} for {url}", response=response)
+                retry_after = response.headers.get("Retry-After")
+            if attempt == self.max_retries:
+                raise error
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else min(60, 2 ** attempt)
+            time.sleep(delay + random.uniform(0, delay / 2))
+
+    def iter_topics(self, start_date, end_date, course_code="tds-kb", category_id=34):
+        """Yield topic summaries from the category's latest list whose last activity is in range"""
+        page = 0
+        while True:
+            data = self._get_json(f"/c/courses/{course_code}/{category_id}/l/latest.json", params={"page": page})
+            topic_list = data.get("topic_list", {})
+            topics = topic_list.get("topics", [])
+            if not topics:
+                return
+            older = 0
+            for topic in topics:
+                date_str = topic.get("last_posted_at") or topic.get("created_at")
+                if not date_str:
+                    continue
+                date = parse_date(date_str)
+                if start_date <= date <= end_date:
+                    yield topic
+                elif date < start_date and not topic.get("pinned"):
+                    older += 1
+            # The list is ordered by latest activity, so once a whole page is older we are done
+            unpinned = [topic for topic in topics if not topic.get("pinned")]
+            if not topic_list.get("more_topics_url") or (unpinned and older == len(unpinned)):
+                return
+            page += 1
+
+    def fetch_topic(self, topic):
+        """Fetch one topic thread and build its post record"""
+        data = self._get_json(f"/t/{topic['id']}.json")
+        posts = data.get("post_stream", {}).get("posts", [])
+        content_parts = []
+        for post in posts[:5]:  # Get first 5 posts in thread
+            text = BeautifulSoup(post.get("cooked", ""), "html.parser").get_text().strip()
+            if text:
+                content_parts.append(text)
+        # Accepted answer, else the first reply: the draft answer when mining FAQ entries (faq.py)
+        answer = next((post for post in posts if post.get("accepted_answer")), None)
+        if answer is None and topic.get("has_accepted_answer"):
+            # Long threads: the accepted answer can be past the first chunk of posts
+            answer = next((post for post in self.iter_more_posts(topic["id"], data) if post.get("accepted_answer")), None)
+        if answer is None and len(posts) > 1:
+            answer = posts[1]
+
+        date_str = topic.get("last_posted_at") or topic.get("created_at")
+        return {
+            "id": topic["id"],
+            "title": data.get("title") or topic.get("title", ""),
+            "url": f"{self.base_url}/t/{topic.get('slug') or data.get('slug', 'topic')}/{topic['id']}",
+            "date": parse_date(date_str).isoformat(),
+            "content": "\n\n".join(content_parts),
+            # Thread traffic, to rank FAQ candidates
+            "views": topic.get("views", 0),
+            "posts_count": topic.get("posts_count", len(posts)),
+            "like_count": topic.get("like_count", 0),
+            "answer": BeautifulSoup(answer.get("cooked", ""), "html.parser").get_text().strip() if answer else "",
+        }
+
+    def iter_more_posts(self, topic_id, data):
+        """Posts of a thread beyond those in its /t/<id>.json response, fetched in chunks by id"""
+        post_stream = data.get("post_stream", {})
+        loaded = {post["id"] for post in post_stream.get("posts", [])}
+        remaining = [post_id for post_id in post_stream.get("stream", []) if post_id not in loaded]
+        for i in range(0, len(remaining), POSTS_CHUNK_SIZE):
+            page = self._get_json(f"/t/{topic_id}/posts.json", params={"post_ids[]": remaining[i:i + POSTS_CHUNK_SIZE]})
+            yield from page.get("post_stream", {}).get("posts", [])
+
+    def iter_checkpoint(self):
+        """Records already written by a previous (interrupted) run, streamed from the JSONL file"""
+        if self.checkpoint_file and os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # partial last line from a crash
+
+    def _open_checkpoint(self):
+        """Open the checkpoint for appending, after the partial last line a crash may have left"""
+        last = b"\n"
+        if os.path.exists(self.checkpoint_file) and os.path.getsize(self.checkpoint_file):
+            with open(self.checkpoint_file, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                last = f.read(1)
+        out = open(self.checkpoint_file, "a", encoding="utf-8")
+        if last != b"\n":
+            out.write("\n")
+        return out
+
+    def iter_new_posts(self, start_date, end_date, course_code="tds-kb", category_id=34):
+        """Scrape topics not yet in the checkpoint, appending each record to it as soon as it is fetched.
+
+        Only topic ids are kept in memory; at most ``2 * workers`` fetches are in
+        flight, so memory stays flat however many topics there are.
+        """
+        start_date, end_date = as_utc(start_date), as_utc(end_date)
+        done = {record["id"] for record in self.iter_checkpoint()}
+        if done:
+            print(f"↩️ Resuming: {len(done)} topics already in {self.checkpoint_file}")
+
+        topics = (
+            topic for topic in self.iter_topics(start_date, end_date, course_code, category_id)
+            if topic["id"] not in done
+        )
+        out = self._open_checkpoint() if self.checkpoint_file else None
         try:
-            self.driver.get(url)
-            time.sleep(3)
-            soup = BeautifulSoup(self.driver.page_source, "html.parser")
-            
-            # Extract main post content
-            posts = soup.select(".topic-post")
-            content_parts = []
-            
-            for post in posts[:5]:  # Get first 5 posts in thread
-                post_body = post.select_one(".cooked")
-                if post_body:
-                    content_parts.append(post_body.get_text().strip())
-            
-            return "\n\n".join(content_parts)
-        except Exception as e:
-            print(f"Error scraping {url}: {e}")
-            return ""
-    
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                in_flight = {}
+                while True:
+                    for topic in topics:
+                        in_flight[executor.submit(self.fetch_topic, topic)] = topic
+                        if len(in_flight) >= 2 * self.workers:
+                            break
+                    if not in_flight:
+                        break
+                    future = next(as_completed(in_flight))
+                    topic = in_flight.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        print(f"Error scraping topic {topic['id']}: {e}")
+                        continue
+                    if out:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        out.flush()
+                    yield record
+        finally:
+            if out:
+                out.close()
+
+    def scrape_discourse_posts(self, start_date, end_date, course_code="tds-kb", category_id=34):
+        """Scrape Discourse posts within date range (including any already in the checkpoint)"""
+        previous = list(self.iter_checkpoint())
+        return previous + list(self.iter_new_posts(start_date, end_date, course_code, category_id))
+
     def close(self):
-        self.driver.quit()
+        self.session.close()
+        if self.driver:
+            self.driver.quit()
+
+def parse_date(date_str):
+    return datetime.fromisoformat(date_str.replace("Z", "+00:00"))
+
+def as_utc(date):
+    """Treat naive datetimes (e.g. from the CLI) as UTC so they compare with Discourse timestamps"""
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Scrape TDS Discourse posts')
     parser.add_argument('--start-date', required=True, help='Start date (YYYY-MM-DD)')
     parser.add_argument('--end-date', required=True, help='End date (YYYY-MM-DD)')
-    parser.add_argument('--output', default='tds_discourse_posts_enhanced.json', help='Output file')
-    
+    parser.add_argument('--output', default='tds_discourse_posts_enhanced.jsonl', help='Output file (.jsonl is streamed and resumable, .json is written at the end)')
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint file for .json output (default: <output>.checkpoint.jsonl)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent topic fetches')
+    parser.add_argument('--rate', type=float, default=5.0, help='Max requests per second')
+    parser.add_argument('--base-url', default=BASE_URL, help='Discourse base URL')
+    parser.add_argument('--course-code', default='tds-kb')
+    parser.add_argument('--category-id', type=int, default=34)
+    parser.add_argument('--no-browser', action='store_true', help='Do not borrow cookies from Chrome (public or local stub server)')
+
     args = parser.parse_args()
-    
+
     start_date = datetime.fromisoformat(args.start_date)
     end_date = datetime.fromisoformat(args.end_date)
-    
-    scraper = TDSDiscourseScraperEnhanced()
+
+    streaming = args.output.endswith(".jsonl")
+    scraper = TDSDiscourseScraperEnhanced(
+        base_url=args.base_url,
+        use_browser=not args.no_browser,
+        workers=args.workers,
+        rate_limit=args.rate,
+        # JSONL output doubles as the checkpoint: records are appended as they are scraped
+        checkpoint_file=args.output if streaming else (args.checkpoint or f"{args.output}.checkpoint.jsonl")
+    )
     try:
-        posts = scraper.scrape_discourse_posts(start_date, end_date)
-        
-        with open(args.output, "w", encoding="utf-8") as f:
-            json.dump(posts, f, indent=2)
-        
-        print(f"✅ Scraped {len(posts)} posts to {args.output}")
+        if streaming:
+            count = sum(1 for _ in scraper.iter_new_posts(start_date, end_date, args.course_code, args.category_id))
+            print(f"✅ Scraped {count} new posts to {args.output}")
+        else:
+            posts = scraper.scrape_discourse_posts(start_date, end_date, args.course_code, args.category_id)
+
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(posts, f, indent=2)
+
+            print(f"✅ Scraped {len(posts)} posts to {args.output}")
     finally:
-        scraper.close()
\ No newline at end of file
+        scraper.close()
@@ -0,0 +1,292 @@
+"""Prefork server: load the search index once, then fork uvicorn workers that share it.
+
+    python serve.py --host 0.0.0.0 --port 8000 --workers 4
+
+The master loads the index (memory-mapped arrays, vectorizer, document
+store) and binds the listening socket, then forks the workers. Workers
+share the loaded index copy-on-write, and the memory-mapped files through
+the page cache, and accept connections from the same socket. The worker
+count defaults to WEB_CONCURRENCY, or to the number of CPUs this process
+may run on.
+
+Signals to the master:
+
+    SIGHUP           reload the index and replace the workers: a new
+                     generation is forked from the reloaded master and the
+                     old workers are stopped gracefully once it accepts
+                     connections, so no request is dropped
+    SIGUSR1          reload the FAQ file in the master and in every worker,
+                     without reloading the index or restarting the workers
+    SIGTERM, SIGINT  graceful shutdown (in-flight requests finish, up to
+                     --graceful-timeout seconds)
+
+The master also watches the data file and index manifest every
+INDEX_WATCH_INTERVAL seconds, and POST /admin/reload on any worker asks the
+master to reload. Each worker watches the FAQ file itself, and POST
+/admin/faq/reload on any worker has the master send SIGUSR1 to the others.
+Workers that die are replaced.
+
+Every worker has its own metrics registry and profiler. The workers share
+their metrics through snapshot files in a temporary directory that the
+master creates (metrics.SharedMetrics), so GET /metrics on any worker
+reports the whole server, including workers that have exited. The
+profiler is not shared: POST /admin/profile samples only the worker that
+receives it, and GET /admin/profile reads whichever worker answers it, so
+profile with --workers 1.
+
+Build the index ahead of time (``python data_processor.py``) so the master
+only has to map it; a stale index is rebuilt in the master before forking.
+"""
+import argparse
+import asyncio
+import gc
+import os
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+
+import uvicorn
+
+import app as tds_app
+import metrics
+
+
+def default_workers():
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.getenv("WEB_CONCURRENCY"))
+    try:
+        return len(os.sched_getaffinity(0))  # respects CPU pinning and container cpusets
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def bind_socket(host, port, backlog=2048):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock, ready_fd, master_pid, log_level, metrics_dir):
+    """Worker body: serve the app on the inherited socket until told to stop"""
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)  # reloads are the master's job
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)  # until the event loop handles it
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    tds_app.answer_cache.after_fork()
+    tds_app.reload_hook = lambda: os.kill(master_pid, signal.SIGHUP)
+    tds_app.faq_reload_hook = lambda: os.kill(master_pid, signal.SIGUSR1)
+    metrics.shared = metrics.SharedMetrics(metrics_dir)
+    metrics.shared.start()
+    server = uvicorn.Server(uvicorn.Config(tds_app.app, log_level=log_level, access_log=False))
+
+    async def main():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, tds_app.try_load_faq)
+        serving = asyncio.ensure_future(server.serve(sockets=[sock]))
+        while not server.started and not serving.done():
+            await asyncio.sleep(0.01)
+        try:
+            if server.started:
+                os.write(ready_fd, b'.')
+            os.close(ready_fd)
+        except OSError:  # the master stopped waiting (or this is a replacement worker)
+            pass
+        await serving
+
+    try:
+        asyncio.run(main())
+    finally:
+        metrics.shared.stop()  # the last counts, which the master keeps once this worker has exited
+
+
+class Master:
+    def __init__(self, sock, workers, graceful_timeout=30.0, log_level="info"):
+        self.sock = sock
+        self.size = workers
+        self.graceful_timeout = graceful_timeout
+        self.log_level = log_level
+        self.workers = set()   # pids of the current generation
+        self.retiring = {}     # pid -> time by which it gets SIGKILL
+        self.pending = []      # signals received, handled by the main loop
+        self.started_at = {}
+        self.metrics = metrics.SharedMetrics(tempfile.mkdtemp(prefix="tds-metrics-"))
+
+    def log(self, message):
+        print(f"[serve {os.getpid()}] {message}", flush=True)
+
+    def spawn(self, ready_r, ready_w):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(ready_r)
+                run_worker(self.sock, ready_w, os.getppid(), self.log_level, self.metrics.directory)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.started_at[pid] = time.monotonic()
+        return pid
+
+    def start_generation(self, timeout=60.0):
+        """Fork a full set of workers; returns their pids and how many are accepting connections"""
+        gc.collect()
+        gc.freeze()  # keep the GC from touching (and so copying) the preloaded objects in workers
+        ready_r, ready_w = os.pipe()
+        pids = {self.spawn(ready_r, ready_w) for _ in range(self.size)}
+        os.close(ready_w)
+        ready, deadline = 0, time.monotonic() + timeout
+        while ready < len(pids):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([ready_r], [], [], remaining)[0]:
+                break
+            data = os.read(ready_r, len(pids))
+            if not data:  # every worker exited or closed its end
+                break
+            ready += len(data)
+        os.close(ready_r)
+        return pids, ready
+
+    def retire(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.kill(pid, signal.SIGTERM)
+            self.retiring[pid] = deadline
+
+    @staticmethod
+    def kill(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        """Collect exited workers, replacing those of the current generation"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.pop(pid, None)
+            started = self.started_at.pop(pid, time.monotonic())
+            try:
+                self.metrics.archive(pid)
+            except OSError as e:
+                self.log(f"could not keep the metrics of worker {pid}: {e}")
+            if pid in self.workers:
+                self.workers.discard(pid)
+                self.log(f"worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+                if time.monotonic() - started < 1.0:
+                    time.sleep(1.0)  # do not fork in a tight loop if workers die on startup
+                ready_r, ready_w = os.pipe()
+                self.workers.add(self.spawn(ready_r, ready_w))
+                os.close(ready_r)
+                os.close(ready_w)
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                self.log(f"worker {pid} did not stop within {self.graceful_timeout}s, killing it")
+                self.kill(pid, signal.SIGKILL)
+                self.retiring[pid] = float('inf')
+
+    def reload(self):
+        start = time.perf_counter()
+        try:
+            gc.unfreeze()
+            tds_app.preload_index()
+        except Exception as e:
+            self.log(f"reload failed, keeping the current workers: {e}")
+            return
+        old = self.workers
+        self.workers, ready = self.start_generation()
+        if ready < len(self.workers):
+            self.log(f"only {ready}/{len(self.workers)} new workers started, keeping the current workers")
+            self.retire(self.workers)
+            self.workers = old
+            return
+        self.retire(old)
+        self.log(f"reloaded index version {tds_app.processor.index_version} "
+                 f"in {time.perf_counter() - start:.2f}s, {ready} new workers")
+
+    def stop(self):
+        self.retire(self.workers)
+        self.workers = set()
+        while self.retiring:
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.05)
+        self.sock.close()
+        shutil.rmtree(self.metrics.directory, ignore_errors=True)
+
+    def reload_faq(self):
+        """Reload the FAQ in the master, for workers forked later, and in the current workers"""
+        tds_app.try_load_faq()
+        for pid in self.workers:
+            self.kill(pid, signal.SIGUSR1)
+        self.log(f"reloaded {len(tds_app.faq_store)} FAQ entries in {len(self.workers)} workers")
+
+    def run(self, watch_interval):
+        for signum in (signal.SIGHUP, signal.SIGUSR1, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self.pending.append(signum))
+
+        self.workers, ready = self.start_generation()
+        self.log(f"{ready}/{self.size} workers listening on {self.sock.getsockname()[:2]}, "
+                 f"index version {tds_app.processor.index_version}")
+        next_check = time.monotonic() + watch_interval
+        while True:
+            time.sleep(0.2)
+            # Checked before reaping: on Ctrl-C the workers get SIGINT too and must not be replaced
+            if signal.SIGTERM in self.pending or signal.SIGINT in self.pending:
+                self.log("shutting down")
+                self.stop()
+                return
+            self.reap()
+            self.kill_overdue()
+            reload = signal.SIGHUP in self.pending
+            reload_faq = signal.SIGUSR1 in self.pending
+            self.pending.clear()
+            if reload_faq and not reload:  # a reload loads the FAQ too
+                self.reload_faq()
+            if watch_interval > 0 and time.monotonic() >= next_check:
+                next_check = time.monotonic() + watch_interval
+                reload = reload or tds_app.index_signature() != tds_app.index_state['signature']
+            if reload:
+                self.reload()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from prefork workers sharing one loaded index")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        tds_app.preload_index()
+    except Exception as e:
+        # Same as a single process: serve with an empty index and pick it up on reload
+        print(f"⚠️ Error loading data: {e}", file=sys.stderr)
+    else:
+        print(f"✅ Loaded processed data and search index in {time.perf_counter() - start:.2f}s")
+    sock = bind_socket(args.host, args.port)
+    Master(sock, max(1, args.workers), args.graceful_timeout, args.log_level).run(tds_app.INDEX_WATCH_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
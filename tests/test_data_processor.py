@@ -0,0 +1,27 @@
+"""Incremental updates of a saved index with data_processor.update_processed_data."""
+import json
+import shutil
+
+from conftest import ROOT
+from data_processor import TDSDataProcessor, update_processed_data
+
+
+def test_update_summary_counts_every_change(tmp_path):
+    data_file = tmp_path / "processed_data.json"
+    shutil.copy(f"{ROOT}/data/processed_data.json", data_file)
+    existing = json.loads(data_file.read_text(encoding="utf-8"))["discourse_data"]
+    replaced, unchanged, deleted = existing[0], existing[1], [existing[2]["url"], existing[3]["url"]]
+    posts = [
+        {"title": "New post", "content": "How do I submit project 2 after the deadline has passed?",
+         "url": "https://discourse.onlinedegree.iitm.ac.in/t/new-post/999999", "date": "2025-04-12"},
+        dict(replaced, content=replaced["content"] + " Edited: the answer changed."),
+        unchanged,
+    ]
+    posts_file = tmp_path / "posts.json"
+    posts_file.write_text(json.dumps(posts), encoding="utf-8")
+
+    summary = update_processed_data(TDSDataProcessor(), str(data_file), str(posts_file), deleted)
+
+    assert {name: summary[name] for name in ("added", "replaced", "deleted", "unchanged")} == \
+        {"added": 1, "replaced": 1, "deleted": 2, "unchanged": 1}
+    assert summary["documents"] == 3 and summary["refit"] is False
@@ -0,0 +1,159 @@
+"""The Discourse scraper against a local stub server replaying recorded JSON (tests/fixtures/discourse)."""
+import json
+import os
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from conftest import FIXTURES
+from enhanced_scraper import TDSDiscourseScraperEnhanced
+
+LATEST = "/c/courses/tds-kb/34/l/latest.json"
+START, END = datetime(2025, 1, 1), datetime(2025, 4, 14)
+
+
+class DiscourseStub:
+    """Serves fixture files by path; ``failures[path]`` responses are answered with ``failure_status`` first"""
+
+    def __init__(self):
+        self.requests = []
+        self.failures = {}
+        self.failure_status = 429
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                stub.requests.append(url.path)
+                if stub.failures.get(url.path, 0) > 0:
+                    stub.failures[url.path] -= 1
+                    self.send_response(stub.failure_status)
+                    self.send_header("Retry-After", "0")
+                    self.end_headers()
+                    return
+                path = stub.fixture_path(url.path, parse_qs(url.query))
+                if path is None:
+                    self.send_error(404)
+                    return
+                with open(path, "rb") as f:
+                    body = f.read()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def fixture_path(path, query):
+        if path == LATEST:
+            page = int(query.get("page", ["0"])[0])
+            name = "latest.json" if page == 0 else f"latest_{page}.json"
+        else:
+            name = path.lstrip("/")
+        full = os.path.join(FIXTURES, "discourse", name)
+        return full if os.path.isfile(full) else None
+
+    def topic_requests(self, topic_id):
+        return self.requests.count(f"/t/{topic_id}.json")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    stub = DiscourseStub()
+    yield stub
+    stub.close()
+
+
+def make_scraper(stub, checkpoint, **kwargs):
+    return TDSDiscourseScraperEnhanced(base_url=stub.base_url, use_browser=False, workers=2, rate_limit=0,
+                                       checkpoint_file=str(checkpoint), **kwargs)
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_scrapes_topics_in_range(stub, tmp_path):
+    scraper = make_scraper(stub, tmp_path / "posts.jsonl")
+    records = {record["id"]: record for record in scraper.iter_new_posts(START, END)}
+
+    # 100 is pinned and old, 99 (on page 1) is older than the range
+    assert sorted(records) == [101, 102, 103]
+    assert stub.requests.count(LATEST) == 2
+
+    ga5 = records[101]
+    assert ga5["url"] == f"{stub.base_url}/t/ga5-question-8-clarification/101"
+    assert ga5["date"] == "2025-04-10T09:30:00+00:00"
+    assert "gpt-3.5-turbo-0125" in ga5["content"]
+    assert (ga5["views"], ga5["posts_count"], ga5["like_count"]) == (412, 3, 7)
+    assert ga5["answer"].startswith("Use gpt-3.5-turbo-0125")  # no accepted answer: the first reply
+
+    # The accepted answer of the long thread is fetched from posts.json
+    assert stub.requests.count("/t/103/posts.json") == 1
+    assert "pd.read_html" in records[103]["answer"]
+    assert stub.requests.count("/t/102/posts.json") == 0
+
+
+def test_checkpoint_resume(stub, tmp_path):
+    checkpoint = tmp_path / "posts.jsonl"
+    first = make_scraper(stub, checkpoint)
+    record = first.fetch_topic({"id": 102, "slug": "docker-desktop-vs-podman-for-project-2",
+                                "last_posted_at": "2025-03-01T14:45:10.000Z"})
+    # An interrupted run: one finished record and a partly written line
+    checkpoint.write_text(json.dumps(record) + "\n" + '{"id": 101, "title": "GA5 Qu\u00e9', encoding="utf-8")
+    stub.requests.clear()
+
+    resumed = make_scraper(stub, checkpoint)
+    new = [record["id"] for record in resumed.iter_new_posts(START, END)]
+
+    assert sorted(new) == [101, 103]
+    assert stub.topic_requests(102) == 0
+    assert sorted(record["id"] for record in resumed.iter_checkpoint()) == [101, 102, 103]
+
+    # Nothing left to do: no topic is fetched again
+    stub.requests.clear()
+    again = make_scraper(stub, checkpoint)
+    assert list(again.iter_new_posts(START, END)) == []
+    assert not [path for path in stub.requests if path.startswith("/t/")]
+    assert len(again.scrape_discourse_posts(START, END)) == 3
+
+
+def test_retries_after_429(stub, tmp_path):
+    stub.failures[LATEST] = 1
+    stub.failures["/t/101.json"] = 2
+    scraper = make_scraper(stub, tmp_path / "posts.jsonl", max_retries=2)
+
+    records = list(scraper.iter_new_posts(START, END))
+
+    assert sorted(record["id"] for record in records) == [101, 102, 103]
+    assert stub.topic_requests(101) == 3
+    assert sorted(record["id"] for record in read_jsonl(tmp_path / "posts.jsonl")) == [101, 102, 103]
+
+
+def test_gives_up_on_a_topic_after_max_retries(stub, tmp_path, capsys):
+    stub.failures["/t/102.json"] = 10
+    stub.failure_status = 503
+    scraper = make_scraper(stub, tmp_path / "posts.jsonl", max_retries=1)
+
+    records = list(scraper.iter_new_posts(START, END))
+
+    # The failed topic is skipped and not checkpointed, so the next run retries it
+    assert sorted(record["id"] for record in records) == [101, 103]
+    assert stub.topic_requests(102) == 2
+    assert "Error scraping topic 102" in capsys.readouterr().out
+    assert 102 not in {record["id"] for record in read_jsonl(tmp_path / "posts.jsonl")}
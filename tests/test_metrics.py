@@ -0,0 +1,115 @@
+"""Metrics of several serve.py workers merged through metrics.SharedMetrics."""
+import json
+import os
+
+import metrics
+
+
+def make_registry():
+    registry = metrics.Registry()
+    families = (
+        metrics.Counter('requests_total', "Requests", ['route'], registry=registry),
+        metrics.Gauge('documents', "Documents", registry=registry),
+        metrics.Histogram('seconds', "Latency", buckets=(0.1, 1.0), registry=registry),
+    )
+    return registry, families
+
+
+def worker_snapshot(requests, documents, latencies):
+    """The registry snapshot of another worker"""
+    registry, (counter, gauge, histogram) = make_registry()
+    counter.labels('/api/').inc(requests)
+    gauge.set(documents)
+    for seconds in latencies:
+        histogram.observe(seconds)
+    return registry.snapshot()
+
+
+def write(directory, pid, snapshot):
+    with open(os.path.join(directory, f"{pid}.json"), 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+
+
+def test_render_merges_the_workers(tmp_path):
+    registry, (counter, gauge, histogram) = make_registry()
+    shared = metrics.SharedMetrics(str(tmp_path), registry=registry)
+    counter.labels('/api/').inc(2)
+    counter.labels('/health').inc()
+    gauge.set(10)
+    histogram.observe(0.05)
+    write(tmp_path, 999001, worker_snapshot(3, 12, [0.5, 5.0]))
+
+    lines = shared.render().splitlines()
+
+    assert 'requests_total{route="/api/"} 5' in lines
+    assert 'requests_total{route="/health"} 1' in lines
+    assert 'documents 12' in lines  # gauges: the maximum
+    assert 'seconds_bucket{le="0.1"} 1' in lines
+    assert 'seconds_bucket{le="1"} 2' in lines
+    assert 'seconds_bucket{le="+Inf"} 3' in lines
+    assert 'seconds_sum 5.55' in lines
+
+
+def test_exited_workers_keep_their_counts(tmp_path):
+    registry, (counter, gauge, _) = make_registry()
+    shared = metrics.SharedMetrics(str(tmp_path), registry=registry)
+    counter.labels('/api/').inc(2)
+    gauge.set(1)
+    write(tmp_path, 999001, worker_snapshot(3, 50, []))
+    write(tmp_path, 999002, worker_snapshot(4, 60, []))
+
+    shared.archive(999001)
+    shared.archive(999002)
+    shared.archive(999003)  # no snapshot: nothing to keep
+
+    assert sorted(os.listdir(tmp_path)) == ['exited.json']
+    lines = shared.render().splitlines()
+    assert 'requests_total{route="/api/"} 9' in lines
+    assert 'documents 1' in lines  # the gauges of exited workers are dropped
+
+
+def test_worker_writes_its_snapshot(tmp_path):
+    registry, (counter, _, _) = make_registry()
+    shared = metrics.SharedMetrics(str(tmp_path), interval=60, registry=registry)
+    shared.start()
+    counter.labels('/api/').inc(7)
+    shared.stop()
+
+    with open(tmp_path / f"{os.getpid()}.json", encoding='utf-8') as f:
+        assert json.load(f)['requests_total'] == [[['/api/'], 7.0]]
+
+
+def fork_workers(shared, count, requests):
+    """Fork ``count`` workers that each count ``requests`` requests, write their snapshot and exit; returns their pids"""
+    pids = []
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                shared.registry.families['requests_total'].labels('/api/').inc(requests)
+                shared.write()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return pids
+
+
+def test_inherited_counts_are_not_summed_over_forked_workers(tmp_path):
+    registry, (counter, _, _) = make_registry()
+    state = {'reloads': 1}
+    metrics.Counter('reloads_total', "Index loads", registry=registry, aggregate='max').set_function(
+        lambda: state['reloads']
+    )
+    shared = metrics.SharedMetrics(str(tmp_path), registry=registry)
+
+    # Like serve.py: a generation of workers, a reload in the master, then a new generation
+    for pid in fork_workers(shared, 4, 2):
+        shared.archive(pid)
+    state['reloads'] += 1
+    fork_workers(shared, 4, 3)
+
+    lines = shared.render().splitlines()
+    assert 'reloads_total 2' in lines
+    assert 'requests_total{route="/api/"} 20' in lines
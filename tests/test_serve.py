@@ -0,0 +1,85 @@
+"""serve.py with several workers: POST /admin/faq/reload reloads the FAQ everywhere, without an index reload."""
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from conftest import ROOT
+
+TOKEN = "test-token"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server(tmp_path):
+    data_file, faq_file = tmp_path / "processed_data.json", tmp_path / "faq.json"
+    shutil.copy(os.path.join(ROOT, "data", "processed_data.json"), data_file)
+    shutil.copy(os.path.join(ROOT, "data", "faq.json"), faq_file)
+    port = free_port()
+    env = dict(os.environ, DATA_FILE=str(data_file), FAQ_FILE=str(faq_file), ADMIN_TOKEN=TOKEN,
+               INDEX_WATCH_INTERVAL="0", OPENAI_API_KEY="")
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "serve.py"), "--host", "127.0.0.1",
+                                "--port", str(port), "--workers", "3", "--log-level", "warning"],
+                               cwd=tmp_path, env=env, stdout=subprocess.DEVNULL)
+    client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=10)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            client.get("/health").raise_for_status()
+            break
+        except httpx.TransportError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                pytest.fail("serve.py did not start")
+            time.sleep(0.2)
+    yield client, faq_file
+    client.close()
+    process.send_signal(signal.SIGTERM)
+    process.wait(30)
+
+
+def worker_state(client, requests=40):
+    """Worker pids and FAQ entry counts seen over a number of connections (each may reach another worker)"""
+    pids, entries = set(), set()
+    for _ in range(requests):
+        with httpx.Client(base_url=client.base_url, timeout=10) as fresh:
+            pids.add(fresh.get("/admin/profile", headers={"X-Admin-Token": TOKEN}).json()["pid"])
+            entries.add(fresh.get("/cache/stats").json()["faq"]["entries"])
+    return pids, entries
+
+
+def reloads(client):
+    for line in client.get("/metrics").text.splitlines():
+        if line.startswith("tds_index_reloads_total "):
+            return float(line.split()[1])
+
+
+def test_faq_reload_reaches_every_worker_without_restarting_them(server):
+    client, faq_file = server
+    pids, entries = worker_state(client)
+    assert entries == {1}
+
+    faq = json.loads(faq_file.read_text(encoding="utf-8"))
+    faq.append({"id": "late-submission", "questions": ["Can I submit GA3 after the deadline?"],
+                "answer": "No, late submissions are not accepted.", "links": []})
+    faq_file.write_text(json.dumps(faq), encoding="utf-8")
+    response = client.post("/admin/faq/reload", headers={"X-Admin-Token": TOKEN})
+    assert response.json()["status"] == "reloaded" and response.json()["entries"] == 2
+    time.sleep(1.0)
+
+    new_pids, entries = worker_state(client)
+    assert entries == {2}
+    assert new_pids <= pids  # the same workers: none was restarted
+    assert reloads(client) == 1
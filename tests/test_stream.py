@@ -0,0 +1,107 @@
+"""/api/stream against the fake OpenAI server of benchmarks/fake_upstreams.py."""
+import json
+import os
+import shutil
+import socket
+
+import httpx
+import pytest
+
+from conftest import ROOT
+from upstream import upstream_errors
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def servers(tmp_path_factory):
+    """The app and two fake OpenAI servers, one dropping the stream after three tokens.
+
+    The app's settings and globals are patched for this module only, and its
+    index is built under a temporary directory.
+    """
+    data_file = tmp_path_factory.mktemp("stream") / "processed_data.json"
+    shutil.copy(os.path.join(ROOT, "data", "processed_data.json"), data_file)
+    upstream_port, failing_port, app_port = free_port(), free_port(), free_port()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("OPENAI_API_KEY", "fake")
+        monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{upstream_port}/v1")
+        import app as tds_app
+        from answer_cache import AnswerCache
+        from fake_upstreams import fake_openai, serve
+
+        # Restored on exit, after preload_index below has replaced them
+        for name in ("processor", "faq_store", "faq_signature"):
+            monkeypatch.setattr(tds_app, name, getattr(tds_app, name))
+        monkeypatch.setattr(tds_app, "index_state", dict(tds_app.index_state))
+        monkeypatch.setattr(tds_app, "DATA_FILE", str(data_file))
+        monkeypatch.setattr(tds_app, "INDEX_WATCH_INTERVAL", 0)
+        monkeypatch.setattr(tds_app, "answer_cache", AnswerCache(max_entries=0))
+        monkeypatch.setattr(tds_app, "virtual_ta", tds_app.TDSVirtualTA())  # clients for the fake server
+        tds_app.preload_index()
+
+        started = [
+            serve(fake_openai(first_token=0.05, token_delay=0.005), upstream_port),
+            serve(fake_openai(first_token=0.05, token_delay=0.005, fail_after=3), failing_port),
+            serve(tds_app.app, app_port),
+        ]
+        yield tds_app, f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{failing_port}/v1"
+        for server in started:
+            server.should_exit = True
+
+
+def stream_events(base_url, question):
+    events, event = [], None
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        with client.stream("POST", "/api/stream", json={"question": question}) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+QUESTION = "Which model should I use for the GA5 question 8?"
+
+
+def test_links_then_tokens_then_done(servers):
+    tds_app, base_url, _ = servers
+    from fake_upstreams import ANSWER
+
+    events = stream_events(base_url, QUESTION)
+    names = [event for event, _ in events]
+
+    assert names[0] == "links" and events[0][1]
+    assert names[-1] == "done" and set(names[1:-1]) == {"token"}
+    answer = "".join(data["text"] for event, data in events if event == "token")
+    assert answer == ANSWER == events[-1][1]["answer"]
+    assert not events[-1][1].get("fallback")
+    assert tds_app.upstream_semaphore._value == tds_app.UPSTREAM_CONCURRENCY
+
+
+def test_mid_stream_failure_resets_to_the_fallback(servers, monkeypatch):
+    tds_app, base_url, failing_url = servers
+    from openai import AsyncOpenAI
+
+    failures = upstream_errors.labels("openai_stream", "error")
+    before = failures.value
+    monkeypatch.setattr(tds_app.virtual_ta, "async_openai_client",
+                        AsyncOpenAI(api_key="fake", base_url=failing_url, max_retries=0))
+
+    events = stream_events(base_url, QUESTION)
+    names = [event for event, _ in events]
+
+    reset = names.index("reset")
+    assert names[0] == "links"
+    assert names[1:reset] == ["token"] * 3  # sent before the upstream dropped the connection
+    fallback = "".join(data["text"] for event, data in events[reset + 1:] if event == "token")
+    assert names[-1] == "done" and events[-1][1]["fallback"]
+    assert fallback == events[-1][1]["answer"]
+    assert failures.value == before + 1
+    assert tds_app.upstream_semaphore._value == tds_app.UPSTREAM_CONCURRENCY
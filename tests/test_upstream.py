@@ -0,0 +1,237 @@
+"""Upstream retries, circuit breaker and hedging, against the fake OpenAI server of benchmarks/fake_upstreams.py."""
+import asyncio
+import random
+import socket
+
+import openai
+import pytest
+
+from fake_upstreams import ANSWER, Faults, fake_openai, serve
+from upstream import CircuitBreaker, CircuitOpen, Upstream, hedged, hedged_calls
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def openai_servers():
+    """Base URLs of fake OpenAI servers by behaviour; each app counts its requests in ``state.requests``"""
+    apps = {
+        "ok": fake_openai(first_token=0.01, token_delay=0),
+        "503": fake_openai(faults=Faults(error_rate=1.0)),
+        "400": fake_openai(faults=Faults(error_rate=1.0, error_status=400)),
+    }
+    urls, servers = {}, []
+    for name, app in apps.items():
+        port = free_port()
+        servers.append(serve(app, port))
+        urls[name] = (f"http://127.0.0.1:{port}/v1", app)
+    yield urls
+    for server in servers:
+        server.should_exit = True
+
+
+def completion(base_url, clock=None, step=0.0):
+    """Coroutine function asking the server at ``base_url`` for an answer; each call advances ``clock`` by ``step``"""
+    client = openai.AsyncOpenAI(api_key="fake", base_url=base_url, max_retries=0)
+
+    async def complete():
+        if clock is not None:
+            clock.now += step
+        response = await client.chat.completions.create(model="fake", messages=[{"role": "user", "content": "hi"}])
+        return response.choices[0].message.content
+
+    return complete
+
+
+def make_upstream(clock, retries=2, deadline=None, failure_threshold=100, reset_timeout=30.0):
+    breaker = CircuitBreaker("test", failure_threshold, reset_timeout, clock=clock)
+    return Upstream("test", None, asyncio.Semaphore(4), timeout=5.0, retries=retries, backoff=0.01,
+                    deadline=deadline, breaker=breaker, clock=clock, rng=random.Random(0))
+
+
+def test_call_answers(openai_servers):
+    url, _ = openai_servers["ok"]
+    upstream = make_upstream(FakeClock())
+    assert asyncio.run(upstream.call(completion(url))) == ANSWER
+    assert upstream.breaker.state == "closed"
+
+
+def test_retries_stop_at_retries(openai_servers):
+    url, app = openai_servers["503"]
+    upstream = make_upstream(FakeClock(), retries=2)
+    before = app.state.requests
+
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(upstream.call(completion(url)))
+
+    assert app.state.requests - before == 3
+
+
+def test_retries_stop_at_deadline(openai_servers):
+    url, app = openai_servers["503"]
+    clock = FakeClock()
+    upstream = make_upstream(clock, retries=10, deadline=1.0)
+    before = app.state.requests
+
+    # Each attempt takes 0.4s of the 1s deadline, so no retry starts after the second attempt
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(upstream.call(completion(url, clock, step=0.4)))
+
+    assert app.state.requests - before == 3
+    assert clock.now == pytest.approx(1001.2)
+
+
+def test_client_error_is_not_retried(openai_servers):
+    url, app = openai_servers["400"]
+    upstream = make_upstream(FakeClock(), retries=2, failure_threshold=1)
+    before = app.state.requests
+
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(upstream.call(completion(url)))
+
+    assert app.state.requests - before == 1
+    assert upstream.breaker.state == "closed"  # a bad request says nothing about the provider
+
+
+def test_breaker_opens_and_closes_after_a_trial(openai_servers):
+    failing, failing_app = openai_servers["503"]
+    ok, _ = openai_servers["ok"]
+    clock = FakeClock()
+    upstream = make_upstream(clock, retries=0, failure_threshold=2, reset_timeout=10.0)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(openai.InternalServerError):
+                await upstream.call(completion(failing))
+        assert upstream.breaker.state == "open"
+        before = failing_app.state.requests
+        with pytest.raises(CircuitOpen):
+            await upstream.call(completion(failing))
+        assert failing_app.state.requests == before  # skipped without a request
+
+        clock.now += 10.0
+        assert upstream.breaker.state == "half_open"
+        release = asyncio.Event()
+
+        async def slow_trial():
+            await release.wait()
+            return await completion(ok)()
+
+        trial = asyncio.ensure_future(upstream.call(slow_trial))
+        await asyncio.sleep(0)
+        # Only one trial call at a time
+        with pytest.raises(CircuitOpen):
+            await upstream.call(completion(ok))
+        release.set()
+        assert await trial == ANSWER
+        assert upstream.breaker.state == "closed"
+        assert await upstream.call(completion(ok)) == ANSWER
+
+    asyncio.run(scenario())
+
+
+def test_breaker_reopens_after_a_failed_trial(openai_servers):
+    failing, _ = openai_servers["503"]
+    clock = FakeClock()
+    upstream = make_upstream(clock, retries=0, failure_threshold=1, reset_timeout=10.0)
+
+    async def scenario():
+        with pytest.raises(openai.InternalServerError):
+            await upstream.call(completion(failing))
+        clock.now += 10.0
+        assert upstream.breaker.state == "half_open"
+        with pytest.raises(openai.InternalServerError):
+            await upstream.call(completion(failing))
+        assert upstream.breaker.state == "open"
+        clock.now += 9.0
+        with pytest.raises(CircuitOpen):
+            await upstream.call(completion(failing))
+        clock.now += 1.0
+        assert upstream.breaker.state == "half_open"
+
+    asyncio.run(scenario())
+
+
+def calls(delay=0.0, error=None, result=None):
+    """Coroutine function sleeping ``delay`` then raising ``error`` or returning ``result``;
+    ``state`` records whether it started and was cancelled"""
+    state = {"started": False, "cancelled": False}
+
+    async def call():
+        state["started"] = True
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+        if error is not None:
+            raise error
+        return result
+
+    return call, state
+
+
+def hedged_count(trigger, winner):
+    return hedged_calls.labels(trigger, winner).value
+
+
+def test_hedged_primary_in_time():
+    primary, _ = calls(0.01, result="primary")
+    secondary, secondary_state = calls(result="secondary")
+    assert asyncio.run(hedged(("a", primary), ("b", secondary), 1.0)) == ("a", "primary")
+    assert not secondary_state["started"]
+
+
+def test_hedged_when_the_primary_is_slow():
+    primary, primary_state = calls(5.0, result="primary")
+    secondary, _ = calls(0.01, result="secondary")
+    before = hedged_count("slow", "b")
+
+    assert asyncio.run(hedged(("a", primary), ("b", secondary), 0.05)) == ("b", "secondary")
+
+    assert primary_state["cancelled"]
+    assert hedged_count("slow", "b") == before + 1
+
+
+def test_hedged_when_the_primary_fails():
+    primary, _ = calls(error=ValueError("primary"))
+    secondary, secondary_state = calls(0.01, result="secondary")
+    before = hedged_count("failed", "b")
+
+    # No delay: the secondary only starts because the primary failed
+    assert asyncio.run(hedged(("a", primary), ("b", secondary))) == ("b", "secondary")
+
+    assert secondary_state["started"]
+    assert hedged_count("failed", "b") == before + 1
+
+
+def test_hedged_slow_primary_wins_and_cancels_the_secondary():
+    primary, _ = calls(0.1, result="primary")
+    secondary, secondary_state = calls(5.0, result="secondary")
+
+    assert asyncio.run(hedged(("a", primary), ("b", secondary), 0.01)) == ("a", "primary")
+
+    assert secondary_state["cancelled"]
+
+
+def test_hedged_raises_the_primary_error_when_both_fail():
+    primary, _ = calls(0.05, error=ValueError("primary"))
+    secondary, _ = calls(error=KeyError("secondary"))
+    before = hedged_count("slow", "none")
+
+    with pytest.raises(ValueError, match="primary"):
+        asyncio.run(hedged(("a", primary), ("b", secondary), 0.01))
+
+    assert hedged_count("slow", "none") == before + 1
@@ -0,0 +1,273 @@
+"""Calls to upstream providers (OpenAI, Gemini, OCR) that fail fast instead of hanging.
+
+- ``timeouts`` and ``async_http_client`` build the httpx configuration
+  handed to the OpenAI SDK: one pooled client per process with
+  explicit connect, read, write and pool timeouts, so a stalled connection
+  raises instead of holding a request for the SDK's 10 minute default.
+- ``Upstream.call`` awaits an async SDK call, or runs a blocking one on the
+  upstream thread pool, bounded by a shared semaphore and a per-attempt
+  timeout. Transient failures (timeouts, connection errors, 429 and 5xx) are
+  retried with full-jitter exponential backoff while the call's deadline
+  allows. Prefer async calls: a cancelled or timed-out async call closes its
+  connection, while a blocking one keeps its thread until the HTTP read
+  timeout fires.
+- ``Upstream.stream`` is the streaming counterpart: it holds a semaphore
+  slot for the whole stream, bounds the wait for each item, and records the
+  outcome with the breaker. It does not retry, since items may already have
+  been passed on to the client.
+- ``CircuitBreaker`` opens after ``failure_threshold`` consecutive transient
+  failures. While it is open, calls raise ``CircuitOpen`` at once and the app
+  answers with its fallback. After ``reset_timeout`` one trial call is let
+  through (half-open), and its outcome closes or reopens the circuit.
+- ``hedged`` starts a second provider when the first has not answered within
+  a delay (e.g. its recent p95 latency from ``Upstream.hedge_delay``) or as
+  soon as it fails, and returns whichever answer arrives first.
+"""
+import asyncio
+import collections
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+import metrics
+
+upstream_seconds = metrics.Histogram('tds_upstream_seconds', "Latency of upstream call attempts", ['upstream'])
+upstream_errors = metrics.Counter(
+    'tds_upstream_errors_total', "Failed upstream call attempts by reason: timeout, error or circuit_open",
+    ['upstream', 'reason']
+)
+upstream_retries = metrics.Counter('tds_upstream_retries_total', "Upstream call attempts after the first", ['upstream'])
+circuit_open = metrics.Gauge('tds_upstream_circuit_open', "1 while a provider's circuit breaker is open", ['provider'])
+hedged_calls = metrics.Counter(
+    'tds_upstream_hedged_total', "Calls that started a second provider, by trigger (slow or failed) and winner",
+    ['trigger', 'winner']
+)
+
+
+class CircuitOpen(Exception):
+    """The provider failed repeatedly and is being skipped"""
+
+
+def timeouts(connect, read):
+    """httpx timeouts: ``connect`` for connection setup, ``read`` between bytes of the response"""
+    return httpx.Timeout(read, connect=connect, pool=connect)
+
+
+def _limits(max_connections):
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=60)
+
+
+def async_http_client(timeout, max_connections):
+    """Pooled client to pass as the async OpenAI SDK's ``http_client``"""
+    return httpx.AsyncClient(timeout=timeout, limits=_limits(max_connections))
+
+
+def is_timeout(error):
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException, openai.APITimeoutError))
+
+
+def is_transient(error):
+    """Whether a failure says nothing about the request itself, so a retry may succeed"""
+    if is_timeout(error) or isinstance(error, (ConnectionError, httpx.TransportError, openai.APIConnectionError)):
+        return True
+    # openai.APIStatusError has status_code; google.api_core exceptions have the HTTP status as code
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(error, 'code', None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one provider (see module docstring)"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None  # start of the half-open trial call in flight
+        self._lock = threading.Lock()
+        circuit_open.labels(name).set_function(lambda: 1 if self.state == 'open' else 0)
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if self.clock() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self):
+        """Whether a call may go ahead; in the half-open state only one trial call at a time may"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'open':
+                return False
+            # A trial whose outcome was never recorded (e.g. a cancelled hedge) expires like the open state
+            now = self.clock()
+            if self._trial_at is None or now - self._trial_at >= self.reset_timeout:
+                self._trial_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()  # open, or reopen after a failed trial
+            self._trial_at = None
+
+
+class LatencyWindow:
+    """Latencies of the last ``size`` successful calls, for hedging delays"""
+
+    def __init__(self, size=200, min_samples=20):
+        self.samples = collections.deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        """The q-quantile of the window, or None until there are min_samples latencies"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Upstream:
+    """One provider endpoint: calls with a timeout, retries and a circuit breaker"""
+
+    def __init__(self, name, executor, semaphore, timeout, retries=2, backoff=0.2, backoff_cap=2.0,
+                 deadline=None, breaker=None, clock=time.monotonic, rng=random):
+        self.name = name
+        self.executor = executor
+        self.semaphore = semaphore
+        self.timeout = timeout            # seconds per attempt, not counting the wait for a semaphore slot
+        self.retries = retries
+        self.backoff = backoff            # first retry waits up to this long, doubling per retry
+        self.backoff_cap = backoff_cap
+        self.deadline = deadline if deadline is not None else timeout * (retries + 1)  # no retry starts after it
+        self.breaker = breaker or CircuitBreaker(name)
+        self.latencies = LatencyWindow()
+        self.clock = clock                # for the deadline; tests pass fakes for it and for the backoff rng
+        self.rng = rng
+
+    async def call(self, func, *args):
+        """Result of ``func(*args)`` (a coroutine function or a blocking function); raises
+        CircuitOpen, or the last error once retries are used up"""
+        if not self.breaker.allow():
+            upstream_errors.labels(self.name, 'circuit_open').inc()
+            raise CircuitOpen(f"{self.name} is failing, circuit breaker open")
+        loop = asyncio.get_running_loop()
+        is_async = asyncio.iscoroutinefunction(func)
+        started = self.clock()
+        attempt = 0
+        while True:
+            # The timeout covers the call itself, not the wait for a free slot, so
+            # queued calls (e.g. from a large batch) are not timed out before they start
+            async with self.semaphore:
+                start = time.perf_counter()
+                try:
+                    pending = func(*args) if is_async else loop.run_in_executor(self.executor, func, *args)
+                    result = await asyncio.wait_for(pending, self.timeout)
+                except Exception as e:
+                    upstream_errors.labels(self.name, 'timeout' if is_timeout(e) else 'error').inc()
+                    error = e
+                else:
+                    seconds = time.perf_counter() - start
+                    upstream_seconds.labels(self.name).observe(seconds)
+                    self.latencies.observe(seconds)
+                    self.breaker.record_success()
+                    return result
+            if not is_transient(error):
+                raise error
+            self.breaker.record_failure()
+            delay = self.rng.uniform(0, min(self.backoff_cap, self.backoff * 2 ** attempt))
+            if (attempt >= self.retries or self.clock() - started + delay >= self.deadline
+                    or not self.breaker.allow()):
+                raise error
+            upstream_retries.labels(self.name).inc()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def stream(self, func, *args):
+        """Async generator over the items of ``func(*args)`` (an async iterable); raises CircuitOpen,
+        or the error of the first failed item. ``timeout`` bounds the wait for every item, the
+        first one included, so a stalled stream fails instead of hanging."""
+        if not self.breaker.allow():
+            upstream_errors.labels(self.name, 'circuit_open').inc()
+            raise CircuitOpen(f"{self.name} is failing, circuit breaker open")
+        async with self.semaphore:
+            start = time.perf_counter()
+            items = func(*args).__aiter__()
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(items.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    yield item
+            except Exception as e:
+                upstream_errors.labels(self.name, 'timeout' if is_timeout(e) else 'error').inc()
+                if is_transient(e):
+                    self.breaker.record_failure()
+                raise
+            finally:
+                if hasattr(items, 'aclose'):
+                    await items.aclose()  # e.g. the client went away mid-stream: close the connection
+        seconds = time.perf_counter() - start
+        upstream_seconds.labels(self.name).observe(seconds)
+        self.latencies.observe(seconds)
+        self.breaker.record_success()
+
+    def hedge_delay(self, quantile=0.95, default=2.0, minimum=0.05):
+        """Seconds to wait before hedging: the recent ``quantile`` latency, or ``default`` before enough calls"""
+        latency = self.latencies.quantile(quantile)
+        return max(minimum, latency if latency is not None else default)
+
+
+async def hedged(primary, secondary, delay=None):
+    """(name, result) of the first of two providers to succeed.
+
+    ``primary`` and ``secondary`` are ``(name, coroutine function)`` pairs.
+    The secondary starts once the primary fails, or once ``delay`` seconds
+    pass without an answer (None: only on failure). The slower call is
+    cancelled. If both fail, the primary's error is raised.
+    """
+    (primary_name, primary_call), (secondary_name, secondary_call) = primary, secondary
+    names = {}
+    first = asyncio.ensure_future(primary_call())
+    names[first] = primary_name
+    pending = {first}
+    try:
+        await asyncio.wait(pending, timeout=delay)
+        if first.done() and not first.cancelled() and first.exception() is None:
+            return primary_name, first.result()
+        trigger = 'failed' if first.done() else 'slow'
+        second = asyncio.ensure_future(secondary_call())
+        names[second] = secondary_name
+        pending = {second} if first.done() else {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    hedged_calls.labels(trigger, names[task]).inc()
+                    return names[task], task.result()
+        hedged_calls.labels(trigger, 'none').inc()
+        raise first.exception()
+    finally:
+        for task in pending:
+            task.cancel()